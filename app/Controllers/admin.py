@@ -1,23 +1,47 @@
-from typing import Annotated
+import asyncio
+import json
+from pathlib import Path
+from typing import Annotated, Any, Callable, Coroutine
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, params
+from fastapi import APIRouter, Depends, HTTPException, params, Request, UploadFile, Response
+from fastapi.routing import APIRoute
 from loguru import logger
 
 from app.Models.admin_api_model import ImageOptUpdateModel
+from app.Models.api_response.admin_api_response import ServerStatsApiResponse, DuplicateClustersApiResponse, \
+    IngestionJobApiResponse, IngestionJobListApiResponse
 from app.Models.api_response.base import NekoProtocol
-from app.Services import db_context
+from app.Services import db_context, inference_scheduler, result_cache, ingestion_service, image_variant_cache, \
+    storage_service, transformers_service, ocr_service, text_presence_classifier
 from app.Services.authentication import force_admin_token_verify
+from app.Services.duplicate_detection import PerceptualHashIndex
+from app.Services.ingestion import IngestionService, IngestionItem, IngestionError
+from app.Services.ocr_services import DisabledOCRService
+from app.Services.storage import static_key
 from app.Services.vector_db_context import PointNotFoundError
 from app.config import config
-from app.util import directories
 
 admin_router = APIRouter(dependencies=[Depends(force_admin_token_verify)], tags=["Admin"])
 
+MAX_INGESTION_URLS = 100000
+# Far longer than any sensible URL, and keeps a body without newlines from piling up in memory
+MAX_INGESTION_URL_LINE_BYTES = 8 * 1024
+
+
+def get_ingestion_service() -> IngestionService:
+    if ingestion_service is None:
+        raise HTTPException(400, "The ingestion API is not enabled.")
+    if not config.static_file.enable:
+        raise HTTPException(400, "The ingestion API needs static files to be enabled.")
+    if not transformers_service.has_vision_tower:
+        raise HTTPException(400, "The ingestion API needs the CLIP vision model, which this server doesn't load.")
+    return ingestion_service
+
 
 @admin_router.delete("/delete/{image_id}",
                      description="Delete image with the given id from database. "
-                                 "If the image is a local image, it will be moved to `/static/_deleted` folder.")
+                                 "If the image is a stored image, it will be moved to the `_deleted` folder of the storage.")
 async def delete_image(
         image_id: Annotated[UUID, params.Path(description="The id of the image you want to delete.")]) -> NekoProtocol:
     try:
@@ -28,25 +52,20 @@ async def delete_image(
     await db_context.deleteItems([str(point.id)])
     logger.success("Image {} deleted from database.", point.id)
 
-    if point.url.startswith('/') and config.static_file.enable:  # local image
-        image_files = list(directories.static_dir.glob(f"{point.id}.*"))
-        assert len(image_files) <= 1
-
-        if len(image_files) == 0:
-            logger.warning("Image {} is a local image but not found in static folder.", point.id)
+    key = static_key(point.url)
+    if key is not None:  # stored image
+        if await storage_service.exists(key):
+            await storage_service.move(key, f"_deleted/{Path(key).name}")
+            logger.success("Stored image {} removed.", key)
         else:
-            directories.deleted_dir.mkdir(parents=True, exist_ok=True)
-
-            image_files[0].rename(directories.deleted_dir / image_files[0].name)
-            logger.success("Local image {} removed.", image_files[0].name)
+            logger.warning("Image {} is a stored image but not found in storage.", point.id)
 
-        if point.thumbnail_url is not None:
-            thumbnail_file = directories.thumbnails_dir / f"{point.id}.webp"
-            if thumbnail_file.is_file():
-                thumbnail_file.unlink()
-                logger.success("Thumbnail {} removed.", thumbnail_file.name)
+        if point.thumbnail_url is not None and (thumbnail_key := static_key(point.thumbnail_url)) is not None:
+            if await storage_service.exists(thumbnail_key):
+                await storage_service.delete(thumbnail_key)
+                logger.success("Thumbnail {} removed.", thumbnail_key)
             else:
-                logger.warning("Thumbnail {} not found.", thumbnail_file.name)
+                logger.warning("Thumbnail {} not found.", thumbnail_key)
 
     return NekoProtocol(message="Image deleted.")
 
@@ -66,5 +85,145 @@ async def update_image(image_id: Annotated[UUID, params.Path(description="The id
 
     await db_context.updatePayload(point)
     logger.success("Image {} updated.", point.id)
+    # Cached results may have been filtered on the old value
+    if result_cache is not None:
+        result_cache.clear()
 
     return NekoProtocol(message="Image updated.")
+
+
+@admin_router.get("/stats", description="Get runtime statistics of the server, such as inference batching histograms.")
+async def server_stats() -> ServerStatsApiResponse:
+    return ServerStatsApiResponse(message="Successfully get server statistics.",
+                                  inference=inference_scheduler.get_stats(),
+                                  embedding_cache=inference_scheduler.get_cache_stats(),
+                                  result_cache=result_cache.get_stats() if result_cache is not None else None,
+                                  image_cache=image_variant_cache.get_stats() if image_variant_cache is not None
+                                  else None,
+                                  ocr=None if isinstance(ocr_service, DisabledOCRService) else ocr_service.get_stats(),
+                                  text_presence=text_presence_classifier.get_stats()
+                                  if text_presence_classifier is not None else None)
+
+
+@admin_router.get("/duplicates", description="List clusters of near-duplicate images, based on their perceptual hash.")
+async def list_duplicates(
+        threshold: Annotated[int, params.Query(ge=0, le=32,
+                                               description="The maximum number of differing bits (out of 64) between "
+                                                           "the perceptual hashes of two near-duplicate images.")]
+        = config.indexing.near_duplicate_threshold) -> DuplicateClustersApiResponse:
+    index = await PerceptualHashIndex.from_database(db_context)
+    clusters = await asyncio.to_thread(index.clusters, threshold)
+    return DuplicateClustersApiResponse(message=f"Successfully found {len(clusters)} duplicate clusters.",
+                                        hashed_count=len(index), clusters=clusters)
+
+
+class UploadSizeLimitedRoute(APIRoute):
+    """
+    Rejects requests by their Content-Length before FastAPI parses the multipart body, which spools every uploaded
+    file to a temporary file first. Requests without a Content-Length are only limited per file, once spooled.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request) -> Response:
+            content_length = request.headers.get("content-length", "")
+            max_size = config.ingestion.max_upload_size_mb * 1024 * 1024
+            if content_length.isdigit() and int(content_length) > max_size:
+                raise HTTPException(413, f"Uploads can't be larger than {config.ingestion.max_upload_size_mb} MB "
+                                         f"in total.")
+            return await handler(request)
+
+        return limited_handler
+
+
+async def ingest_upload(
+        service: Annotated[IngestionService, Depends(get_ingestion_service)],
+        files: Annotated[list[UploadFile], params.File(description="The images you want to add.")],
+        starred: Annotated[bool, params.Query(description="Whether the images are starred.")] = False
+) -> IngestionJobApiResponse:
+    items = []
+    try:
+        for file in files:
+            try:
+                items.append(await service.spool_upload(file.filename or "upload", file.file, starred))
+            except IngestionError as e:
+                raise HTTPException(413, f"{file.filename}: {e}") from e
+    except BaseException:
+        # Spooled files are only removed by their job
+        for item in items:
+            item.path.unlink(missing_ok=True)
+        raise
+    job = service.submit(items)
+    return IngestionJobApiResponse(message=f"Ingestion job created with {len(items)} images.", job=job.get_status())
+
+
+admin_router.add_api_route("/ingest/upload", ingest_upload, methods=["POST"],
+                           description="Upload images to add to the database. The images are processed in the "
+                                       "background, use the returned job id to follow the progress.",
+                           route_class_override=UploadSizeLimitedRoute)
+
+
+def _parse_ingestion_url(line: bytes, line_number: int) -> IngestionItem:
+    try:
+        entry = json.loads(line)
+    except ValueError as e:
+        raise HTTPException(400, f"Line {line_number} is not valid JSON.") from e
+    if isinstance(entry, str):
+        entry = {"url": entry}
+    if not isinstance(entry, dict) or not isinstance(entry.get("url"), str) \
+            or not entry["url"].startswith(("http://", "https://")):
+        raise HTTPException(400, f"Line {line_number} must be a http(s) URL or an object with an url field.")
+    return IngestionItem(source=entry["url"], starred=bool(entry.get("starred", False)))
+
+
+@admin_router.post("/ingest/urls",
+                   description="Add images from a list of URLs, sent as NDJSON: one JSON string, or one "
+                               "{\"url\": ..., \"starred\": ...} object per line. The images are downloaded and "
+                               "processed in the background, use the returned job id to follow the progress.")
+async def ingest_urls(service: Annotated[IngestionService, Depends(get_ingestion_service)],
+                      request: Request) -> IngestionJobApiResponse:
+    items = []
+    buffer = b""
+    line_number = 0
+    # Parse the body as it arrives, it may be a long list
+    async for chunk in request.stream():
+        # Only the new chunk is split, the incomplete last line is carried over to the next one
+        *lines, rest = chunk.split(b"\n")
+        if lines:
+            lines[0] = buffer + lines[0]
+            buffer = rest
+        else:
+            buffer += rest
+        if any(len(t) > MAX_INGESTION_URL_LINE_BYTES for t in [buffer, *lines]):
+            raise HTTPException(413, f"Lines can't be longer than {MAX_INGESTION_URL_LINE_BYTES} bytes.")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                items.append(_parse_ingestion_url(line, line_number))
+        if len(items) > MAX_INGESTION_URLS:
+            raise HTTPException(413, f"A job can't have more than {MAX_INGESTION_URLS} URLs.")
+    if buffer.strip():
+        items.append(_parse_ingestion_url(buffer, line_number + 1))
+    if not items:
+        raise HTTPException(422, "No URL provided.")
+    job = service.submit(items)
+    return IngestionJobApiResponse(message=f"Ingestion job created with {len(items)} URLs.", job=job.get_status())
+
+
+@admin_router.get("/ingest/jobs", description="List the recent ingestion jobs.")
+async def list_ingestion_jobs(
+        service: Annotated[IngestionService, Depends(get_ingestion_service)]) -> IngestionJobListApiResponse:
+    jobs = service.list_jobs()
+    return IngestionJobListApiResponse(message=f"Successfully get {len(jobs)} jobs.",
+                                       jobs=[t.get_status() for t in jobs])
+
+
+@admin_router.get("/ingest/jobs/{job_id}", description="Get the progress of an ingestion job.")
+async def get_ingestion_job(
+        service: Annotated[IngestionService, Depends(get_ingestion_service)],
+        job_id: Annotated[UUID, params.Path(description="The id of the job.")]) -> IngestionJobApiResponse:
+    job = service.get_job(job_id)
+    if job is None:
+        raise HTTPException(404, "Cannot find the job with the given ID.")
+    return IngestionJobApiResponse(message="Successfully get the job.", job=job.get_status())
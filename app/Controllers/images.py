@@ -0,0 +1,151 @@
+import asyncio
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import sha256
+from pathlib import Path
+from typing import Annotated, Literal
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.params import Query, Path as PathParam
+from fastapi.responses import FileResponse, RedirectResponse
+
+from app.Services import image_variant_cache, storage_service
+from app.Services.storage import StoredFileInfo
+from app.config import config
+from app.util.thumbnails import THUMBNAIL_FORMATS, check_thumbnail_format, create_resized_file
+
+images_router = APIRouter(tags=["Images"])
+# Serves /static from a remote storage, by redirecting clients to the files
+static_redirect_router = APIRouter(tags=["Images"])
+
+ORIGINAL_SUFFIXES = ['.jpg', '.png', '.jpeg', '.jfif', '.webp', '.gif', '.bmp', '.avif']
+
+# Variants being generated, so concurrent requests for the same one wait for it instead of generating it again
+_generating: dict[str, asyncio.Future] = {}
+
+
+async def find_original(image_id: UUID) -> tuple[str, StoredFileInfo] | None:
+    # A few stat calls are much cheaper than listing a large storage
+    for suffix in ORIGINAL_SUFFIXES:
+        key = f"{image_id}{suffix}"
+        if (info := await storage_service.stat(key)) is not None:
+            return key, info
+    return None
+
+
+def negotiate_format(accept: str | None) -> str:
+    accept = accept or ""
+    for fmt in ("avif", "webp"):
+        if f"image/{fmt}" in accept:
+            try:
+                check_thumbnail_format(fmt)
+                return fmt
+            except ValueError:
+                continue
+    return "jpeg"
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    if (if_none_match := request.headers.get("if-none-match")) is not None:
+        return etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if (if_modified_since := request.headers.get("if-modified-since")) is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def _resize(source: Path, temporary_path: Path, width: int | None, fmt: str, quality: int):
+    try:
+        await asyncio.to_thread(create_resized_file, source, temporary_path, width, fmt, quality)
+    except OSError as e:
+        # PIL.UnidentifiedImageError included
+        raise HTTPException(415, "The stored image can't be decoded.") from e
+
+
+async def _generate_variant(name: str, key: str, width: int | None, fmt: str, quality: int) -> Path:
+    temporary_path = image_variant_cache.temporary_path(name)
+    source = storage_service.local_path(key)
+    try:
+        if source is not None:
+            await _resize(source, temporary_path, width, fmt, quality)
+        else:
+            source = image_variant_cache.temporary_path(name + ".source")
+            try:
+                await storage_service.download_file(key, source)
+                await _resize(source, temporary_path, width, fmt, quality)
+            finally:
+                source.unlink(missing_ok=True)
+    except BaseException:
+        # The cache doesn't know about the temporary file until it is put in it
+        temporary_path.unlink(missing_ok=True)
+        raise
+    return image_variant_cache.put(name, temporary_path)
+
+
+async def get_variant(name: str, key: str, width: int | None, fmt: str, quality: int) -> Path:
+    if (path := image_variant_cache.get(name)) is not None:
+        return path
+    if name in _generating:
+        return await asyncio.shield(_generating[name])
+    future = asyncio.get_running_loop().create_future()
+    _generating[name] = future
+    try:
+        path = await _generate_variant(name, key, width, fmt, quality)
+        future.set_result(path)
+        return path
+    except BaseException as e:
+        future.set_exception(e)
+        # Waiters get the exception, don't report it as never retrieved
+        future.exception()
+        raise
+    finally:
+        del _generating[name]
+
+
+@images_router.get("/{image_id}",
+                   description="Get a stored image, scaled down to the given width and converted to the given format. "
+                               "If no format is given, the best format accepted by the client is used.")
+async def get_image(
+        request: Request,
+        image_id: Annotated[UUID, PathParam(description="The id of the image.")],
+        width: Annotated[int | None, Query(ge=16, le=config.image_serving.max_width,
+                                           description="The maximum width of the image. Images are never "
+                                                       "scaled up. Leave empty to keep the original size.")] = None,
+        format: Annotated[Literal["webp", "avif", "jpeg"] | None, Query(
+            description="The format of the image.")] = None,
+        quality: Annotated[int, Query(ge=1, le=100, description="The encoding quality.")] = 80) -> FileResponse:
+    original = await find_original(image_id)
+    if original is None:
+        raise HTTPException(404, "Cannot find the image with the given ID.")
+    key, info = original
+    if format is not None:
+        try:
+            check_thumbnail_format(format)
+        except ValueError as e:
+            raise HTTPException(400, str(e)) from e
+    fmt = format or negotiate_format(request.headers.get("accept"))
+    variant = sha256(f"{image_id}:{info.mtime}:{info.size}:{width}:{fmt}:{quality}".encode()).hexdigest()[:32]
+    headers = {
+        "ETag": f'"{variant}"',
+        "Last-Modified": formatdate(info.mtime, usegmt=True),
+        "Cache-Control": f"public, max-age={config.image_serving.cache_max_age}",
+    }
+    if format is None:
+        headers["Vary"] = "Accept"
+    if is_not_modified(request, headers["ETag"], info.mtime):
+        return Response(status_code=304, headers=headers)
+
+    path = await get_variant(variant + THUMBNAIL_FORMATS[fmt][1], key, width, fmt, quality)
+    # FileResponse handles Range requests
+    return FileResponse(path, media_type=f"image/{fmt}", headers=headers)
+
+
+@static_redirect_router.get("/{key:path}", description="Redirect to a URL of the stored file.",
+                            response_class=RedirectResponse, status_code=307)
+async def redirect_to_storage(key: Annotated[str, PathParam(description="The storage key of the file.")]):
+    url = await storage_service.presign_url(key)
+    if url is None:
+        raise HTTPException(404, "File not found.")
+    return RedirectResponse(url, status_code=307)
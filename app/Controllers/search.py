@@ -1,21 +1,36 @@
-from io import BytesIO
-from typing import Annotated, List, Union
+import asyncio
+import secrets
+from hashlib import sha256
+from typing import Annotated, BinaryIO, List, Union, Callable, Awaitable, Hashable
 from uuid import uuid4, UUID
 
-from PIL import Image
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, UploadFile
 from fastapi.params import File, Query, Path, Depends
 from loguru import logger
 
-from app.Models.api_model import AdvancedSearchModel, CombinedSearchModel, SearchBasisEnum, SearchCombinedBasisEnum
-from app.Models.api_response.search_api_response import SearchApiResponse
-from app.Models.query_params import SearchPagingParams, FilterParams
+from app.Models.api_model import AdvancedSearchModel, CombinedSearchModel, SearchBasisEnum, SearchCombinedBasisEnum, \
+    FusionMethodEnum, BatchSearchModel, BatchSearchTypeEnum
+from app.Models.api_response.search_api_response import SearchApiResponse, BatchSearchApiResponse
+from app.Models.query_params import SearchPagingParams, FilterParams, SearchAccuracyParams
 from app.Models.search_result import SearchResult
 from app.Services import db_context
-from app.Services import transformers_service
+from app.Services import inference_scheduler
+from app.Services import result_cache
 from app.Services.authentication import force_access_token_verify
+from app.Services.embedding_cache import normalize_prompt
+from app.Services.reranker import ProductReranker, stack_vectors
+from app.Services.score_fusion import reciprocal_rank_fusion, weighted_score_fusion
+from app.Services.result_cache import CachedQuery
+from app.Services.vector_db_context import PointNotFoundError
 from app.config import config
-from app.util.calculate_vectors_cosine import calculate_vectors_cosine
+from app.util.image_decoding import decode_image_for_clip
+from app.util.search_cursor import SearchCursor
+
+combined_search_reranker = ProductReranker()
+MAX_SEARCH_IMAGE_SIZE = 10 * 1024 * 1024
+# Searches fetch this many pages ahead on a cache miss, up to the configured prefetch_count
+PREFETCH_PAGES = 5
+_HASH_CHUNK_SIZE = 1024 * 1024
 
 searchRouter = APIRouter(dependencies=([Depends(force_access_token_verify)] if config.access_protected else None),
                          tags=["Search"])
@@ -40,41 +55,99 @@ class SearchCombinedParams:
         self.basis = basis
 
 
+class HybridSearchParams:
+    def __init__(self,
+                 fusion: Annotated[FusionMethodEnum, Query(
+                     description="How the vision and OCR results are fused. \"rrf\" only uses their ranks, "
+                                 "\"weighted\" uses their normalized scores.")] = FusionMethodEnum.rrf,
+                 vision_weight: Annotated[float, Query(
+                     ge=0, le=1, description="Weight of the vision results, the OCR results get the rest.")] = 0.5):
+        if not config.ocr_search.enable:
+            raise HTTPException(400, "You used hybrid search, but it needs OCR search which is not enabled.")
+        self.fusion = fusion
+        self.vision_weight = vision_weight
+
+
 @searchRouter.get("/text/{prompt}", description="Search images by text prompt")
 async def textSearch(
         prompt: Annotated[
             str, Path(max_length=100, description="The image prompt text you want to search.")],
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        accuracy: Annotated[SearchAccuracyParams, Depends(SearchAccuracyParams)]
 ) -> SearchApiResponse:
     logger.info("Text search request received, prompt: {}", prompt)
-    text_vector = transformers_service.get_text_vector(prompt) if basis.basis == SearchBasisEnum.vision \
-        else transformers_service.get_bert_vector(prompt)
-    results = await db_context.querySearch(text_vector,
-                                           query_vector_name=db_context.getVectorByBasis(basis.basis),
-                                           filter_param=filter_param,
-                                           top_k=paging.count,
-                                           skip=paging.skip)
-    return SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4())
+
+    async def search(top_k: int, skip: int) -> list[SearchResult]:
+        text_vector = await inference_scheduler.get_text_vector(prompt) if basis.basis == SearchBasisEnum.vision \
+            else await inference_scheduler.get_bert_vector(prompt)
+        return await db_context.querySearch(text_vector,
+                                            query_vector_name=db_context.getVectorByBasis(basis.basis),
+                                            filter_param=filter_param,
+                                            accuracy_param=accuracy,
+                                            top_k=top_k,
+                                            skip=skip)
+
+    signature = ("text", basis.basis, normalize_prompt(prompt), params_signature(filter_param, accuracy))
+    return await cached_search(signature, paging, search)
+
+
+@searchRouter.get("/hybrid/{prompt}",
+                  description="Search images by text prompt, matching both what they show and the text in them. "
+                              "The vision and OCR results are fused into a single ranking.")
+async def hybridSearch(
+        prompt: Annotated[
+            str, Path(max_length=100, description="The image prompt text you want to search.")],
+        hybrid: Annotated[HybridSearchParams, Depends(HybridSearchParams)],
+        filter_param: Annotated[FilterParams, Depends(FilterParams)],
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        accuracy: Annotated[SearchAccuracyParams, Depends(SearchAccuracyParams)]
+) -> SearchApiResponse:
+    logger.info("Hybrid search request received, prompt: {}", prompt)
+
+    async def search(top_k: int, skip: int) -> list[SearchResult]:
+        text_vector, bert_vector = await asyncio.gather(inference_scheduler.get_text_vector(prompt),
+                                                        inference_scheduler.get_bert_vector(prompt))
+        # Each ranking needs its first skip + top_k results for the fused ranking to be right up to there
+        vision_results, ocr_results = await db_context.querySearchBatch(
+            [(db_context.IMG_VECTOR, text_vector), (db_context.TEXT_VECTOR, bert_vector)],
+            top_k=skip + top_k,
+            filter_param=filter_param,
+            accuracy_param=accuracy)
+        fuse = reciprocal_rank_fusion if hybrid.fusion == FusionMethodEnum.rrf else weighted_score_fusion
+        results = fuse([vision_results, ocr_results], [hybrid.vision_weight, 1 - hybrid.vision_weight])
+        return results[skip:skip + top_k]
+
+    signature = ("hybrid", normalize_prompt(prompt), params_signature(filter_param, accuracy, hybrid))
+    return await cached_search(signature, paging, search)
 
 
 @searchRouter.post("/image", description="Search images by image")
 async def imageSearch(
-        image: Annotated[bytes, File(max_length=10 * 1024 * 1024, media_type="image/*",
-                                     description="The image you want to search.")],
+        image: Annotated[UploadFile, File(media_type="image/*", description="The image you want to search.")],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        accuracy: Annotated[SearchAccuracyParams, Depends(SearchAccuracyParams)]
 ) -> SearchApiResponse:
-    fakefile = BytesIO(image)
-    img = Image.open(fakefile)
     logger.info("Image search request received")
-    image_vector = transformers_service.get_image_vector(img)
-    results = await db_context.querySearch(image_vector,
-                                           top_k=paging.count,
-                                           skip=paging.skip,
-                                           filter_param=filter_param)
-    return SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4())
+    if image.size is not None and image.size > MAX_SEARCH_IMAGE_SIZE:
+        raise HTTPException(413, f"The image is larger than {MAX_SEARCH_IMAGE_SIZE // (1024 * 1024)} MB.")
+
+    async def search(top_k: int, skip: int) -> list[SearchResult]:
+        try:
+            img = await asyncio.to_thread(decode_image_for_clip, image.file)
+        except OSError as e:
+            raise HTTPException(400, "The uploaded file is not a valid image.") from e
+        image_vector = await inference_scheduler.get_image_vector(img)
+        return await db_context.querySearch(image_vector,
+                                            top_k=top_k,
+                                            skip=skip,
+                                            filter_param=filter_param,
+                                            accuracy_param=accuracy)
+
+    signature = ("image", await asyncio.to_thread(_hash_file, image.file), params_signature(filter_param, accuracy))
+    return await cached_search(signature, paging, search)
 
 
 @searchRouter.get("/similar/{id}",
@@ -84,15 +157,21 @@ async def similarWith(
         id: Annotated[UUID, Path(description="The id of the image you want to search.")],
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        accuracy: Annotated[SearchAccuracyParams, Depends(SearchAccuracyParams)]
 ) -> SearchApiResponse:
     logger.info("Similar search request received, id: {}", id)
-    results = await db_context.querySimilar(search_id=str(id),
-                                            top_k=paging.count,
-                                            skip=paging.skip,
-                                            filter_param=filter_param,
-                                            query_vector_name=db_context.getVectorByBasis(basis.basis))
-    return SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4())
+
+    async def search(top_k: int, skip: int) -> list[SearchResult]:
+        return await db_context.querySimilar(search_id=str(id),
+                                             top_k=top_k,
+                                             skip=skip,
+                                             filter_param=filter_param,
+                                             accuracy_param=accuracy,
+                                             query_vector_name=db_context.getVectorByBasis(basis.basis))
+
+    signature = ("similar", str(id), basis.basis, params_signature(filter_param, accuracy))
+    return await cached_search(signature, paging, search)
 
 
 @searchRouter.post("/advanced", description="Search with multiple criteria")
@@ -100,12 +179,17 @@ async def advancedSearch(
         model: AdvancedSearchModel,
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]) -> SearchApiResponse:
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        accuracy: Annotated[SearchAccuracyParams, Depends(SearchAccuracyParams)]) -> SearchApiResponse:
     if len(model.criteria) + len(model.negative_criteria) == 0:
         raise HTTPException(status_code=422, detail="At least one criteria should be provided.")
     logger.info("Advanced search request received: {}", model)
-    result = await process_advanced_and_combined_search_query(model, basis, filter_param, paging)
-    return SearchApiResponse(result=result, message=f"Successfully get {len(result)} results.", query_id=uuid4())
+
+    async def search(top_k: int, skip: int) -> list[SearchResult]:
+        return await process_advanced_and_combined_search_query(model, basis, filter_param, accuracy, top_k, skip)
+
+    signature = ("advanced", basis.basis, model.model_dump_json(), params_signature(filter_param, accuracy))
+    return await cached_search(signature, paging, search)
 
 
 @searchRouter.post("/combined", description="Search with combined criteria")
@@ -113,14 +197,19 @@ async def combinedSearch(
         model: CombinedSearchModel,
         basis: Annotated[SearchCombinedParams, Depends(SearchCombinedParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]) -> SearchApiResponse:
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        accuracy: Annotated[SearchAccuracyParams, Depends(SearchAccuracyParams)]) -> SearchApiResponse:
     if len(model.criteria) + len(model.negative_criteria) == 0:
         raise HTTPException(status_code=422, detail="At least one criteria should be provided.")
     logger.info("Combined search request received: {}", model)
-    result = await process_advanced_and_combined_search_query(model, basis, filter_param, paging)
-    calculate_and_sort_by_combined_scores(model, basis, result)
-    result = result[:paging.count] if len(result) > paging.count else result
-    return SearchApiResponse(result=result, message=f"Successfully get {len(result)} results.", query_id=uuid4())
+
+    async def search(top_k: int, skip: int) -> list[SearchResult]:
+        result = await process_advanced_and_combined_search_query(model, basis, filter_param, accuracy, top_k, skip)
+        result = await calculate_and_sort_by_combined_scores(model, basis, result)
+        return result[:top_k] if len(result) > top_k else result
+
+    signature = ("combined", basis.basis, model.model_dump_json(), params_signature(filter_param, accuracy))
+    return await cached_search(signature, paging, search)
 
 
 @searchRouter.get("/random", description="Get random images")
@@ -128,50 +217,218 @@ async def randomPick(
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]) -> SearchApiResponse:
     logger.info("Random pick request received")
-    random_vector = transformers_service.get_random_vector()
-    result = await db_context.querySearch(random_vector, top_k=paging.count, filter_param=filter_param)
-    return SearchApiResponse(result=result, message=f"Successfully get {len(result)} results.", query_id=uuid4())
+    # The seed travels in the cursors, so scrolling goes on with the same random vector and never repeats an image
+    seed = paging.cursor.seed if paging.cursor is not None and paging.cursor.seed is not None \
+        else secrets.randbits(32)
+
+    async def search(top_k: int, skip: int) -> list[SearchResult]:
+        random_vector = inference_scheduler.get_random_vector(seed)
+        return await db_context.querySearch(random_vector, top_k=top_k, skip=skip, filter_param=filter_param)
+
+    return await cached_search(None, paging, search, seed)
+
+
+@searchRouter.post("/batch",
+                  description="Run several text, similar and random searches at once. All the prompts are encoded "
+                              "together, and all the searches are sent to the database in one round-trip. "
+                              "The filter and accuracy parameters apply to every query.")
+async def batchSearch(
+        model: BatchSearchModel,
+        filter_param: Annotated[FilterParams, Depends(FilterParams)],
+        accuracy: Annotated[SearchAccuracyParams, Depends(SearchAccuracyParams)]) -> BatchSearchApiResponse:
+    logger.info("Batch search request received, {} queries", len(model.queries))
+    if not config.ocr_search.enable and any(t.basis == SearchBasisEnum.ocr and t.type != BatchSearchTypeEnum.random
+                                            for t in model.queries):
+        raise HTTPException(400, "OCR search is not enabled.")
+    text_queries = {basis: [t for t in model.queries if t.type == BatchSearchTypeEnum.text and t.basis == basis]
+                    for basis in SearchBasisEnum}
+    similar_queries = [t for t in model.queries if t.type == BatchSearchTypeEnum.similar]
+    random_queries = [t for t in model.queries if t.type == BatchSearchTypeEnum.random]
 
+    async def encode(basis: SearchBasisEnum):
+        prompts = [t.prompt for t in text_queries[basis]]
+        if not prompts:
+            return []
+        if basis == SearchBasisEnum.ocr:
+            return await inference_scheduler.get_bert_vectors(prompts)
+        return await inference_scheduler.get_text_vectors(prompts)
 
-@searchRouter.get("/recall/{query_id}", description="Recall the query with given queryId")
-async def recallQuery(query_id: str):
-    raise NotImplementedError()
+    # All the prompts of each model are encoded in one batch
+    vision_vectors, ocr_vectors = await asyncio.gather(encode(SearchBasisEnum.vision), encode(SearchBasisEnum.ocr))
+    vector_queries = [*zip(text_queries[SearchBasisEnum.vision],
+                           [(db_context.IMG_VECTOR, t) for t in vision_vectors]),
+                      *zip(text_queries[SearchBasisEnum.ocr],
+                           [(db_context.TEXT_VECTOR, t) for t in ocr_vectors]),
+                      *[(t, (db_context.IMG_VECTOR, inference_scheduler.get_random_vector())) for t in random_queries]]
+
+    # Every query fetches as many results as the largest one, and is trimmed afterward
+    top_k = max(t.count for t in model.queries)
+
+    async def search_vectors():
+        if not vector_queries:
+            return []
+        return await db_context.querySearchBatch([t for _, t in vector_queries], top_k=top_k,
+                                                 filter_param=filter_param, accuracy_param=accuracy)
+
+    async def search_similar():
+        if not similar_queries:
+            return []
+        try:
+            return await db_context.querySimilarBatch([(db_context.getVectorByBasis(t.basis), str(t.id))
+                                                       for t in similar_queries],
+                                                      top_k=top_k, filter_param=filter_param, accuracy_param=accuracy)
+        except PointNotFoundError as e:
+            raise HTTPException(404, f"Cannot find the image {e.point_id} of a similar query.") from e
+
+    vector_results, similar_results = await asyncio.gather(search_vectors(), search_similar())
+    results_by_key = {query.key: result[:query.count]
+                      for query, result in zip([t for t, _ in vector_queries] + similar_queries,
+                                               vector_results + similar_results)}
+    results = {t.key: results_by_key[t.key] for t in model.queries}
+    return BatchSearchApiResponse(results=results, message=f"Successfully run {len(results)} queries.")
+
+
+@searchRouter.get("/recall/{query_id}",
+                  description="Recall the results of a previous search with the query_id it returned, for example "
+                              "to get another page. Results are kept for a limited time.")
+async def recallQuery(
+        query_id: Annotated[UUID, Path(description="The query_id returned by the previous search.")],
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]) -> SearchApiResponse:
+    logger.info("Recall request received, query_id: {}", query_id)
+    query = result_cache.get(query_id) if result_cache is not None else None
+    if query is None:
+        raise HTTPException(404, "The query doesn't exist or has expired.")
+    result = await get_cached_page(query, paging)
+    # Only the original search endpoint can continue the search past the cached results
+    has_more = paging.skip + paging.count < len(query)
+    return SearchApiResponse(result=result, message=f"Successfully get {len(result)} results.", query_id=query_id,
+                             next_cursor=make_next_cursor(paging, query_id, has_more))
+
+
+def _hash_file(file: BinaryIO) -> str:
+    """
+    SHA-256 of an uploaded file, read chunk by chunk. The file is rewound for decoding afterwards.
+    """
+    digest = sha256()
+    while chunk := file.read(_HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def params_signature(*params) -> tuple:
+    return tuple(tuple(sorted(vars(t).items())) for t in params)
+
+
+def make_next_cursor(paging: SearchPagingParams, query_id: UUID | None, has_more: bool,
+                     seed: int | None = None) -> str | None:
+    if not has_more:
+        return None
+    return SearchCursor(offset=paging.skip + paging.count, query_id=query_id, seed=seed).encode()
+
+
+async def get_cached_page(query: CachedQuery, paging: SearchPagingParams) -> List[SearchResult]:
+    ids = query.ids[paging.skip:paging.skip + paging.count]
+    scores = dict(zip(ids, query.scores[paging.skip:paging.skip + paging.count]))
+    # Images deleted since the search are skipped
+    images = await db_context.retrieve_by_ids(list(ids))
+    return [SearchResult(img=t, score=scores[str(t.id)]) for t in images]
+
+
+async def cached_search(signature: Hashable | None, paging: SearchPagingParams,
+                        search: Callable[[int, int], Awaitable[List[SearchResult]]],
+                        seed: int | None = None) -> SearchApiResponse:
+    """
+    Serve a search from the result cache, or run it with an over-fetched top_k and cache the results.
+    Cursors point into the cached results. When a cursor goes past them, the search is continued from there and
+    the cache extended, so scrolling costs one Qdrant search per few pages instead of one per page.
+    :param signature: Identifies the search, so identical searches share their results. None for searches which are
+                      never cached, such as random picks.
+    :param search: Runs the search with the given top_k and skip.
+    :param seed: Seed of the random vector of a random search, carried by the cursors.
+    """
+    max_prefetch_count = config.result_cache.prefetch_count
+    cursor = paging.cursor
+    end = paging.skip + paging.count
+    prefetch_count = min(max_prefetch_count, paging.count * PREFETCH_PAGES)
+    cached = None
+    if result_cache is not None:
+        if cursor is not None and cursor.query_id is not None:
+            if (query := result_cache.get(cursor.query_id)) is not None:
+                if query.signature != signature:
+                    raise HTTPException(400, "The cursor belongs to another search.")
+                cached = cursor.query_id, query
+        elif cursor is None and signature is not None:
+            cached = result_cache.find(signature)
+
+    if cached is not None:
+        query_id, query = cached
+        if end > len(query) and not query.complete:
+            logger.info("Continuing search past the {} cached results, query_id: {}", len(query), query_id)
+            requested_count = max(prefetch_count, end - len(query))
+            query = result_cache.extend(query_id, query, await search(requested_count, len(query)), requested_count)
+        else:
+            logger.info("Serving search from the result cache, query_id: {}", query_id)
+        result = await get_cached_page(query, paging)
+        has_more = end < len(query) or not query.complete
+    elif result_cache is None or signature is None or end > max_prefetch_count:
+        # Random picks are never cached, and expired cursors fall back to an offset search
+        result = await search(paging.count, paging.skip)
+        query_id = None
+        has_more = len(result) == paging.count
+    else:
+        requested_count = max(prefetch_count, end)
+        result = await search(requested_count, 0)
+        query_id = result_cache.put(result, requested_count, signature)
+        has_more = end < len(result) or len(result) >= requested_count
+        result = result[paging.skip:end]
+    return SearchApiResponse(result=result, message=f"Successfully get {len(result)} results.",
+                             query_id=query_id or uuid4(),
+                             next_cursor=make_next_cursor(paging, query_id, has_more, seed))
 
 
 async def process_advanced_and_combined_search_query(model: Union[AdvancedSearchModel, CombinedSearchModel],
                                                      basis: Union[SearchBasisParams, SearchCombinedParams],
                                                      filter_param: FilterParams,
-                                                     paging: SearchPagingParams) -> List[SearchResult]:
+                                                     accuracy: SearchAccuracyParams,
+                                                     top_k: int,
+                                                     skip: int) -> List[SearchResult]:
+    # Encode all the criteria in one batch
+    prompts = model.criteria + model.negative_criteria
     if basis.basis == SearchBasisEnum.ocr:
-        positive_vectors = [transformers_service.get_bert_vector(t) for t in model.criteria]
-        negative_vectors = [transformers_service.get_bert_vector(t) for t in model.negative_criteria]
+        vectors = await inference_scheduler.get_bert_vectors(prompts)
     else:
-        positive_vectors = [transformers_service.get_text_vector(t) for t in model.criteria]
-        negative_vectors = [transformers_service.get_text_vector(t) for t in model.negative_criteria]
-    # In order to ensure the query effect of the combined query, modify the actual top_k
-    _query_top_k = min(max(30, paging.count*3), 100) if isinstance(model, CombinedSearchModel) else paging.count
+        vectors = await inference_scheduler.get_text_vectors(prompts)
+    positive_vectors = vectors[:len(model.criteria)]
+    negative_vectors = vectors[len(model.criteria):]
+    # Combined search re-ranks the results, so fetch more candidates than needed
+    settings = config.search
+    _query_top_k = max(min(max(settings.combined_min_candidates, int(top_k * settings.combined_candidate_factor)),
+                           settings.combined_max_candidates), top_k) \
+        if isinstance(model, CombinedSearchModel) else top_k
     result = await db_context.querySimilar(query_vector_name=db_context.getVectorByBasis(basis.basis),
                                            positive_vectors=positive_vectors,
                                            negative_vectors=negative_vectors,
                                            mode=model.mode,
                                            filter_param=filter_param,
+                                           accuracy_param=accuracy,
                                            with_vectors=True if isinstance(basis, SearchCombinedParams) else False,
                                            top_k=_query_top_k,
-                                           skip=paging.skip)
+                                           skip=skip)
     return result
 
 
-def calculate_and_sort_by_combined_scores(model: CombinedSearchModel,
-                                          basis: SearchCombinedParams,
-                                          result: List[SearchResult]) -> None:
-    # First, calculate the extra prompt vector
-    extra_prompt_vector = transformers_service.get_text_vector(model.extra_prompt) \
-        if basis.basis == SearchCombinedBasisEnum.ocr \
-        else transformers_service.get_bert_vector(model.extra_prompt)
-    # Then, calculate combined_similar_score (original score * similar_score) and write to SearchResult.score
-    for itm in result:
-        extra_vector = itm.img.image_vector if itm.img.image_vector is not None else itm.img.text_contain_vector
-        similar_score = calculate_vectors_cosine(extra_vector, extra_prompt_vector)
-        itm.score = similar_score * itm.score
-    # Finally, sort the result by combined_similar_score
-    result.sort(key=lambda i: i.score, reverse=True)
+async def calculate_and_sort_by_combined_scores(model: CombinedSearchModel,
+                                                basis: SearchCombinedParams,
+                                                result: List[SearchResult]) -> List[SearchResult]:
+    # The extra prompt is matched against the vectors of the other basis
+    if basis.basis == SearchCombinedBasisEnum.ocr:
+        extra_prompt_vector = await inference_scheduler.get_text_vector(model.extra_prompt)
+        candidates = [t.img.image_vector for t in result]
+    else:
+        extra_prompt_vector = await inference_scheduler.get_bert_vector(model.extra_prompt)
+        # Images without any text have no text vector, their combined score is 0
+        candidates = [t.img.text_contain_vector for t in result]
+    # Combined score is the original score * the similarity with the extra prompt
+    return combined_search_reranker.rerank(result, stack_vectors(candidates, len(extra_prompt_vector)),
+                                           extra_prompt_vector)
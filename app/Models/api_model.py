@@ -1,6 +1,8 @@
 from enum import Enum
+from typing import Optional
+from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 class SearchBasisEnum(str, Enum):
@@ -18,6 +20,17 @@ class SearchCombinedBasisEnum(str, Enum):
     ocr = "ocr"
 
 
+class FusionMethodEnum(str, Enum):
+    rrf = "rrf"
+    weighted = "weighted"
+
+
+class BatchSearchTypeEnum(str, Enum):
+    text = "text"
+    similar = "similar"
+    random = "random"
+
+
 class AdvancedSearchModel(BaseModel):
     criteria: list[str] = Field([], description="The positive criteria you want to search with", max_items=16)
     negative_criteria: list[str] = Field([], description="The negative criteria you want to search with", max_items=16)
@@ -28,3 +41,32 @@ class AdvancedSearchModel(BaseModel):
 class CombinedSearchModel(AdvancedSearchModel):
     extra_prompt: str = Field(max_length=100,
                               description="The secondary prompt used for filtering the image.")
+
+
+class BatchSearchQueryModel(BaseModel):
+    key: str = Field(max_length=100, description="Identifies the query in the response.")
+    type: BatchSearchTypeEnum = Field(description="The kind of search, like the /search/text, /search/similar and "
+                                                  "/search/random endpoints.")
+    prompt: Optional[str] = Field(None, max_length=100, description="The prompt of a text search.")
+    id: Optional[UUID] = Field(None, description="The id of the image of a similar search.")
+    basis: SearchBasisEnum = Field(SearchBasisEnum.vision,
+                                   description="The basis used by a text or similar search.")
+    count: int = Field(10, ge=1, le=100, description="The number of results you want to get.")
+
+    @model_validator(mode='after')
+    def check_query(self):
+        if self.type == BatchSearchTypeEnum.text and self.prompt is None:
+            raise ValueError("A text search needs a prompt.")
+        if self.type == BatchSearchTypeEnum.similar and self.id is None:
+            raise ValueError("A similar search needs an id.")
+        return self
+
+
+class BatchSearchModel(BaseModel):
+    queries: list[BatchSearchQueryModel] = Field(description="The queries to run.", min_length=1, max_length=32)
+
+    @model_validator(mode='after')
+    def check_keys(self):
+        if len({t.key for t in self.queries}) != len(self.queries):
+            raise ValueError("Query keys must be unique.")
+        return self
@@ -0,0 +1,91 @@
+from datetime import datetime
+from typing import Literal
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+from .base import NekoProtocol
+
+
+class HistogramStats(BaseModel):
+    count: int
+    sum: float
+    buckets: dict[str, int] = Field(description="Non-cumulative counts keyed by the upper bound of each bucket.")
+
+
+class InferenceQueueStats(BaseModel):
+    pending: int = Field(description="Number of inputs waiting to be batched.")
+    batches: int = Field(description="Number of batches dispatched since startup.")
+    items: int = Field(description="Number of inputs inferred since startup.")
+    rejected: int = Field(description="Number of inputs rejected because the queue was full.")
+    batch_size: HistogramStats
+    queue_wait_ms: HistogramStats
+
+
+class CacheStats(BaseModel):
+    entries: int
+    size_bytes: int
+    max_size_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class EmbeddingCacheStats(CacheStats):
+    disk_hits: int = Field(description="Number of in-memory misses served by the on-disk store.")
+
+
+class OcrStats(BaseModel):
+    images: int = Field(description="Number of images recognized since startup.")
+    batches: int
+    busy_seconds: float
+
+
+class TextPresenceStats(BaseModel):
+    checked: int = Field(description="Number of images checked for text before OCR.")
+    skipped: int = Field(description="Number of images without text, on which OCR was skipped.")
+    skip_rate: float
+    busy_seconds: float
+
+
+class ServerStatsApiResponse(NekoProtocol):
+    inference: dict[str, InferenceQueueStats]
+    embedding_cache: EmbeddingCacheStats | None = Field(description="None if the embedding cache is disabled.")
+    result_cache: CacheStats | None = Field(description="None if the search result cache is disabled.")
+    image_cache: CacheStats | None = Field(description="Disk cache of resized images. None if static files are "
+                                                       "disabled.")
+    ocr: OcrStats | None = Field(description="OCR of ingested images. None if OCR is disabled on this server.")
+    text_presence: TextPresenceStats | None = Field(description="None if OCR isn't skipped on images without text.")
+
+
+class DuplicateClustersApiResponse(NekoProtocol):
+    hashed_count: int = Field(description="Number of images with a perceptual hash. Images indexed before perceptual "
+                                          "hashes were introduced are not taken into account.")
+    clusters: list[list[UUID]] = Field(description="Groups of images which are near-duplicates of each other.")
+
+
+class IngestionErrorInfo(BaseModel):
+    source: str = Field(description="The file name or URL of the failed item.")
+    message: str
+
+
+class IngestionJobStatus(BaseModel):
+    id: UUID
+    state: Literal["queued", "running", "completed", "failed", "cancelled"]
+    total: int = Field(description="Number of items in the job.")
+    succeeded: int = Field(description="Number of images added to the database.")
+    skipped: int = Field(description="Number of images skipped because they are already in the database.")
+    failed: int
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+    throughput: float = Field(description="Items processed per second since the job started.")
+    errors: list[IngestionErrorInfo] = Field(description="The most recent failures.")
+
+
+class IngestionJobApiResponse(NekoProtocol):
+    job: IngestionJobStatus
+
+
+class IngestionJobListApiResponse(NekoProtocol):
+    jobs: list[IngestionJobStatus]
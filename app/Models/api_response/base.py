@@ -23,3 +23,8 @@ class WelcomeApiResponse(NekoProtocol):
     authorization: WelcomeApiAuthenticationResponse
     admin_api: WelcomeApiAdminPortalAuthenticationResponse
     available_basis: list[str]
+
+
+class ReadinessApiResponse(NekoProtocol):
+    ready: bool
+    models_loaded: bool
@@ -2,7 +2,15 @@ from .base import NekoProtocol
 from ..search_result import SearchResult
 from uuid import UUID
 
+from pydantic import Field
+
 
 class SearchApiResponse(NekoProtocol):
     query_id: UUID
     result: list[SearchResult]
+    next_cursor: str | None = Field(None, description="Pass it as the cursor parameter to get the next page. "
+                                                      "None if there are no more results.")
+
+
+class BatchSearchApiResponse(NekoProtocol):
+    results: dict[str, list[SearchResult]] = Field(description="The results of each query, keyed by its key.")
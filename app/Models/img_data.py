@@ -18,6 +18,7 @@ class ImageData(BaseModel):
     height: Optional[int] = None
     aspect_ratio: Optional[float] = None
     starred: Optional[bool] = False
+    phash: Optional[str] = None
 
     @property
     def payload(self):
@@ -30,8 +31,9 @@ class ImageData(BaseModel):
     def from_payload(cls, id: str, payload: dict,
                      image_vector: Optional[ndarray] = None, text_contain_vector: Optional[ndarray] = None):
         # Convert the datetime string back to datetime object
-        index_date = datetime.fromisoformat(payload['index_date'])
-        del payload['index_date']
+        # The payload may be shared (e.g. by qdrant local mode), so it must not be modified here
+        payload = payload.copy()
+        index_date = datetime.fromisoformat(payload.pop('index_date'))
         return cls(id=UUID(id),
                    index_date=index_date,
                    **payload,
@@ -1,16 +1,29 @@
 from typing import Annotated
 
+from fastapi import HTTPException
 from fastapi.params import Query
 
+from app.util.search_cursor import SearchCursor, InvalidCursorError
+
 
 class SearchPagingParams:
     def __init__(
             self,
             count: Annotated[int, Query(ge=1, le=100, description="The number of results you want to get.")] = 10,
-            skip: Annotated[int, Query(ge=0, description="The number of results you want to skip.")] = 0
+            skip: Annotated[int, Query(ge=0, description="The number of results you want to skip.")] = 0,
+            cursor: Annotated[str | None, Query(max_length=200,
+                                                description="The next_cursor returned with the previous page. "
+                                                            "Later pages are much cheaper to get with a cursor than "
+                                                            "with skip. Overrides skip.")] = None
     ):
         self.count = count
         self.skip = skip
+        try:
+            self.cursor = SearchCursor.decode(cursor) if cursor is not None else None
+        except InvalidCursorError as e:
+            raise HTTPException(400, str(e)) from e
+        if self.cursor is not None:
+            self.skip = self.cursor.offset
 
 
 class FilterParams:
@@ -35,3 +48,21 @@ class FilterParams:
         else:
             self.min_ratio = None
             self.max_ratio = None
+
+
+class SearchAccuracyParams:
+    def __init__(
+            self,
+            hnsw_ef: Annotated[int | None, Query(ge=1, le=4096,
+                                                 description="Size of the candidate list of the HNSW search. Larger "
+                                                             "values are more accurate but slower. Leave empty to "
+                                                             "use the server default.")] = None,
+            exact: Annotated[bool | None, Query(description="Search exhaustively instead of using the HNSW index. "
+                                                            "Slow on large collections. Leave empty to use the "
+                                                            "server default.")] = None,
+            rescore: Annotated[bool | None, Query(description="Rescore the candidates found with quantized vectors "
+                                                              "using the original vectors. Leave empty to use the "
+                                                              "server default.")] = None):
+        self.hnsw_ef = hnsw_ef
+        self.exact = exact
+        self.rescore = rescore
@@ -1,12 +1,51 @@
+import asyncio
+
+from loguru import logger
+
+from .embedding_cache import EmbeddingCache
+from .inference_scheduler import InferenceScheduler
+from .ocr_services import DisabledOCRService
+from .result_cache import ResultCache
+from .storage import create_storage
+from .text_presence import TextPresenceClassifier
 from .transformers_service import TransformersService
 from .vector_db_context import VectorDbContext
 from ..config import config, environment
+from ..util.disk_lru_cache import DiskLRUCache
+
+# The inference server runs the models for the workers of the "remote" backend, with its own backend setting
+match config.inference_server.backend if environment.inference_server else config.inference.backend:
+    case "torch":
+        transformers_service = TransformersService(config.inference.model_role)
+    case "onnx":
+        from .onnx_service import OnnxTransformersService
 
-transformers_service = TransformersService()
+        transformers_service = OnnxTransformersService(config.onnx, config.inference.model_role)
+    case "remote" if environment.inference_server:
+        raise ValueError("The inference server can't use the remote backend, set APP_INFERENCE_SERVER__BACKEND to "
+                         "\"torch\" or \"onnx\".")
+    case "remote":
+        from .remote_transformers_service import RemoteTransformersService
+
+        transformers_service = RemoteTransformersService(config.inference_server, config.inference.model_role)
+    case _:
+        raise NotImplementedError(f"Inference backend {config.inference.backend} not implemented.")
+embedding_cache = EmbeddingCache(max_memory_bytes=int(config.embedding_cache.max_memory_mb * 1024 * 1024),
+                                 ttl=config.embedding_cache.ttl_seconds,
+                                 disk_path=config.embedding_cache.disk_path) if config.embedding_cache.enable else None
+inference_scheduler = InferenceScheduler(transformers_service, embedding_cache)
+result_cache = ResultCache(max_memory_bytes=int(config.result_cache.max_memory_mb * 1024 * 1024),
+                           ttl=config.result_cache.ttl_seconds) if config.result_cache.enable else None
 db_context = VectorDbContext()
+storage_service = create_storage(config.storage, config.static_file)
+image_variant_cache = DiskLRUCache(config.image_serving.cache_path,
+                                   int(config.image_serving.max_cache_mb * 1024 * 1024)) \
+    if config.static_file.enable else None
 ocr_service = None
 
-if environment.local_indexing:
+# The ingestion API indexes images in the server, so it needs the OCR models too
+if environment.local_indexing or (config.ingestion.enable and config.ocr_search.enable
+                                  and not environment.inference_server):
     match config.ocr_search.ocr_module:
         case "easyocr":
             from .ocr_services import EasyOCRService
@@ -23,6 +62,30 @@ if environment.local_indexing:
         case _:
             raise NotImplementedError(f"OCR module {config.ocr_search.ocr_module} not implemented.")
 else:
-    from .ocr_services import DisabledOCRService
-
     ocr_service = DisabledOCRService()
+
+text_presence_classifier = None
+if config.ocr_search.skip_textless_images and not isinstance(ocr_service, DisabledOCRService):
+    if transformers_service.has_text_tower:
+        text_presence_classifier = TextPresenceClassifier(transformers_service,
+                                                          config.ocr_search.text_presence_threshold)
+    else:
+        logger.warning("Skipping textless images needs the CLIP text model, OCR will run on every image.")
+
+ingestion_service = None
+if config.ingestion.enable:
+    from .ingestion import IngestionService
+
+    ingestion_service = IngestionService(inference_scheduler, db_context, storage_service, ocr_service,
+                                         text_presence_classifier, result_cache)
+
+
+async def load_models():
+    """
+    Load all the models in parallel, off the event loop.
+    """
+    await asyncio.gather(asyncio.to_thread(transformers_service.load), asyncio.to_thread(ocr_service.load))
+
+
+def models_loaded() -> bool:
+    return transformers_service.loaded and ocr_service.loaded
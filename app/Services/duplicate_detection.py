@@ -0,0 +1,68 @@
+from uuid import UUID
+
+from loguru import logger
+
+from app.Services.vector_db_context import VectorDbContext
+from app.util.bk_tree import BKTree
+from app.util.perceptual_hash import hamming_distance, phash_from_hex
+
+
+class PerceptualHashIndex:
+    """
+    In-memory index of the perceptual hashes of the images, to find re-encoded or resized copies of an image
+    without running a vector search for every image.
+    """
+
+    def __init__(self):
+        self._tree: BKTree[UUID] = BKTree(hamming_distance)
+        self._items: list[tuple[UUID, int]] = []
+
+    @classmethod
+    async def from_database(cls, db_context: VectorDbContext) -> 'PerceptualHashIndex':
+        index = cls()
+        async for image_id, payload in db_context.scrollPayloads(['phash']):
+            if payload.get('phash') is not None:
+                index.add(UUID(str(image_id)), phash_from_hex(payload['phash']))
+        logger.info("Loaded {} perceptual hashes from database.", len(index))
+        return index
+
+    def add(self, image_id: UUID, phash: int):
+        self._tree.add(phash, image_id)
+        self._items.append((image_id, phash))
+
+    def remove(self, image_id: UUID, phash: int):
+        if self._tree.remove(phash, image_id):
+            self._items.remove((image_id, phash))
+
+    def find_near_duplicates(self, phash: int, threshold: int) -> list[tuple[int, UUID]]:
+        """
+        Find the images whose hash is within `threshold` bits of `phash`.
+        :return: A list of (distance, image id), closest first.
+        """
+        return sorted((distance, image_id) for distance, _, image_id in self._tree.search(phash, threshold))
+
+    def clusters(self, threshold: int) -> list[list[UUID]]:
+        """
+        Group the images into clusters of near-duplicates, linking every pair of images within `threshold` bits.
+        Images without any near-duplicate are left out.
+        """
+        parent = list(range(len(self._items)))
+        position = {image_id: i for i, (image_id, _) in enumerate(self._items)}
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, (_, phash) in enumerate(self._items):
+            for _, _, image_id in self._tree.search(phash, threshold):
+                parent[find(position[image_id])] = find(i)
+
+        groups: dict[int, list[UUID]] = {}
+        for i, (image_id, _) in enumerate(self._items):
+            groups.setdefault(find(i), []).append(image_id)
+        return [t for t in groups.values() if len(t) > 1]
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,93 @@
+import asyncio
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from time import time
+
+import numpy as np
+from numpy import ndarray
+
+from app.util.lru_cache import LRUCache
+
+EmbeddingKey = tuple[str, str, str]
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Both the CLIP and the BERT tokenizer lowercase their input and split on whitespace, so this doesn't change
+    # the resulting vector.
+    return " ".join(prompt.split()).lower()
+
+
+class SqliteEmbeddingStore:
+    """
+    On-disk embedding store, which can be shared by several server processes on the same host.
+    """
+
+    def __init__(self, path: str, ttl: float | None = None):
+        self.ttl = ttl
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                               "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)")
+            if ttl is not None:
+                self._conn.execute("DELETE FROM embeddings WHERE created < ?", (time() - ttl,))
+
+    @staticmethod
+    def _serialize_key(key: EmbeddingKey) -> str:
+        return "\x1f".join(key)
+
+    def get(self, key: EmbeddingKey) -> ndarray | None:
+        with self._lock:
+            row = self._conn.execute("SELECT vector, created FROM embeddings WHERE key = ?",
+                                     (self._serialize_key(key),)).fetchone()
+        if row is None or (self.ttl is not None and time() - row[1] > self.ttl):
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, key: EmbeddingKey, vector: ndarray):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO embeddings (key, vector, created) VALUES (?, ?, ?)",
+                               (self._serialize_key(key), vector.astype(np.float32).tobytes(), time()))
+
+    def close(self):
+        self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    Cache of prompt embeddings keyed by (model name, basis, normalized prompt).
+    Lookups hit an in-memory LRU first, then the optional on-disk store.
+    """
+
+    def __init__(self, max_memory_bytes: int, ttl: float | None = None, disk_path: str | None = None):
+        self._memory: LRUCache[EmbeddingKey, ndarray] = LRUCache(
+            max_memory_bytes, lambda key, vector: vector.nbytes + sum(len(t) for t in key), ttl)
+        self._disk = SqliteEmbeddingStore(disk_path, ttl) if disk_path else None
+        self.disk_hits = 0
+
+    @staticmethod
+    def make_key(model_name: str, basis: str, prompt: str) -> EmbeddingKey:
+        return model_name, basis, normalize_prompt(prompt)
+
+    async def get(self, key: EmbeddingKey) -> ndarray | None:
+        vector = self._memory.get(key)
+        if vector is None and self._disk is not None:
+            vector = await asyncio.to_thread(self._disk.get, key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._memory.put(key, vector)
+        return vector
+
+    async def put(self, key: EmbeddingKey, vector: ndarray):
+        # Cached vectors are shared between requests, so make sure no one modifies them in place
+        vector = vector.astype(np.float32, copy=True)
+        vector.flags.writeable = False
+        self._memory.put(key, vector)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.put, key, vector)
+
+    def get_stats(self) -> dict:
+        return self._memory.get_stats() | {"disk_hits": self.disk_hits}
@@ -0,0 +1,70 @@
+import sqlite3
+from pathlib import Path
+from time import time
+from uuid import UUID, uuid5
+
+# Namespace of the image ids derived from file content, so byte-identical images always map to the same point
+IMAGE_ID_NAMESPACE = UUID('5d1c6c6e-2c4b-4f39-9e5e-5b8e2d0e6b6a')
+
+
+def image_id_from_hash(content_hash: str) -> UUID:
+    return uuid5(IMAGE_ID_NAMESPACE, content_hash)
+
+
+class IndexManifest:
+    """
+    Records every file processed by the local indexer, with its size, mtime and content hash.
+    Files are recorded once they are committed to the database, so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, path: str, collection: str):
+        self.collection = collection
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                               "collection TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                               "mtime REAL NOT NULL, hash TEXT NOT NULL, image_id TEXT NOT NULL, "
+                               "indexed_at REAL NOT NULL, PRIMARY KEY (collection, path))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (collection, hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_image_id ON files (collection, image_id)")
+
+    def is_unchanged(self, path: Path, size: int, mtime: float) -> bool:
+        row = self._conn.execute("SELECT size, mtime FROM files WHERE collection = ? AND path = ?",
+                                 (self.collection, str(path))).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+    def find_by_hash(self, content_hash: str) -> UUID | None:
+        row = self._conn.execute("SELECT image_id FROM files WHERE collection = ? AND hash = ? LIMIT 1",
+                                 (self.collection, content_hash)).fetchone()
+        return UUID(row[0]) if row is not None else None
+
+    def record_many(self, files: list[tuple[Path, int, float, str, UUID]]) -> list[UUID]:
+        """
+        Record processed files. A file skipped as a near-duplicate is recorded with the id of the image it duplicates.
+        :param files: Tuples of (path, size, mtime, content hash, image id).
+        :return: Ids of the images which were created from the files before they changed, and which no file points to
+                 anymore.
+        """
+        now = time()
+        with self._conn:
+            previous_ids = set()
+            for path, *_ in files:
+                row = self._conn.execute("SELECT hash, image_id FROM files WHERE collection = ? AND path = ?",
+                                         (self.collection, str(path))).fetchone()
+                # Near-duplicates point to an image created from another file, or uploaded, which they don't own
+                if row is not None and row[1] == str(image_id_from_hash(row[0])):
+                    previous_ids.add(row[1])
+            self._conn.executemany("INSERT OR REPLACE INTO files "
+                                   "(collection, path, size, mtime, hash, image_id, indexed_at) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   [(self.collection, str(path), size, mtime, content_hash, str(image_id), now)
+                                    for path, size, mtime, content_hash, image_id in files])
+            return [UUID(t) for t in sorted(previous_ids) if not self._is_referenced(t)]
+
+    def _is_referenced(self, image_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM files WHERE collection = ? AND image_id = ? LIMIT 1",
+                                  (self.collection, image_id)).fetchone() is not None
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,245 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from time import perf_counter
+from typing import Callable, Generic, Sequence, TypeVar
+
+from PIL import Image
+from loguru import logger
+from numpy import ndarray
+
+from app.Models.api_model import SearchBasisEnum
+from app.Services.embedding_cache import EmbeddingCache
+from app.Services.transformers_service import TransformersService
+from app.config import config
+from app.util.histogram import Histogram
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+QUEUE_WAIT_MS_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class InferenceQueueFullError(RuntimeError):
+    def __init__(self, queue_name: str):
+        self.queue_name = queue_name
+        super().__init__(f"Inference queue {queue_name} is full.")
+
+
+class BatchingQueue(Generic[T, R]):
+    """
+    Collects inputs submitted by concurrent callers and runs them through `batch_fn` in batches.
+    A batch is dispatched as soon as it reaches `max_batch_size`, or when `max_wait` seconds passed since the first
+    input of the batch arrived. Results are fanned out to the awaiting callers in submission order.
+    `batch_fn` runs in `executor`, with at most `max_concurrency` batches in flight. Submissions are rejected with
+    `InferenceQueueFullError` once more than `max_queue_size` inputs are waiting.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[list[T]], Sequence[R]], max_batch_size: int, max_wait: float,
+                 executor: Executor | None = None, max_concurrency: int = 1, max_queue_size: int = 0):
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max_queue_size
+        self._batch_fn = batch_fn
+        self.executor = executor
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._inflight: set[asyncio.Task] = set()
+        self._batches = 0
+        self._items = 0
+        self._rejected = 0
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram(QUEUE_WAIT_MS_BUCKETS)
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        # The queue and the worker are bound to the event loop they were created in
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._worker = loop.create_task(self._work())
+
+    async def submit(self, item: T) -> R:
+        return (await self.submit_many([item]))[0]
+
+    async def submit_many(self, items: list[T]) -> list[R]:
+        """
+        Submit several inputs at once. They are queued back-to-back, so they share a batch whenever the batch size
+        allows it.
+        """
+        self._ensure_worker()
+        if 0 < self.max_queue_size < self.pending() + len(items):
+            self._rejected += len(items)
+            raise InferenceQueueFullError(self.name)
+        futures = []
+        for item in items:
+            future = self._loop.create_future()
+            self._queue.put_nowait((item, future, perf_counter()))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self) -> list[tuple[T, asyncio.Future, float]]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _work(self):
+        while True:
+            # Keep collecting while every slot is busy, so the next batch can grow in the meantime
+            await self._slots.acquire()
+            batch = await self._collect()
+            # Callers that already gave up don't need to be computed
+            batch = [t for t in batch if not t[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+            dispatch_time = perf_counter()
+            for _, _, enqueue_time in batch:
+                self.queue_wait_histogram.observe((dispatch_time - enqueue_time) * 1000)
+            self.batch_size_histogram.observe(len(batch))
+            self._batches += 1
+            self._items += len(batch)
+            task = self._loop.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run_batch(self, batch: list[tuple[T, asyncio.Future, float]]):
+        try:
+            results = await self._loop.run_in_executor(self.executor, self._batch_fn, [t[0] for t in batch])
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("Batch inference on queue {} failed: {}", self.name, e)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "batches": self._batches,
+            "items": self._items,
+            "rejected": self._rejected,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_ms": self.queue_wait_histogram.snapshot(),
+        }
+
+    async def close(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+        self._worker = None
+
+
+class InferenceScheduler:
+    """
+    Async front of `TransformersService`. Inputs from concurrent requests are batched together so that the models run
+    one forward pass per batch instead of one per request. Text prompts are looked up in the embedding cache first,
+    if one is given.
+    """
+
+    def __init__(self, transformers_service: TransformersService, embedding_cache: EmbeddingCache | None = None):
+        self._service = transformers_service
+        self._cache = embedding_cache
+        # Torch releases the GIL during forward passes, so threads are enough to keep the event loop responsive
+        # without duplicating the model weights in other processes.
+        self._executor = self._create_executor()
+        self._queues: dict[str, BatchingQueue] = {
+            "clip_text": self._create_queue("clip_text", transformers_service.get_text_vectors),
+            "clip_image": self._create_queue("clip_image", transformers_service.get_image_vectors),
+        }
+        if config.ocr_search.enable:
+            self._queues["bert"] = self._create_queue("bert", transformers_service.get_bert_vectors)
+
+    @staticmethod
+    def _create_executor() -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=config.inference.workers, thread_name_prefix="inference")
+
+    def _create_queue(self, name: str, batch_fn: Callable[[list], Sequence]) -> BatchingQueue:
+        return BatchingQueue(name, batch_fn,
+                             max_batch_size=config.inference.max_batch_size,
+                             max_wait=config.inference.max_wait_ms / 1000,
+                             executor=self._executor,
+                             max_concurrency=config.inference.workers,
+                             max_queue_size=config.inference.max_queue_size)
+
+    async def _get_cached_text_vectors(self, queue_name: str, model_name: str, basis: SearchBasisEnum,
+                                       texts: list[str]) -> list[ndarray]:
+        if self._cache is None:
+            return await self._queues[queue_name].submit_many(texts)
+        keys = [self._cache.make_key(model_name, basis.value, t) for t in texts]
+        vectors = {}
+        missing: dict[tuple, str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = await self._cache.get(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors[key] = vector
+        if missing:
+            # All the misses are submitted together, so they are encoded in a single forward pass
+            for key, vector in zip(missing.keys(), await self._queues[queue_name].submit_many(list(missing.values()))):
+                await self._cache.put(key, vector)
+                vectors[key] = vector
+        return [vectors[key] for key in keys]
+
+    async def get_text_vector(self, text: str) -> ndarray:
+        return (await self.get_text_vectors([text]))[0]
+
+    async def get_text_vectors(self, texts: list[str]) -> list[ndarray]:
+        return await self._get_cached_text_vectors("clip_text", config.clip.model, SearchBasisEnum.vision, texts)
+
+    async def get_image_vector(self, image: Image.Image) -> ndarray:
+        return await self._queues["clip_image"].submit(image)
+
+    async def get_image_vectors(self, images: list[Image.Image]) -> list[ndarray]:
+        return await self._queues["clip_image"].submit_many(images)
+
+    async def get_bert_vector(self, text: str) -> ndarray:
+        return (await self.get_bert_vectors([text]))[0]
+
+    async def get_bert_vectors(self, texts: list[str]) -> list[ndarray]:
+        return await self._get_cached_text_vectors("bert", config.ocr_search.bert_model, SearchBasisEnum.ocr, texts)
+
+    def get_random_vector(self, seed: int | None = None) -> ndarray:
+        return self._service.get_random_vector(seed)
+
+    def get_stats(self) -> dict[str, dict]:
+        return {name: queue.get_stats() for name, queue in self._queues.items()}
+
+    def get_cache_stats(self) -> dict | None:
+        return self._cache.get_stats() if self._cache is not None else None
+
+    async def close(self):
+        for queue in self._queues.values():
+            await queue.close()
+        self._executor.shutdown(wait=False)
+        # The app may be started again in the same process, as tests do. The threads of the new executor are only
+        # started when a batch runs.
+        self._executor = self._create_executor()
+        for queue in self._queues.values():
+            queue.executor = self._executor
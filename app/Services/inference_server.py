@@ -0,0 +1,117 @@
+import asyncio
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from loguru import logger
+
+from app.Services.inference_scheduler import InferenceScheduler, InferenceQueueFullError
+from app.Services.transformers_service import TransformersService, ModelUnavailableError
+
+# Every message is the length of its JSON header and of its binary payload, then the header and the payload
+FRAME_HEADER = struct.Struct("!II")
+
+
+def encode_message(header: dict, payload: bytes = b"") -> bytes:
+    encoded_header = json.dumps(header).encode()
+    return FRAME_HEADER.pack(len(encoded_header), len(payload)) + encoded_header + payload
+
+
+def encode_vectors(vectors) -> tuple[dict, bytes]:
+    vectors = np.ascontiguousarray(np.stack(vectors) if isinstance(vectors, list) else vectors, dtype=np.float32)
+    return {"shape": list(vectors.shape)}, vectors.tobytes()
+
+
+def encode_images(images: list[Image.Image]) -> tuple[dict, bytes]:
+    """
+    Images are sent as raw RGB pixels, so the server doesn't spend time decoding them again.
+    """
+    images = [t.convert("RGB") if t.mode != "RGB" else t for t in images]
+    return {"sizes": [list(t.size) for t in images]}, b"".join(t.tobytes() for t in images)
+
+
+def decode_images(header: dict, payload: bytes) -> list[Image.Image]:
+    images = []
+    offset = 0
+    for width, height in header["sizes"]:
+        size = width * height * 3
+        images.append(Image.frombytes("RGB", (width, height), payload[offset:offset + size]))
+        offset += size
+    return images
+
+
+async def read_message(reader: asyncio.StreamReader) -> tuple[dict, bytes]:
+    header_size, payload_size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    header = json.loads(await reader.readexactly(header_size))
+    return header, await reader.readexactly(payload_size)
+
+
+class InferenceServer:
+    """
+    Serves the models to the server workers of the "remote" backend over a unix socket, so several workers share one
+    copy of the weights. Inputs from all the connections go through the same scheduler, so the batches mix the
+    requests of every worker.
+    Each connection carries one request at a time, the workers open one connection per inference thread.
+    """
+
+    def __init__(self, scheduler: InferenceScheduler, transformers_service: TransformersService, socket_path: str):
+        self._scheduler = scheduler
+        self._service = transformers_service
+        self._socket_path = Path(socket_path)
+        self._server: asyncio.Server | None = None
+
+    async def start(self):
+        self._socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # Left over by a server which didn't shut down cleanly
+        self._socket_path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(self._handle_connection, str(self._socket_path))
+        logger.success("Inference server listening on {}", self._socket_path)
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self._socket_path.unlink(missing_ok=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    header, payload = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                writer.write(encode_message(*await self._handle_request(header, payload)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, header: dict, payload: bytes) -> tuple[dict, bytes]:
+        try:
+            match header.get("method"):
+                case "info":
+                    return {"model_role": self._service.model_role}, b""
+                case "clip_text":
+                    return encode_vectors(await self._scheduler.get_text_vectors(header["texts"]))
+                case "clip_image":
+                    return encode_vectors(await self._scheduler.get_image_vectors(decode_images(header, payload)))
+                case "bert":
+                    return encode_vectors(await self._scheduler.get_bert_vectors(header["texts"]))
+                case method:
+                    return {"error": "error", "message": f"Unknown method {method}."}, b""
+        except InferenceQueueFullError as e:
+            return {"error": "queue_full", "message": str(e), "queue": e.queue_name}, b""
+        except ModelUnavailableError as e:
+            return {"error": "model_unavailable", "message": str(e)}, b""
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.exception("Inference request {} failed", header.get("method"))
+            return {"error": "error", "message": str(e)}, b""
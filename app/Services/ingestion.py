@@ -0,0 +1,296 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO
+from uuid import UUID, uuid4
+
+import httpx
+from loguru import logger
+
+from app.Models.img_data import ImageData
+from app.Services.index_manifest import image_id_from_hash
+from app.Services.inference_scheduler import InferenceScheduler
+from app.Services.ocr_services import OCRService, DisabledOCRService, recognize_texts
+from app.Services.result_cache import ResultCache
+from app.Services.storage import BaseStorage, store_indexed_images, static_url
+from app.Services.text_presence import TextPresenceClassifier
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config
+from app.util.image_decoding import decode_image_for_indexing, DecodedImage
+from app.util.perceptual_hash import phash_to_hex
+from app.util.thumbnails import check_thumbnail_format
+
+# Finished jobs are kept for the status API until there are more than this
+MAX_FINISHED_JOBS = 100
+MAX_RECORDED_ERRORS = 20
+_CHUNK_SIZE = 64 * 1024
+_SUFFIXES = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif', 'BMP': '.bmp'}
+
+
+class IngestionError(Exception):
+    pass
+
+
+@dataclass
+class IngestionItem:
+    # Original file name or URL, used in error reports
+    source: str
+    # Spooled file, None if it is still to be downloaded from `source`
+    path: Path | None = None
+    starred: bool = False
+
+
+class IngestionJob:
+    def __init__(self, total: int):
+        self.id = uuid4()
+        self.state = "queued"
+        self.total = total
+        self.succeeded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors: deque[tuple[str, str]] = deque(maxlen=MAX_RECORDED_ERRORS)
+        # Ids of the images already seen in this job, to skip identical files
+        self.image_ids: set[UUID] = set()
+        self.created_at = datetime.now()
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+
+    def record_failure(self, source: str, error: Exception, image_id: UUID | None = None):
+        """
+        :param image_id: Id of the image that failed, so that the identical files of the job are retried rather than
+                         skipped.
+        """
+        logger.warning("Ingestion job {}: failed to ingest {}: {}", self.id, source, error)
+        self.failed += 1
+        self.errors.append((source, str(error)))
+        if image_id is not None:
+            self.image_ids.discard(image_id)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("completed", "failed", "cancelled")
+
+    def get_status(self) -> dict:
+        processed = self.succeeded + self.skipped + self.failed
+        elapsed = ((self.finished_at or datetime.now()) - self.started_at).total_seconds() if self.started_at else 0
+        return {
+            "id": self.id,
+            "state": self.state,
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "throughput": processed / elapsed if elapsed > 0 else 0.0,
+            "errors": [{"source": source, "message": message} for source, message in self.errors],
+        }
+
+
+class IngestionService:
+    """
+    Ingests images into the running server. Uploads and downloads are streamed to a spool directory, then the images
+    go through the same batched inference queues as search requests and are inserted into the database in batches.
+    """
+
+    def __init__(self, scheduler: InferenceScheduler, db_context: VectorDbContext, storage: BaseStorage,
+                 ocr_service: OCRService, text_presence: TextPresenceClassifier | None,
+                 result_cache: ResultCache | None):
+        check_thumbnail_format(config.thumbnail.format)
+        self._scheduler = scheduler
+        self._db_context = db_context
+        self._storage = storage
+        self._ocr_service = ocr_service
+        self._text_presence = text_presence
+        self._result_cache = result_cache
+        self._spool_dir = Path(config.ingestion.spool_path)
+        self._max_file_size = int(config.ingestion.max_file_size_mb * 1024 * 1024)
+        self._jobs: dict[UUID, IngestionJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(config.ingestion.max_concurrent_jobs)
+
+    def _new_spool_file(self) -> Path:
+        self._spool_dir.mkdir(parents=True, exist_ok=True)
+        return self._spool_dir / uuid4().hex
+
+    def _copy_to_spool(self, file: BinaryIO) -> Path:
+        path = self._new_spool_file()
+        size = 0
+        try:
+            with path.open('wb') as output:
+                while chunk := file.read(_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self._max_file_size:
+                        raise IngestionError(f"File larger than {config.ingestion.max_file_size_mb} MB.")
+                    output.write(chunk)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return path
+
+    async def spool_upload(self, source: str, file: BinaryIO, starred: bool = False) -> IngestionItem:
+        """
+        Copy an uploaded file to the spool directory, chunk by chunk.
+        """
+        return IngestionItem(source=source, path=await asyncio.to_thread(self._copy_to_spool, file), starred=starred)
+
+    async def _download(self, http: httpx.AsyncClient, url: str) -> Path:
+        path = self._new_spool_file()
+        size = 0
+        try:
+            async with http.stream('GET', url) as response:
+                if response.status_code != 200:
+                    raise IngestionError(f"Download failed with HTTP {response.status_code}.")
+                with path.open('wb') as output:
+                    async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self._max_file_size:
+                            raise IngestionError(f"File larger than {config.ingestion.max_file_size_mb} MB.")
+                        output.write(chunk)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return path
+
+    def submit(self, items: list[IngestionItem]) -> IngestionJob:
+        job = IngestionJob(len(items))
+        self._jobs[job.id] = job
+        self._forget_finished_jobs()
+        task = asyncio.create_task(self._run(job, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info("Ingestion job {} submitted with {} items", job.id, len(items))
+        return job
+
+    def get_job(self, job_id: UUID) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list[IngestionJob]:
+        return list(self._jobs.values())
+
+    def _forget_finished_jobs(self):
+        finished = [t for t in self._jobs.values() if t.finished]
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job.id]
+
+    async def _run(self, job: IngestionJob, items: list[IngestionItem]):
+        try:
+            async with self._semaphore:
+                job.state = "running"
+                job.started_at = datetime.now()
+                async with httpx.AsyncClient(timeout=config.ingestion.download_timeout,
+                                             follow_redirects=True) as http:
+                    batch_size = config.ingestion.batch_size
+                    for start in range(0, len(items), batch_size):
+                        await self._process_batch(job, http, items[start:start + batch_size])
+                job.state = "completed"
+                logger.success("Ingestion job {} completed: {} succeeded, {} skipped, {} failed",
+                               job.id, job.succeeded, job.skipped, job.failed)
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            raise
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.exception("Ingestion job {} failed", job.id)
+            job.state = "failed"
+            job.errors.append(("", str(e)))
+        finally:
+            job.finished_at = datetime.now()
+            for item in items:
+                if item.path is not None:
+                    item.path.unlink(missing_ok=True)
+            if job.succeeded and self._result_cache is not None:
+                # Cached results don't contain the new images
+                self._result_cache.clear()
+
+    async def _process_batch(self, job: IngestionJob, http: httpx.AsyncClient, items: list[IngestionItem]):
+        processed = await asyncio.gather(*[self._process_item(job, http, t) for t in items])
+        processed = [t for t in processed if t is not None]
+        if not processed:
+            return
+        if config.ocr_search.enable and not isinstance(self._ocr_service, DisabledOCRService):
+            processed = await self._recognize_texts_with_fallback(job, processed)
+            if not processed:
+                return
+        # Spooled files are moved to the storage
+        await store_indexed_images(self._storage, [(decoded, imgdata) for _, imgdata, decoded in processed],
+                                   move=True)
+        await self._db_context.insertItems([imgdata for _, imgdata, _ in processed])
+        job.succeeded += len(processed)
+
+    async def _recognize_texts_with_fallback(
+            self, job: IngestionJob, processed: list[tuple[IngestionItem, ImageData, DecodedImage]]
+    ) -> list[tuple[IngestionItem, ImageData, DecodedImage]]:
+        """
+        OCR the batch, and if that fails, retry image by image so that one bad image does not fail the others.
+        :return: The items whose texts were recognized.
+        """
+        try:
+            await self._recognize_texts([imgdata for _, imgdata, _ in processed],
+                                        [decoded for _, _, decoded in processed])
+            return processed
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if len(processed) == 1:
+                job.record_failure(processed[0][0].source, e, processed[0][1].id)
+                return []
+            logger.warning("Batch OCR of {} images failed: {}. Retrying image by image...", len(processed), e)
+        recognized = []
+        for item, imgdata, decoded in processed:
+            try:
+                await self._recognize_texts([imgdata], [decoded])
+                recognized.append((item, imgdata, decoded))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                job.record_failure(item.source, e, imgdata.id)
+        return recognized
+
+    async def _recognize_texts(self, images: list[ImageData], decoded_images: list[DecodedImage]):
+        """
+        OCR the images in a single batch, then encode the texts found with BERT.
+        """
+        texts, _ = await asyncio.to_thread(recognize_texts, self._ocr_service, [t.image for t in decoded_images],
+                                           [t.image_vector for t in images], self._text_presence)
+        for imgdata, text in zip(images, texts):
+            imgdata.ocr_text = text
+        found = [t for t in images if t.ocr_text is not None]
+        if found:
+            for imgdata, vector in zip(found, await self._scheduler.get_bert_vectors([t.ocr_text for t in found])):
+                imgdata.text_contain_vector = vector
+
+    async def _process_item(self, job: IngestionJob, http: httpx.AsyncClient,
+                            item: IngestionItem) -> tuple[IngestionItem, ImageData, DecodedImage] | None:
+        image_id = None
+        try:
+            if item.path is None:
+                item.path = await self._download(http, item.source)
+            decoded = await asyncio.to_thread(decode_image_for_indexing, item.path)
+            image_id = image_id_from_hash(decoded.content_hash)
+            if image_id in job.image_ids:
+                logger.info("{} is identical to another image of the job. Skip...", item.source)
+                job.skipped += 1
+                return None
+            job.image_ids.add(image_id)
+            if await self._db_context.retrieve_by_ids([str(image_id)]):
+                logger.info("{} is identical to the indexed image {}. Skip...", item.source, image_id)
+                job.skipped += 1
+                return None
+            suffix = _SUFFIXES.get(decoded.format, f".{(decoded.format or 'img').lower()}")
+            imgdata = ImageData(id=image_id,
+                                url=static_url(f'{image_id}{suffix}'),
+                                image_vector=await self._scheduler.get_image_vector(decoded.image),
+                                index_date=datetime.now(),
+                                width=decoded.width,
+                                height=decoded.height,
+                                aspect_ratio=float(decoded.width) / decoded.height,
+                                starred=item.starred,
+                                phash=phash_to_hex(decoded.phash))
+            return item, imgdata, decoded
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            job.record_failure(item.source, e, image_id)
+            return None
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
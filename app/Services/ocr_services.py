@@ -1,102 +1,189 @@
+from abc import ABC, abstractmethod
+from threading import Lock
 from time import time
 
 import numpy as np
-import torch
 from PIL import Image
 from loguru import logger
 
+from app.Services.text_presence import TextPresenceClassifier
 from app.config import config
+from app.util.device import resolve_device
 
 
-class OCRService:
+class OCRService(ABC):
+    """
+    OCR models are loaded by load(), or on the first ocr_interface() call.
+    ocr_batch() processes several images at once. Backends without a batched API run them one by one.
+    """
+    # Batched backends need images of the same size, the others work on the images as they are
+    pad_images = True
+
     def __init__(self):
-        self._device = config.device
-        if self._device == "auto":
-            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._device = None
+        self._load_lock = Lock()
+        self._loaded = False
+        self._images = 0
+        self._batches = 0
+        self._busy_time = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            self._device = resolve_device(config.device)
+            self._load_model()
+            self._loaded = True
+
+    def _load_model(self):
+        pass
 
     @staticmethod
-    def _image_preprocess(img: Image.Image) -> Image.Image:
+    def _image_preprocess(img: Image.Image, pad: bool = True) -> Image.Image:
         if img.mode != 'RGB':
             img = img.convert('RGB')
         if img.size[0] > 1024 or img.size[1] > 1024:
             img.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
+        if not pad:
+            return img
         new_img = Image.new('RGB', (1024, 1024), (0, 0, 0))
         new_img.paste(img, ((1024 - img.size[0]) // 2, (1024 - img.size[1]) // 2))
         return new_img
 
+    @abstractmethod
+    def _process(self, img: Image.Image) -> str:
+        """
+        Recognize the text of a single preprocessed image.
+        """
+
+    def _process_batch(self, images: list[Image.Image]) -> list[str]:
+        return [self._process(t) for t in images]
+
     def ocr_interface(self, img: Image.Image, need_preprocess=True) -> str:
-        pass
+        return self.ocr_batch([img], need_preprocess)[0]
+
+    def ocr_batch(self, images: list[Image.Image], need_preprocess=True) -> list[str]:
+        if not images:
+            return []
+        self.load()
+        start_time = time()
+        logger.info("Processing text of {} image(s) with {}...", len(images), type(self).__name__)
+        if need_preprocess:
+            images = [self._image_preprocess(t, self.pad_images) for t in images]
+        res = self._process_batch(images)
+        elapsed = time() - start_time
+        self._images += len(images)
+        self._batches += 1
+        self._busy_time += elapsed
+        logger.success("OCR processed done. Time elapsed: {:.2f}s", elapsed)
+        return res
+
+    def get_stats(self) -> dict:
+        return {
+            "images": self._images,
+            "batches": self._batches,
+            "busy_seconds": self._busy_time,
+        }
 
 
 class EasyPaddleOCRService(OCRService):
+    pad_images = False
+
     def __init__(self):
         super().__init__()
+        self._paddle_ocr_module = None
+
+    def _load_model(self):
         from easypaddleocr import EasyPaddleOCR
         self._paddle_ocr_module = EasyPaddleOCR(use_angle_cls=True, needWarmUp=True, devices=self._device)
         logger.success("EasyPaddleOCR loaded successfully")
 
-    def _easy_paddleocr_process(self, img: Image.Image) -> str:
+    def _process(self, img: Image.Image) -> str:
         _, ocr_result, _ = self._paddle_ocr_module.ocr(np.array(img))
         if ocr_result:
             return "".join(itm[0] for itm in ocr_result if float(itm[1]) > config.ocr_search.ocr_min_confidence)
         return ""
 
-    def ocr_interface(self, img: Image.Image, need_preprocess=True) -> str:
-        start_time = time()
-        logger.info("Processing text with EasyPaddleOCR...")
-        res = self._easy_paddleocr_process(self._image_preprocess(img) if need_preprocess else img)
-        logger.success("OCR processed done. Time elapsed: {:.2f}s", time() - start_time)
-        return res
-
 
 class EasyOCRService(OCRService):
     def __init__(self):
         super().__init__()
+        self._easy_ocr_module = None
+
+    def _load_model(self):
         # noinspection PyPackageRequirements
         import easyocr  # pylint: disable=import-error
         self._easy_ocr_module = easyocr.Reader(config.ocr_search.ocr_language,
                                                gpu=self._device == "cuda")
         logger.success("easyOCR loaded successfully")
 
-    def _easyocr_process(self, img: Image.Image) -> str:
-        ocr_result = self._easy_ocr_module.readtext(np.array(img))
+    @staticmethod
+    def _join_results(ocr_result) -> str:
         return " ".join(itm[1] for itm in ocr_result if itm[2] > config.ocr_search.ocr_min_confidence)
 
-    def ocr_interface(self, img: Image.Image, need_preprocess=True) -> str:
-        start_time = time()
-        logger.info("Processing text with easyOCR...")
-        res = self._easyocr_process(self._image_preprocess(img) if need_preprocess else img)
-        logger.success("OCR processed done. Time elapsed: {:.2f}s", time() - start_time)
-        return res
+    def _process(self, img: Image.Image) -> str:
+        return self._join_results(self._easy_ocr_module.readtext(np.array(img)))
+
+    def _process_batch(self, images: list[Image.Image]) -> list[str]:
+        # readtext_batched needs images of the same size, which the padding guarantees for preprocessed images
+        if len(images) == 1 or len({t.size for t in images}) > 1:
+            return super()._process_batch(images)
+        results = self._easy_ocr_module.readtext_batched([np.array(t) for t in images], batch_size=len(images))
+        return [self._join_results(t) for t in results]
 
 
 class PaddleOCRService(OCRService):
+    pad_images = False
+
     def __init__(self):
         super().__init__()
+        self._paddle_ocr_module = None
+
+    def _load_model(self):
         # noinspection PyPackageRequirements
         import paddleocr  # pylint: disable=import-error
         self._paddle_ocr_module = paddleocr.PaddleOCR(lang="ch", use_angle_cls=True,
                                                       use_gpu=self._device == "cuda")
         logger.success("PaddleOCR loaded successfully")
 
-    def _paddleocr_process(self, img: Image.Image) -> str:
+    def _process(self, img: Image.Image) -> str:
         ocr_result = self._paddle_ocr_module.ocr(np.array(img), cls=True)
         if ocr_result[0]:
             return "".join(itm[1][0] for itm in ocr_result[0] if itm[1][1] > config.ocr_search.ocr_min_confidence)
         return ""
 
-    def ocr_interface(self, img: Image.Image, need_preprocess=True) -> str:
-        start_time = time()
-        logger.info("Processing text with PaddleOCR...")
-        res = self._paddleocr_process(self._image_preprocess(img) if need_preprocess else img)
-        logger.success("OCR processed done. Time elapsed: {:.2f}s", time() - start_time)
-        return res
-
 
 class DisabledOCRService(OCRService):
     def __init__(self):
         super().__init__()
+        self._loaded = True
         logger.warning("OCR search is disabled. Skipping OCR model loading.")
 
-    def ocr_interface(self, img: Image.Image, need_preprocess=True) -> str:
+    def load(self):
+        pass
+
+    def _process(self, img: Image.Image) -> str:
         raise NotImplementedError("OCR module is disabled. Consider enable it in config.")
+
+    def ocr_batch(self, images: list[Image.Image], need_preprocess=True) -> list[str]:
+        raise NotImplementedError("OCR module is disabled. Consider enable it in config.")
+
+
+def recognize_texts(ocr_service: OCRService, images: list[Image.Image], image_vectors: list[np.ndarray],
+                    text_presence: TextPresenceClassifier | None = None) -> tuple[list[str | None], int]:
+    """
+    OCR a batch of images, skipping the ones the text presence classifier sees no text in.
+    :return: The text of each image, None if there is none or if it was skipped, and the number of skipped images.
+    """
+    if text_presence is not None:
+        mask = text_presence.has_text(np.stack(image_vectors))
+    else:
+        mask = np.ones(len(images), dtype=bool)
+    texts = iter(ocr_service.ocr_batch([t for t, has_text in zip(images, mask) if has_text]))
+    return [(next(texts) or None) if has_text else None for has_text in mask], int(np.count_nonzero(~mask))
@@ -0,0 +1,203 @@
+import os
+import re
+from functools import wraps
+from pathlib import Path
+
+from PIL import Image
+from loguru import logger
+from numpy import ndarray
+
+from app.Services.transformers_service import TransformersService
+from app.config import config, OnnxSettings
+from app.util.clip_preprocessing import ClipImagePreprocessor
+
+OPSET_VERSION = 17
+
+
+def _onnx_inference(method):
+    """
+    Load the models on first use.
+    """
+
+    @wraps(method)
+    def wrapper(self: 'OnnxTransformersService', *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _export(module, args: tuple, input_names: list[str], dynamic_axes: dict, path: Path):
+    import torch  # pylint: disable=import-outside-toplevel
+
+    logger.info("Exporting {} to ONNX...", path.name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    with torch.no_grad():
+        torch.onnx.export(module.eval(), args, str(temporary_path), input_names=input_names, output_names=['vectors'],
+                          dynamic_axes=dynamic_axes | {'vectors': {0: 'batch'}}, opset_version=OPSET_VERSION,
+                          dynamo=False)
+    os.replace(temporary_path, path)
+
+
+def _quantize(source: Path, path: Path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType  # pylint: disable=import-error,C0415
+
+    logger.info("Quantizing {} to int8...", source.name)
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    quantize_dynamic(str(source), str(temporary_path), weight_type=QuantType.QInt8)
+    os.replace(temporary_path, path)
+
+
+class OnnxTransformersService(TransformersService):
+    """
+    Runs the CLIP towers and BERT with ONNX Runtime instead of PyTorch. The models are exported from their PyTorch
+    weights on first load, with the vector normalization (CLIP) and mean pooling (BERT) in the exported graphs, and are
+    kept in the cache directory for the next starts. With `quantize`, int8 dynamically quantized copies are used.
+    """
+
+    def __init__(self, settings: OnnxSettings, model_role: str = "full"):
+        super().__init__(model_role)
+        self._settings = settings
+        self._sessions = {}
+
+    def _resolve_device(self) -> str:
+        import onnxruntime  # pylint: disable=import-error,import-outside-toplevel
+
+        if config.device == "auto":
+            return "cuda" if "CUDAExecutionProvider" in onnxruntime.get_available_providers() else "cpu"
+        return config.device
+
+    def _model_path(self, model_name: str, name: str, quantized: bool) -> Path:
+        directory = Path(self._settings.cache_path) / re.sub(r'[^\w.-]+', '_', model_name.strip('/'))
+        return directory / (f"{name}.int8.onnx" if quantized else f"{name}.onnx")
+
+    def _create_session(self, path: Path):
+        import onnxruntime  # pylint: disable=import-error,import-outside-toplevel
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self._settings.intra_op_threads:
+            options.intra_op_num_threads = self._settings.intra_op_threads
+        if self._settings.inter_op_threads:
+            options.inter_op_num_threads = self._settings.inter_op_threads
+        providers = ["CUDAExecutionProvider", "CPUExecutionProvider"] if self.device == "cuda" \
+            else ["CPUExecutionProvider"]
+        return onnxruntime.InferenceSession(str(path), options, providers=providers)
+
+    def _prepare_models(self, model_name: str, names: list[str], export_fn) -> dict[str, Path]:
+        """
+        Export the models if they are not in the cache yet, and quantize them if enabled.
+        :return: Paths of the models to run, by name.
+        """
+        paths = {t: self._model_path(model_name, t, False) for t in names}
+        if not all(t.exists() for t in paths.values()):
+            export_fn(paths)
+        if not self._settings.quantize:
+            return paths
+        quantized_paths = {t: self._model_path(model_name, t, True) for t in names}
+        for name, path in quantized_paths.items():
+            if not path.exists():
+                _quantize(paths[name], path)
+        return quantized_paths
+
+    @staticmethod
+    def _export_clip(paths: dict[str, Path]):
+        import torch  # pylint: disable=import-outside-toplevel
+        from transformers import CLIPModel, CLIPProcessor  # pylint: disable=import-outside-toplevel
+
+        class VisionTower(torch.nn.Module):
+            def __init__(self, model: CLIPModel):
+                super().__init__()
+                self.model = model
+
+            def forward(self, pixel_values):
+                features = self.model.get_image_features(pixel_values=pixel_values)
+                return features / features.norm(dim=-1, keepdim=True)
+
+        class TextTower(torch.nn.Module):
+            def __init__(self, model: CLIPModel):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask):
+                features = self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+                return features / features.norm(dim=-1, keepdim=True)
+
+        model = CLIPModel.from_pretrained(config.clip.model)
+        processor = CLIPProcessor.from_pretrained(config.clip.model)
+        image_inputs = processor(images=[Image.new("RGB", (224, 224))], return_tensors="pt")
+        _export(VisionTower(model), (image_inputs['pixel_values'],), ['pixel_values'],
+                {'pixel_values': {0: 'batch'}}, paths['clip_vision'])
+        text_inputs = processor(text=["a photo of a cat", "a"], padding=True, return_tensors="pt")
+        _export(TextTower(model), (text_inputs['input_ids'], text_inputs['attention_mask']),
+                ['input_ids', 'attention_mask'],
+                {'input_ids': {0: 'batch', 1: 'sequence'}, 'attention_mask': {0: 'batch', 1: 'sequence'}},
+                paths['clip_text'])
+
+    @staticmethod
+    def _export_bert(paths: dict[str, Path]):
+        import torch  # pylint: disable=import-outside-toplevel
+        from transformers import BertModel, BertTokenizer  # pylint: disable=import-outside-toplevel
+
+        class MeanPooledBert(torch.nn.Module):
+            def __init__(self, model: BertModel):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+                # Same pooling as TransformersService.get_bert_vectors
+                mask = attention_mask.unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+                return (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
+
+        model = BertModel.from_pretrained(config.ocr_search.bert_model)
+        tokenizer = BertTokenizer.from_pretrained(config.ocr_search.bert_model)
+        inputs = tokenizer(["some text", "a"], padding=True, return_tensors="pt")
+        axes = {0: 'batch', 1: 'sequence'}
+        _export(MeanPooledBert(model), (inputs['input_ids'], inputs['attention_mask'], inputs['token_type_ids']),
+                ['input_ids', 'attention_mask', 'token_type_ids'],
+                {'input_ids': axes, 'attention_mask': axes, 'token_type_ids': axes}, paths['bert'])
+
+    def _load_clip(self):
+        from transformers import CLIPProcessor  # pylint: disable=import-outside-toplevel
+
+        self.clip_processor = CLIPProcessor.from_pretrained(config.clip.model)
+        self.clip_image_preprocessor = ClipImagePreprocessor(
+            self.clip_processor.image_processor)  # pylint: disable=no-member
+        paths = self._prepare_models(config.clip.model, ['clip_vision', 'clip_text'], self._export_clip)
+        # Both towers are exported, but only the ones of the model role are loaded
+        if self.has_vision_tower:
+            self._sessions['clip_vision'] = self._create_session(paths['clip_vision'])
+        if self.has_text_tower:
+            self._sessions['clip_text'] = self._create_session(paths['clip_text'])
+        logger.success("CLIP Model loaded successfully with ONNX Runtime")
+
+    def _load_bert(self):
+        from transformers import BertTokenizer  # pylint: disable=import-outside-toplevel
+
+        self.bert_tokenizer = BertTokenizer.from_pretrained(config.ocr_search.bert_model)
+        paths = self._prepare_models(config.ocr_search.bert_model, ['bert'], self._export_bert)
+        self._sessions['bert'] = self._create_session(paths['bert'])
+        logger.success("BERT Model loaded successfully with ONNX Runtime")
+
+    def _run(self, name: str, inputs) -> ndarray:
+        session = self._sessions[name]
+        # Inputs are matched by name, the exporter drops the ones the graph doesn't use
+        return session.run(None, {t.name: inputs[t.name] for t in session.get_inputs()})[0]
+
+    @_onnx_inference
+    def get_image_vectors(self, images: list[Image.Image]) -> ndarray:
+        self.require_vision_tower()
+        return self._run('clip_vision', {'pixel_values': self.clip_image_preprocessor(images)})
+
+    @_onnx_inference
+    def get_text_vectors(self, texts: list[str]) -> ndarray:
+        self.require_text_tower()
+        return self._run('clip_text', self.clip_processor(text=texts, padding=True, truncation=True,
+                                                          return_tensors="np"))
+
+    @_onnx_inference
+    def get_bert_vectors(self, texts: list[str]) -> ndarray:
+        return self._run('bert', self.bert_tokenizer([t.strip().lower() for t in texts], padding=True, truncation=True,
+                                                     return_tensors="np"))
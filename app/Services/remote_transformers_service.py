@@ -0,0 +1,146 @@
+import json
+import socket
+from queue import SimpleQueue, Empty
+from time import monotonic, sleep
+
+import numpy as np
+from PIL import Image
+from loguru import logger
+from numpy import ndarray
+
+from app.Services.inference_scheduler import InferenceQueueFullError
+from app.Services.inference_server import FRAME_HEADER, encode_message, encode_images
+from app.Services.transformers_service import TransformersService, ModelUnavailableError
+from app.config import InferenceServerSettings
+
+_CONNECT_RETRY_INTERVAL = 0.5
+
+
+class RemoteInferenceError(RuntimeError):
+    pass
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionResetError("The inference server closed the connection.")
+        received += count
+    return buffer
+
+
+def _recv_message(sock: socket.socket) -> tuple[dict, bytearray]:
+    header_size, payload_size = FRAME_HEADER.unpack(_recv_exactly(sock, FRAME_HEADER.size))
+    header = json.loads(_recv_exactly(sock, header_size))
+    return header, _recv_exactly(sock, payload_size)
+
+
+class RemoteTransformersService(TransformersService):
+    """
+    Sends the inputs to the inference server (`python main.py --inference-server`) instead of running the models, so
+    that the server workers share the models loaded once by the inference server. The calls block like the ones of
+    the local backends, each thread uses its own connection from a pool.
+    load() waits for the inference server and takes its model role.
+    """
+
+    def __init__(self, settings: InferenceServerSettings, model_role: str = "full"):
+        super().__init__(model_role)
+        self._settings = settings
+        self._connections: SimpleQueue[socket.socket] = SimpleQueue()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self._settings.timeout)
+            sock.connect(self._settings.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _request(self, header: dict, payload: bytes = b"") -> tuple[dict, bytearray]:
+        message = encode_message(header, payload)
+        try:
+            sock = self._connections.get_nowait()
+            reused = True
+        except Empty:
+            try:
+                sock = self._connect()
+            except OSError as e:
+                raise RemoteInferenceError(f"Cannot connect to the inference server: {e}") from e
+            reused = False
+        try:
+            sock.sendall(message)
+            response, response_payload = _recv_message(sock)
+        except OSError as e:
+            sock.close()
+            # A pooled connection may have been closed by a restart of the inference server, retry on a new one
+            if not reused or isinstance(e, TimeoutError):
+                raise RemoteInferenceError(f"Inference server request failed: {e}") from e
+            return self._request(header, payload)
+        self._connections.put(sock)
+        match response.get("error"):
+            case None:
+                return response, response_payload
+            case "queue_full":
+                raise InferenceQueueFullError(response["queue"])
+            case "model_unavailable":
+                raise ModelUnavailableError(response["message"])
+            case _:
+                raise RemoteInferenceError(response["message"])
+
+    def _request_vectors(self, header: dict, payload: bytes = b"") -> ndarray:
+        response, response_payload = self._request(header, payload)
+        return np.frombuffer(response_payload, dtype=np.float32).reshape(response["shape"])
+
+    def load(self):
+        """
+        Connect to the inference server, waiting up to `connect_timeout` seconds for it to start.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            deadline = monotonic() + self._settings.connect_timeout
+            logger.info("Connecting to the inference server at {}...", self._settings.socket_path)
+            while True:
+                try:
+                    response, _ = self._request({"method": "info"})
+                    break
+                except RemoteInferenceError as e:
+                    if monotonic() > deadline:
+                        raise RemoteInferenceError(
+                            f"Inference server at {self._settings.socket_path} is not available: {e}") from e
+                    sleep(_CONNECT_RETRY_INTERVAL)
+            if response["model_role"] != self.model_role:
+                logger.warning("The inference server runs the {} model role, not the configured {} role.",
+                               response["model_role"], self.model_role)
+                self.model_role = response["model_role"]
+            self._loaded = True
+            logger.success("Connected to the inference server, model role: {}", self.model_role)
+
+    def get_image_vectors(self, images: list[Image.Image]) -> ndarray:
+        self.load()
+        self.require_vision_tower()
+        header, payload = encode_images(images)
+        return self._request_vectors({"method": "clip_image"} | header, payload)
+
+    def get_text_vectors(self, texts: list[str]) -> ndarray:
+        self.load()
+        self.require_text_tower()
+        return self._request_vectors({"method": "clip_text", "texts": texts})
+
+    def get_bert_vectors(self, texts: list[str]) -> ndarray:
+        self.load()
+        return self._request_vectors({"method": "bert", "texts": texts})
+
+    def close(self):
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except Empty:
+                break
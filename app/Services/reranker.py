@@ -0,0 +1,74 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+from numpy import ndarray
+
+from app.Models.search_result import SearchResult
+
+
+class Reranker(ABC):
+    """
+    Re-scores search candidates by the similarity of one of their vectors with a query vector, then sorts them.
+    Subclasses decide how the similarity is combined with the original score.
+    """
+
+    @abstractmethod
+    def combine(self, scores: ndarray, similarities: ndarray) -> ndarray:
+        """
+        :param scores: Original scores of the candidates.
+        :param similarities: Cosine similarities of the candidates with the query vector.
+        :return: The new scores of the candidates.
+        """
+
+    def rerank(self, results: list[SearchResult], candidates: ndarray, query_vector: ndarray) -> list[SearchResult]:
+        """
+        Re-score and sort the results with a single matrix-vector product.
+        :param candidates: Float32 matrix of the candidate vectors, one row per result. Rows must be normalized,
+                           which holds for vectors read from a Qdrant collection with cosine distance. Zero rows are
+                           candidates without that vector.
+        :param query_vector: Query vector, normalized here.
+        """
+        if not results:
+            return results
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        similarities = candidates @ (query_vector / np.linalg.norm(query_vector))
+        scores = self.combine(np.fromiter((t.score for t in results), dtype=np.float32, count=len(results)),
+                              similarities)
+        order = np.argsort(-scores, kind='stable')
+        reranked = []
+        for i in order:
+            results[i].score = float(scores[i])
+            reranked.append(results[i])
+        return reranked
+
+
+class ProductReranker(Reranker):
+    """
+    Multiplies the original score by the similarity.
+    """
+
+    def combine(self, scores: ndarray, similarities: ndarray) -> ndarray:
+        return scores * similarities
+
+
+class WeightedSumReranker(Reranker):
+    """
+    Weighted sum of the original score and the similarity.
+    """
+
+    def __init__(self, weight: float):
+        self.weight = weight
+
+    def combine(self, scores: ndarray, similarities: ndarray) -> ndarray:
+        return (1 - self.weight) * scores + self.weight * similarities
+
+
+def stack_vectors(vectors: list[ndarray | None], size: int) -> ndarray:
+    """
+    Stack vectors into a float32 matrix, with zero rows for missing vectors.
+    """
+    matrix = np.zeros((len(vectors), size), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector is not None:
+            matrix[i] = vector
+    return matrix
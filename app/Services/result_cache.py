@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Hashable
+from uuid import UUID, uuid4
+
+from app.Models.search_result import SearchResult
+from app.util.lru_cache import LRUCache
+
+# Rough memory cost of one cached result: the id string, its float score and the list slots
+_RESULT_SIZE = 120
+_ENTRY_OVERHEAD = 200
+
+
+@dataclass(frozen=True)
+class CachedQuery:
+    ids: tuple[str, ...]
+    scores: tuple[float, ...]
+    # Whether the search returned fewer results than asked for, so there is nothing past the cached results
+    complete: bool
+    # Signature of the search, which the cursors pointing into the results must be used with
+    signature: Hashable | None = None
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ResultCache:
+    """
+    Cache of ranked search results keyed by query_id. Only ids and scores are stored, payloads are fetched again when
+    a page is served, so they are always up to date.
+    Identical searches are mapped to the same query_id through their signature, so they are served from the cache too.
+    """
+
+    def __init__(self, max_memory_bytes: int, ttl: float | None = None):
+        self._queries: LRUCache[UUID, CachedQuery] = LRUCache(
+            max_memory_bytes, lambda _, query: _ENTRY_OVERHEAD + _RESULT_SIZE * len(query), ttl)
+        # Signatures are small, they get a fraction of the memory budget
+        self._signatures: LRUCache[Hashable, UUID] = LRUCache(
+            max(max_memory_bytes // 16, 1), lambda signature, _: _ENTRY_OVERHEAD + len(repr(signature)), ttl)
+
+    def get(self, query_id: UUID) -> CachedQuery | None:
+        return self._queries.get(query_id)
+
+    def find(self, signature: Hashable) -> tuple[UUID, CachedQuery] | None:
+        query_id = self._signatures.get(signature)
+        if query_id is None:
+            return None
+        query = self._queries.get(query_id)
+        if query is None:
+            self._signatures.pop(signature)
+            return None
+        return query_id, query
+
+    def put(self, results: list[SearchResult], requested_count: int, signature: Hashable | None = None) -> UUID:
+        """
+        Cache the results of a search which asked for `requested_count` results, and return its new query_id.
+        """
+        query_id = uuid4()
+        self._queries.put(query_id, CachedQuery(ids=tuple(str(t.img.id) for t in results),
+                                                scores=tuple(t.score for t in results),
+                                                complete=len(results) < requested_count,
+                                                signature=signature))
+        if signature is not None:
+            self._signatures.put(signature, query_id)
+        return query_id
+
+    def extend(self, query_id: UUID, query: CachedQuery, results: list[SearchResult],
+               requested_count: int) -> CachedQuery:
+        """
+        Append the next results of a cached search, which asked for `requested_count` results past the cached ones.
+        """
+        complete = len(results) < requested_count
+        # The ranking may have shifted slightly since the first search, don't serve the same image twice
+        known_ids = set(query.ids)
+        results = [t for t in results if str(t.img.id) not in known_ids]
+        extended = CachedQuery(ids=query.ids + tuple(str(t.img.id) for t in results),
+                               scores=query.scores + tuple(t.score for t in results),
+                               complete=complete,
+                               signature=query.signature)
+        self._queries.put(query_id, extended)
+        return extended
+
+    def clear(self):
+        for cache in (self._queries, self._signatures):
+            cache.clear()
+
+    def get_stats(self) -> dict:
+        return self._queries.get_stats()
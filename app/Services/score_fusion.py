@@ -0,0 +1,44 @@
+from app.Models.search_result import SearchResult
+
+# Constant of reciprocal rank fusion, which dampens the weight of the first ranks.
+# 60 is the value of the original paper.
+RRF_K = 60
+
+
+def _fuse(result_lists: list[list[SearchResult]], contributions: list[list[float]]) -> list[SearchResult]:
+    fused: dict[str, SearchResult] = {}
+    scores: dict[str, float] = {}
+    for results, result_contributions in zip(result_lists, contributions):
+        for result, contribution in zip(results, result_contributions):
+            key = str(result.img.id)
+            fused.setdefault(key, result)
+            scores[key] = scores.get(key, 0.0) + contribution
+    for key, result in fused.items():
+        result.score = scores[key]
+    return sorted(fused.values(), key=lambda t: t.score, reverse=True)
+
+
+def reciprocal_rank_fusion(result_lists: list[list[SearchResult]], weights: list[float],
+                           k: int = RRF_K) -> list[SearchResult]:
+    """
+    Fuse ranked result lists by summing the weighted reciprocal ranks of each result. Only ranks matter, so the lists
+    may come from searches whose scores are not comparable.
+    """
+    return _fuse(result_lists, [[weight / (k + rank) for rank in range(1, len(results) + 1)]
+                                for results, weight in zip(result_lists, weights)])
+
+
+def weighted_score_fusion(result_lists: list[list[SearchResult]], weights: list[float]) -> list[SearchResult]:
+    """
+    Fuse result lists by summing the weighted scores of each result. Scores are min-max normalized in each list first,
+    since similarities of different models have different ranges.
+    """
+    contributions = []
+    for results, weight in zip(result_lists, weights):
+        if not results:
+            contributions.append([])
+            continue
+        high, low = max(t.score for t in results), min(t.score for t in results)
+        spread = high - low
+        contributions.append([weight * ((t.score - low) / spread if spread > 0 else 1.0) for t in results])
+    return _fuse(result_lists, contributions)
@@ -0,0 +1,51 @@
+import asyncio
+
+from app.Models.img_data import ImageData
+from app.Services.storage.base import BaseStorage, StoredFileInfo
+from app.config import StorageSettings, StaticFileSettings
+from app.util.image_decoding import DecodedImage
+from app.util.thumbnails import create_indexed_thumbnail, thumbnail_key, thumbnail_url
+
+STATIC_URL_PREFIX = '/static/'
+
+
+def create_storage(settings: StorageSettings, static_file: StaticFileSettings) -> BaseStorage:
+    match settings.method:
+        case "local":
+            from app.Services.storage.local_storage import LocalStorage
+
+            return LocalStorage(static_file.path, settings.max_concurrent_transfers)
+        case "s3":
+            from app.Services.storage.s3_storage import S3Storage
+
+            return S3Storage(settings.s3, settings.max_concurrent_transfers)
+        case _:
+            raise NotImplementedError(f"Storage method {settings.method} not implemented.")
+
+
+def static_url(key: str) -> str:
+    return STATIC_URL_PREFIX + key
+
+
+def static_key(url: str) -> str | None:
+    """
+    :return: The storage key of a stored image's url, or None if the image is hosted elsewhere.
+    """
+    return url.removeprefix(STATIC_URL_PREFIX) if url.startswith(STATIC_URL_PREFIX) else None
+
+
+async def store_indexed_images(storage: BaseStorage, batch: list[tuple[DecodedImage, ImageData]], move: bool = False):
+    """
+    Store the files of newly indexed images along with their thumbnails, which are encoded from the already decoded
+    pixels. The files are transferred concurrently.
+    :param move: Remove the source files once they are stored.
+    """
+    thumbnails = await asyncio.to_thread(
+        lambda: [create_indexed_thumbnail(decoded.image, decoded.file_size) for decoded, _ in batch])
+    transfers = []
+    for (decoded, imgdata), thumbnail in zip(batch, thumbnails):
+        transfers.append(storage.upload_file(decoded.path, static_key(imgdata.url), move=move))
+        if thumbnail is not None:
+            transfers.append(storage.upload_bytes(thumbnail, thumbnail_key(imgdata.id)))
+            imgdata.thumbnail_url = thumbnail_url(imgdata.id)
+    await storage.run_transfers(transfers)
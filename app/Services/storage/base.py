@@ -0,0 +1,80 @@
+import asyncio
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Iterable
+
+
+@dataclass(frozen=True)
+class StoredFileInfo:
+    size: int
+    # Modification time, as a POSIX timestamp
+    mtime: float
+
+
+class BaseStorage(ABC):
+    """
+    Storage of the image files and thumbnails. Files are addressed by keys relative to the storage root, such as
+    `{id}.jpg` or `thumbnails/{id}.webp`, and are served to clients under `/static/{key}`.
+    """
+
+    def __init__(self, max_concurrent_transfers: int):
+        self.max_concurrent_transfers = max_concurrent_transfers
+
+    @abstractmethod
+    async def stat(self, key: str) -> StoredFileInfo | None:
+        """
+        :return: The size and modification time of the file, or None if it doesn't exist.
+        """
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    @abstractmethod
+    async def upload_file(self, local_path: Path, key: str, move: bool = False):
+        """
+        Store a local file. With `move`, the local file is removed afterwards.
+        """
+
+    @abstractmethod
+    async def upload_bytes(self, data: bytes, key: str):
+        pass
+
+    @abstractmethod
+    async def download_file(self, key: str, local_path: Path):
+        pass
+
+    @abstractmethod
+    async def move(self, key: str, new_key: str):
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+    def local_path(self, key: str) -> Path | None:
+        """
+        :return: The path of the file if it is stored in the local filesystem, so it can be read without copying it.
+        """
+        return None
+
+    async def presign_url(self, key: str) -> str | None:
+        """
+        :return: A URL clients can fetch the file from directly, or None if it is served by this server.
+        """
+        return None
+
+    async def run_transfers(self, transfers: Iterable[Awaitable], return_exceptions: bool = False) -> list[Any]:
+        """
+        Run transfers concurrently, at most `max_concurrent_transfers` at a time.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_transfers)
+
+        async def run(transfer: Awaitable):
+            async with semaphore:
+                return await transfer
+
+        return await asyncio.gather(*[run(t) for t in transfers], return_exceptions=return_exceptions)
+
+    async def close(self):
+        pass
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import shutil
+from pathlib import Path
+
+from app.Services.storage.base import BaseStorage, StoredFileInfo
+
+
+class LocalStorage(BaseStorage):
+    def __init__(self, root: str, max_concurrent_transfers: int):
+        super().__init__(max_concurrent_transfers)
+        self.root = Path(root).resolve()
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root):
+            raise ValueError(f"Storage key {key} is outside of the storage root.")
+        return path
+
+    def local_path(self, key: str) -> Path:
+        return self._path(key)
+
+    async def stat(self, key: str) -> StoredFileInfo | None:
+        try:
+            stat = self._path(key).stat()
+        except FileNotFoundError:
+            return None
+        return StoredFileInfo(size=stat.st_size, mtime=stat.st_mtime)
+
+    @staticmethod
+    def _copy(local_path: Path, path: Path, move: bool):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if move:
+            shutil.move(local_path, path)
+        else:
+            shutil.copy2(local_path, path)
+
+    async def upload_file(self, local_path: Path, key: str, move: bool = False):
+        await asyncio.to_thread(self._copy, local_path, self._path(key), move)
+
+    @staticmethod
+    def _write(data: bytes, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    async def upload_bytes(self, data: bytes, key: str):
+        await asyncio.to_thread(self._write, data, self._path(key))
+
+    async def download_file(self, key: str, local_path: Path):
+        await asyncio.to_thread(shutil.copyfile, self._path(key), local_path)
+
+    @staticmethod
+    def _move(path: Path, new_path: Path):
+        new_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, new_path)
+
+    async def move(self, key: str, new_key: str):
+        await asyncio.to_thread(self._move, self._path(key), self._path(new_key))
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._path(key).unlink, missing_ok=True)
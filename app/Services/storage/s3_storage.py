@@ -0,0 +1,100 @@
+import asyncio
+import mimetypes
+from contextlib import AsyncExitStack
+from pathlib import Path
+
+from loguru import logger
+
+from app.Services.storage.base import BaseStorage, StoredFileInfo
+from app.config import S3StorageSettings
+
+
+class S3Storage(BaseStorage):
+    """
+    Storage in an S3-compatible bucket, such as AWS S3 or MinIO. Large files are uploaded in parts, concurrently.
+    """
+
+    def __init__(self, settings: S3StorageSettings, max_concurrent_transfers: int):
+        # Only needed with this backend
+        import aioboto3  # pylint: disable=import-error
+        from boto3.s3.transfer import TransferConfig  # pylint: disable=import-error
+
+        super().__init__(max_concurrent_transfers)
+        self._settings = settings
+        self._bucket = settings.bucket
+        self._prefix = settings.path_prefix.strip('/') + '/' if settings.path_prefix.strip('/') else ''
+        self._session = aioboto3.Session()
+        self._transfer_config = TransferConfig(multipart_threshold=int(settings.multipart_threshold_mb * 1024 * 1024),
+                                               multipart_chunksize=int(settings.multipart_chunk_mb * 1024 * 1024),
+                                               max_concurrency=max_concurrent_transfers)
+        self._exit_stack = AsyncExitStack()
+        self._client = None
+        self._client_lock = asyncio.Lock()
+        logger.info("Using S3 storage in bucket {} at {}", self._bucket, settings.endpoint_url or "AWS")
+
+    async def _get_client(self):
+        # The client keeps a connection pool, so it is created once and shared by all transfers
+        async with self._client_lock:
+            if self._client is None:
+                self._client = await self._exit_stack.enter_async_context(self._session.client(
+                    's3', endpoint_url=self._settings.endpoint_url, region_name=self._settings.region,
+                    aws_access_key_id=self._settings.access_key_id,
+                    aws_secret_access_key=self._settings.secret_access_key))
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return self._prefix + key
+
+    @staticmethod
+    def _extra_args(key: str) -> dict:
+        content_type = mimetypes.guess_type(key)[0]
+        return {'ContentType': content_type} if content_type else {}
+
+    async def stat(self, key: str) -> StoredFileInfo | None:
+        from botocore.exceptions import ClientError  # pylint: disable=import-error
+
+        client = await self._get_client()
+        try:
+            response = await client.head_object(Bucket=self._bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return StoredFileInfo(size=response['ContentLength'], mtime=response['LastModified'].timestamp())
+
+    async def upload_file(self, local_path: Path, key: str, move: bool = False):
+        client = await self._get_client()
+        await client.upload_file(str(local_path), self._bucket, self._key(key), ExtraArgs=self._extra_args(key),
+                                 Config=self._transfer_config)
+        if move:
+            local_path.unlink()
+
+    async def upload_bytes(self, data: bytes, key: str):
+        client = await self._get_client()
+        await client.put_object(Bucket=self._bucket, Key=self._key(key), Body=data, **self._extra_args(key))
+
+    async def download_file(self, key: str, local_path: Path):
+        client = await self._get_client()
+        await client.download_file(self._bucket, self._key(key), str(local_path), Config=self._transfer_config)
+
+    async def move(self, key: str, new_key: str):
+        client = await self._get_client()
+        await client.copy_object(Bucket=self._bucket, Key=self._key(new_key),
+                                 CopySource={'Bucket': self._bucket, 'Key': self._key(key)})
+        await client.delete_object(Bucket=self._bucket, Key=self._key(key))
+
+    async def delete(self, key: str):
+        client = await self._get_client()
+        await client.delete_object(Bucket=self._bucket, Key=self._key(key))
+
+    async def presign_url(self, key: str) -> str:
+        if self._settings.public_url:
+            return f"{self._settings.public_url.rstrip('/')}/{self._key(key)}"
+        client = await self._get_client()
+        return await client.generate_presigned_url('get_object',
+                                                   Params={'Bucket': self._bucket, 'Key': self._key(key)},
+                                                   ExpiresIn=self._settings.presign_expire_seconds)
+
+    async def close(self):
+        await self._exit_stack.aclose()
+        self._client = None
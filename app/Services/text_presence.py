@@ -0,0 +1,69 @@
+from threading import Lock
+from time import perf_counter
+
+import numpy as np
+from numpy import ndarray
+
+from app.Services.transformers_service import TransformersService
+
+# Zero-shot classes of the pre-classifier. An image is sent to OCR when the text prompts get enough of the probability.
+TEXT_PROMPTS = ["a photo of text", "a screenshot", "a document", "a sign with words on it", "a poster with text",
+                "a comic page with speech bubbles", "a meme with a caption"]
+NO_TEXT_PROMPTS = ["a photo", "a photo of a landscape", "a photo of a person", "a photo of an animal",
+                   "an illustration", "a photo of an object"]
+# Temperature of CLIP's zero-shot classification
+LOGIT_SCALE = 100.0
+
+
+class TextPresenceClassifier:
+    """
+    Guesses whether images contain text from their CLIP image vectors, which are computed for indexing anyway, so that
+    OCR, by far the slowest stage of indexing, can be skipped on the photos without any text.
+    The prompt vectors are computed on first use, which needs the CLIP text tower.
+    """
+
+    def __init__(self, transformers_service: TransformersService, threshold: float):
+        self._service = transformers_service
+        self.threshold = threshold
+        self._prompt_vectors: ndarray | None = None
+        self._lock = Lock()
+        self._checked = 0
+        self._skipped = 0
+        self._busy_time = 0.0
+
+    def _get_prompt_vectors(self) -> ndarray:
+        if self._prompt_vectors is None:
+            with self._lock:
+                if self._prompt_vectors is None:
+                    self._prompt_vectors = np.asarray(
+                        self._service.get_text_vectors(TEXT_PROMPTS + NO_TEXT_PROMPTS), dtype=np.float32)
+        return self._prompt_vectors
+
+    def text_probabilities(self, image_vectors: ndarray) -> ndarray:
+        """
+        :param image_vectors: Normalized CLIP image vectors, one row per image.
+        :return: Probability that each image contains text.
+        """
+        logits = LOGIT_SCALE * (np.asarray(image_vectors, dtype=np.float32) @ self._get_prompt_vectors().T)
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities[:, :len(TEXT_PROMPTS)].sum(axis=1) / probabilities.sum(axis=1)
+
+    def has_text(self, image_vectors: ndarray) -> ndarray:
+        """
+        :return: Boolean mask of the images which may contain text and should go through OCR.
+        """
+        start_time = perf_counter()
+        mask = self.text_probabilities(np.atleast_2d(image_vectors)) >= self.threshold
+        self._busy_time += perf_counter() - start_time
+        self._checked += len(mask)
+        self._skipped += int(np.count_nonzero(~mask))
+        return mask
+
+    def get_stats(self) -> dict:
+        return {
+            "checked": self._checked,
+            "skipped": self._skipped,
+            "skip_rate": self._skipped / self._checked if self._checked else 0.0,
+            "busy_seconds": self._busy_time,
+        }
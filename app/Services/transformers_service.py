@@ -1,71 +1,208 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from threading import Lock
 from time import time
 
 import numpy as np
-import torch
 from PIL import Image
 from loguru import logger
 from numpy import ndarray
-from torch import FloatTensor, no_grad
-from transformers import CLIPProcessor, CLIPModel, BertTokenizer, BertModel
 
 from app.config import config
+from app.util.clip_preprocessing import ClipImagePreprocessor
+from app.util.device import resolve_device
+
+
+# Which CLIP towers are loaded: both, or only the one needed by text search nodes or by image search/indexing nodes
+MODEL_ROLES = ("full", "text", "vision")
+
+
+class ModelUnavailableError(Exception):
+    pass
+
+
+def _inference(method):
+    """
+    Load the models on first use, and run the method without gradient tracking.
+    """
+
+    @wraps(method)
+    def wrapper(self: 'TransformersService', *args, **kwargs):
+        self.load()
+        import torch
+
+        with torch.no_grad():
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class TransformersService:
-    def __init__(self):
-        self.device = config.device
-        if self.device == "auto":
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info("Using device: {}; CLIP Model: {}, BERT Model: {}",
-                    self.device, config.clip.model, config.ocr_search.bert_model)
-        self.clip_model = CLIPModel.from_pretrained(config.clip.model).to(self.device)
-        self.clip_processor = CLIPProcessor.from_pretrained(config.clip.model)
-        logger.success("CLIP Model loaded successfully")
-        if config.ocr_search.enable:
-            self.bert_model = BertModel.from_pretrained(config.ocr_search.bert_model).to(self.device)
-            self.bert_tokenizer = BertTokenizer.from_pretrained(config.ocr_search.bert_model)
-            logger.success("BERT Model loaded successfully")
+    """
+    The CLIP and BERT models. They are loaded by load(), or on first use, so creating this service and importing this
+    module stay cheap: torch and transformers are only imported then.
+    The model role selects the CLIP towers to load. Text search nodes only need the text tower, and the vision tower
+    is most of CLIP's weights, so the "text" role lets more workers fit on a host. Calls needing a tower that isn't
+    loaded raise ModelUnavailableError.
+    """
+
+    def __init__(self, model_role: str = "full"):
+        if model_role not in MODEL_ROLES:
+            raise ValueError(f"Unknown model role {model_role}, expected one of {', '.join(MODEL_ROLES)}.")
+        self.model_role = model_role
+        self.device = None
+        # Both towers in the full role, otherwise only one of the tower models
+        self.clip_model = None
+        self.clip_text_model = None
+        self.clip_vision_model = None
+        self.clip_processor = None
+        self.clip_image_preprocessor = None
+        self.bert_model = None
+        self.bert_tokenizer = None
+        self._load_lock = Lock()
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def has_text_tower(self) -> bool:
+        return self.model_role != "vision"
+
+    @property
+    def has_vision_tower(self) -> bool:
+        return self.model_role != "text"
+
+    def require_text_tower(self):
+        if not self.has_text_tower:
+            raise ModelUnavailableError("Text search is not available on this server, which only loads the CLIP "
+                                        "vision model.")
+
+    def require_vision_tower(self):
+        if not self.has_vision_tower:
+            raise ModelUnavailableError("Image search and indexing are not available on this server, which only loads "
+                                        "the CLIP text model.")
+
+    def _resolve_device(self) -> str:
+        return resolve_device(config.device)
+
+    def _load_clip(self):
+        # pylint: disable=import-outside-toplevel
+        from transformers import CLIPProcessor, CLIPModel, CLIPConfig, CLIPTextModelWithProjection, \
+            CLIPVisionModelWithProjection
+
+        if self.model_role == "full":
+            self.clip_model = CLIPModel.from_pretrained(config.clip.model).to(self.device)
         else:
-            logger.info("OCR search is disabled. Skipping OCR and BERT model loading.")
+            # Some checkpoints only set the projection size at the top level of the config
+            clip_config = CLIPConfig.from_pretrained(config.clip.model)
+            if self.model_role == "text":
+                clip_config.text_config.projection_dim = clip_config.projection_dim
+                self.clip_text_model = CLIPTextModelWithProjection.from_pretrained(
+                    config.clip.model, config=clip_config.text_config).to(self.device)
+            else:
+                clip_config.vision_config.projection_dim = clip_config.projection_dim
+                self.clip_vision_model = CLIPVisionModelWithProjection.from_pretrained(
+                    config.clip.model, config=clip_config.vision_config).to(self.device)
+        self.clip_processor = CLIPProcessor.from_pretrained(config.clip.model)
+        self.clip_image_preprocessor = ClipImagePreprocessor(
+            self.clip_processor.image_processor)  # pylint: disable=no-member
+        logger.success("CLIP Model loaded successfully, role: {}", self.model_role)
+
+    def _load_bert(self):
+        from transformers import BertTokenizer, BertModel  # pylint: disable=import-outside-toplevel
+
+        self.bert_model = BertModel.from_pretrained(config.ocr_search.bert_model).to(self.device)
+        self.bert_tokenizer = BertTokenizer.from_pretrained(config.ocr_search.bert_model)
+        logger.success("BERT Model loaded successfully")
+
+    def load(self):
+        """
+        Load the models, CLIP and BERT in parallel. Does nothing if they are already loaded.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            start_time = time()
+            self.device = self._resolve_device()
+            # transformers resolves its classes lazily, which isn't thread-safe, so they are resolved here first
+            # pylint: disable=unused-import,import-outside-toplevel
+            from transformers import CLIPProcessor, CLIPModel, CLIPConfig, CLIPTextModelWithProjection, \
+                CLIPVisionModelWithProjection, BertTokenizer, BertModel
+            logger.info("Using device: {}; CLIP Model: {}, BERT Model: {}",
+                        self.device, config.clip.model, config.ocr_search.bert_model)
+            # Most of the loading time is spent reading the weights and initializing the tensors, which release the GIL
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-loading") as executor:
+                futures = [executor.submit(self._load_clip)]
+                if config.ocr_search.enable:
+                    futures.append(executor.submit(self._load_bert))
+                else:
+                    logger.info("OCR search is disabled. Skipping OCR and BERT model loading.")
+                for future in futures:
+                    future.result()
+            self._loaded = True
+            logger.success("Models loaded in {:.2f}s", time() - start_time)
 
-    @no_grad()
     def get_image_vector(self, image: Image.Image) -> ndarray:
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        logger.info("Processing image...")
+        return self.get_image_vectors([image])[0]
+
+    @_inference
+    def get_image_vectors(self, images: list[Image.Image]) -> ndarray:
+        self.require_vision_tower()
+        import torch
+
+        logger.info("Processing {} image(s)...", len(images))
         start_time = time()
-        inputs = self.clip_processor(images=image, return_tensors="pt").to(self.device)
+        pixel_values = torch.from_numpy(self.clip_image_preprocessor(images)).to(self.device)
         logger.success("Image processed, now inferencing with CLIP model...")
-        outputs: FloatTensor = self.clip_model.get_image_features(**inputs)
+        outputs = self.clip_model.get_image_features(pixel_values=pixel_values) if self.clip_model is not None \
+            else self.clip_vision_model(pixel_values=pixel_values).image_embeds
         logger.success("Inference done. Time elapsed: {:.2f}s", time() - start_time)
-        logger.info("Norm: {}", outputs.norm(dim=-1).item())
         outputs /= outputs.norm(dim=-1, keepdim=True)
-        return outputs.numpy(force=True).reshape(-1)
+        return outputs.numpy(force=True)
 
-    @no_grad()
     def get_text_vector(self, text: str) -> ndarray:
-        logger.info("Processing text...")
+        return self.get_text_vectors([text])[0]
+
+    @_inference
+    def get_text_vectors(self, texts: list[str]) -> ndarray:
+        self.require_text_tower()
+        logger.info("Processing {} text(s)...", len(texts))
         start_time = time()
-        inputs = self.clip_processor(text=text, return_tensors="pt").to(self.device)
+        inputs = self.clip_processor(text=texts, padding=True, truncation=True, return_tensors="pt").to(self.device)
         logger.success("Text processed, now inferencing with CLIP model...")
-        outputs: FloatTensor = self.clip_model.get_text_features(**inputs)
+        outputs = self.clip_model.get_text_features(**inputs) if self.clip_model is not None \
+            else self.clip_text_model(**inputs).text_embeds
         logger.success("Inference done. Time elapsed: {:.2f}s", time() - start_time)
-        logger.info("Norm: {}", outputs.norm(dim=-1).item())
         outputs /= outputs.norm(dim=-1, keepdim=True)
-        return outputs.numpy(force=True).reshape(-1)
+        return outputs.numpy(force=True)
 
-    @no_grad()
     def get_bert_vector(self, text: str) -> ndarray:
+        return self.get_bert_vectors([text])[0]
+
+    @_inference
+    def get_bert_vectors(self, texts: list[str]) -> ndarray:
         start_time = time()
-        logger.info("Inferencing with BERT model...")
-        inputs = self.bert_tokenizer(text.strip().lower(), return_tensors="pt").to(self.device)
+        logger.info("Inferencing {} text(s) with BERT model...", len(texts))
+        inputs = self.bert_tokenizer([t.strip().lower() for t in texts], padding=True, truncation=True,
+                                     return_tensors="pt").to(self.device)
         outputs = self.bert_model(**inputs)
-        vector = outputs.last_hidden_state.mean(dim=1).squeeze()
+        # Mean pooling over real tokens only, so padded batches give the same vectors as single inputs
+        mask = inputs['attention_mask'].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+        vectors = (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
         logger.success("BERT inference done. Time elapsed: {:.2f}s", time() - start_time)
-        return vector.cpu().numpy()
+        return vectors.cpu().numpy()
 
     @staticmethod
-    def get_random_vector() -> ndarray:
-        vec = np.random.rand(768)
+    def get_random_vector(seed: int | None = None) -> ndarray:
+        vec = np.random.default_rng(seed).random(768)
         vec -= vec.mean()
         return vec
+
+    def close(self):
+        """
+        Release the connections held by a remote backend. Local models are released with the process.
+        """
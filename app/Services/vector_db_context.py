@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import AsyncGenerator, Optional
 
 import numpy
 from loguru import logger
@@ -9,7 +9,7 @@ from qdrant_client.models import RecommendStrategy
 
 from app.Models.api_model import SearchModelEnum, SearchBasisEnum
 from app.Models.img_data import ImageData
-from app.Models.query_params import FilterParams
+from app.Models.query_params import FilterParams, SearchAccuracyParams
 from app.Models.search_result import SearchResult
 from app.config import config
 
@@ -40,18 +40,88 @@ class VectorDbContext:
         return ImageData.from_payload(result[0].id, result[0].payload,
                                       numpy.array(result[0].vector, dtype=numpy.float32) if with_vectors else None)
 
+    async def retrieve_by_ids(self, image_ids: list[str]) -> list[ImageData]:
+        """
+        Retrieve items by their ids, in the order of the given ids. Ids not found in the database are skipped.
+        """
+        logger.info("Retrieving {} items from database...", len(image_ids))
+        result = await self.client.retrieve(collection_name=self.collection_name, ids=image_ids, with_payload=True,
+                                            with_vectors=False)
+        points = {str(t.id): t for t in result}
+        return [ImageData.from_payload(points[t].id, points[t].payload) for t in image_ids if t in points]
+
     async def querySearch(self, query_vector, query_vector_name: str = IMG_VECTOR,
-                          top_k=10, skip=0, filter_param: FilterParams | None = None) -> list[SearchResult]:
+                          top_k=10, skip=0, filter_param: FilterParams | None = None,
+                          accuracy_param: SearchAccuracyParams | None = None) -> list[SearchResult]:
         logger.info("Querying Qdrant... top_k = {}", top_k)
         result = await self.client.search(collection_name=self.collection_name,
-                                          query_vector=(query_vector_name, query_vector),
+                                          query_vector=(query_vector_name, query_vector.tolist()),
                                           query_filter=self.getFiltersByFilterParam(filter_param),
+                                          search_params=self.getSearchParamsByAccuracyParam(accuracy_param),
                                           limit=top_k,
                                           offset=skip,
                                           with_payload=True)
         logger.success("Query completed!")
         return [SearchResult(img=ImageData.from_payload(t.id, t.payload), score=t.score) for t in result]
 
+    async def querySearchBatch(self, queries: list[tuple[str, numpy.ndarray]],
+                               top_k=10, skip=0, filter_param: FilterParams | None = None,
+                               accuracy_param: SearchAccuracyParams | None = None) -> list[list[SearchResult]]:
+        """
+        Run several searches in one round-trip.
+        :param queries: Tuples of (vector name, query vector).
+        :return: The results of each query, in the same order.
+        """
+        logger.info("Querying Qdrant with {} searches... top_k = {}", len(queries), top_k)
+        query_filter = self.getFiltersByFilterParam(filter_param)
+        search_params = self.getSearchParamsByAccuracyParam(accuracy_param)
+        results = await self.client.search_batch(collection_name=self.collection_name, requests=[
+            models.SearchRequest(vector=models.NamedVector(name=name, vector=vector.tolist()),
+                                 filter=query_filter,
+                                 params=search_params,
+                                 limit=top_k,
+                                 offset=skip,
+                                 with_payload=True)
+            for name, vector in queries])
+        logger.success("Query completed!")
+        return [[SearchResult(img=ImageData.from_payload(t.id, t.payload), score=t.score) for t in result]
+                for result in results]
+
+    async def querySimilarBatch(self, queries: list[tuple[str, str]],
+                                top_k=10, filter_param: FilterParams | None = None,
+                                accuracy_param: SearchAccuracyParams | None = None) -> list[list[SearchResult]]:
+        """
+        Search items similar to several items in one round-trip.
+        :param queries: Tuples of (vector name, item id).
+        :return: The results of each query, in the same order.
+        :raises PointNotFoundError: If one of the items doesn't exist.
+        """
+        logger.info("Querying Qdrant with {} recommendations... top_k = {}", len(queries), top_k)
+        query_filter = self.getFiltersByFilterParam(filter_param)
+        search_params = self.getSearchParamsByAccuracyParam(accuracy_param)
+        try:
+            results = await self.client.recommend_batch(collection_name=self.collection_name, requests=[
+                models.RecommendRequest(positive=[search_id],
+                                        using=name,
+                                        filter=query_filter,
+                                        params=search_params,
+                                        limit=top_k,
+                                        with_payload=True)
+                for name, search_id in queries])
+        except Exception as e:
+            # The error of an unknown item depends on the client transport, so look for one only when the batch fails
+            search_ids = list({search_id for _, search_id in queries})
+            found = await self.client.retrieve(collection_name=self.collection_name, ids=search_ids,
+                                               with_payload=False, with_vectors=False)
+            found_ids = {str(t.id) for t in found}
+            for search_id in search_ids:
+                if search_id not in found_ids:
+                    raise PointNotFoundError(search_id) from e
+            raise
+        logger.success("Query completed!")
+        return [[SearchResult(img=ImageData.from_payload(t.id, t.payload), score=t.score) for t in result]
+                for result in results]
+
     async def querySimilar(self,
                            query_vector_name: str = IMG_VECTOR,
                            search_id: Optional[str] = None,
@@ -60,15 +130,16 @@ class VectorDbContext:
                            mode: Optional[SearchModelEnum] = None,
                            with_vectors: bool = False,
                            filter_param: FilterParams | None = None,
+                           accuracy_param: SearchAccuracyParams | None = None,
                            top_k: int = 10,
                            skip: int = 0) -> list[SearchResult]:
         _positive_vectors = [t.tolist() for t in positive_vectors] if positive_vectors is not None else [search_id]
         _negative_vectors = [t.tolist() for t in negative_vectors] if negative_vectors is not None else None
         _strategy = None if mode is None else (RecommendStrategy.AVERAGE_VECTOR if
                                                mode == SearchModelEnum.average else RecommendStrategy.BEST_SCORE)
-        # since only combined_search need return vectors, We can define _combined_search_need_vectors like below
+        # Only combined search needs vectors, and only the ones of the other basis, to re-rank the results
         _combined_search_need_vectors = [
-            self.IMG_VECTOR if query_vector_name == self.TEXT_VECTOR else self.IMG_VECTOR] if with_vectors else None
+            self.IMG_VECTOR if query_vector_name == self.TEXT_VECTOR else self.TEXT_VECTOR] if with_vectors else None
         logger.info("Querying Qdrant... top_k = {}", top_k)
         result = await self.client.recommend(collection_name=self.collection_name,
                                              using=query_vector_name,
@@ -77,24 +148,30 @@ class VectorDbContext:
                                              strategy=_strategy,
                                              with_vectors=_combined_search_need_vectors,
                                              query_filter=self.getFiltersByFilterParam(filter_param),
+                                             search_params=self.getSearchParamsByAccuracyParam(accuracy_param),
                                              limit=top_k,
                                              offset=skip,
                                              with_payload=True)
         logger.success("Query completed!")
 
-        def result_transform(t):
-            return SearchResult(
-                img=ImageData.from_payload(
-                    t.id,
-                    t.payload,
-                    numpy.array(t.vector['image_vector']) if t.vector and 'image_vector' in t.vector else None,
-                    numpy.array(
-                        t.vector['text_contain_vector']) if t.vector and 'text_contain_vector' in t.vector else None
-                ),
-                score=t.score
-            )
+        vectors = {name: self._stackVectors(result, name) for name in _combined_search_need_vectors or []}
+        return [SearchResult(img=ImageData.from_payload(t.id, t.payload,
+                                                        vectors.get(self.IMG_VECTOR, {}).get(i),
+                                                        vectors.get(self.TEXT_VECTOR, {}).get(i)),
+                             score=t.score)
+                for i, t in enumerate(result)]
 
-        return [result_transform(t) for t in result]
+    @staticmethod
+    def _stackVectors(points: list[models.ScoredPoint], name: str) -> dict[int, numpy.ndarray]:
+        """
+        Convert the given vector of the points into a single float32 matrix, and map the index of each point which has
+        that vector to its row.
+        """
+        indices = [i for i, t in enumerate(points) if t.vector and name in t.vector]
+        if not indices:
+            return {}
+        matrix = numpy.array([points[i].vector[name] for i in indices], dtype=numpy.float32)
+        return dict(zip(indices, matrix))
 
     async def insertItems(self, items: list[ImageData]):
         logger.info("Inserting {} items into Qdrant...", len(items))
@@ -139,6 +216,38 @@ class VectorDbContext:
                                                  wait=True)
         logger.success("Update completed! Status: {}", response.status)
 
+    async def updatePayloadFields(self, updates: list[tuple[str, dict]]):
+        """
+        Set some payload fields of several items in a single request. Other fields are left unchanged.
+        :param updates: Tuples of (item id, payload fields to set).
+        """
+        logger.info("Updating the payload of {} items...", len(updates))
+        await self.client.batch_update_points(collection_name=self.collection_name,
+                                              update_operations=[
+                                                  models.SetPayloadOperation(set_payload=models.SetPayload(
+                                                      payload=payload, points=[item_id]))
+                                                  for item_id, payload in updates],
+                                              wait=True)
+        logger.success("Update completed!")
+
+    async def scrollPayloads(self, fields: list[str],
+                             batch_size: int = 1000) -> AsyncGenerator[tuple[str, dict], None]:
+        """
+        Iterate over every item in the database, only retrieving the given payload fields.
+        :return: An async generator of (id, payload).
+        """
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(collection_name=self.collection_name,
+                                                      limit=batch_size,
+                                                      offset=offset,
+                                                      with_payload=fields,
+                                                      with_vectors=False)
+            for point in points:
+                yield point.id, point.payload
+            if offset is None:
+                break
+
     @classmethod
     def getVectorByBasis(cls, basis: SearchBasisEnum) -> str:
         match basis:
@@ -149,6 +258,24 @@ class VectorDbContext:
             case _:
                 raise ValueError("Invalid basis")
 
+    @staticmethod
+    def getSearchParamsByAccuracyParam(accuracy_param: SearchAccuracyParams | None) -> models.SearchParams | None:
+        hnsw_ef = config.qdrant.search_hnsw_ef
+        exact = config.qdrant.search_exact
+        rescore = config.qdrant.search_rescore
+        if accuracy_param is not None:
+            hnsw_ef = accuracy_param.hnsw_ef if accuracy_param.hnsw_ef is not None else hnsw_ef
+            exact = accuracy_param.exact if accuracy_param.exact is not None else exact
+            rescore = accuracy_param.rescore if accuracy_param.rescore is not None else rescore
+
+        if hnsw_ef is None and not exact and rescore is None:
+            return None
+        return models.SearchParams(
+            hnsw_ef=hnsw_ef,
+            exact=exact,
+            quantization=models.QuantizationSearchParams(rescore=rescore) if rescore is not None else None
+        )
+
     @staticmethod
     def getFiltersByFilterParam(filter_param: FilterParams | None) -> models.Filter | None:
         if filter_param is None:
@@ -9,6 +9,9 @@ class QdrantSettings(BaseModel):
     coll: str = ''
     prefer_grpc: bool = False
     api_key: str | None = None
+    search_hnsw_ef: int | None = None
+    search_exact: bool = False
+    search_rescore: bool | None = None
 
 
 class ClipSettings(BaseModel):
@@ -21,6 +24,95 @@ class OCRSearchSettings(BaseModel):
     ocr_module: str = 'easypaddleocr'
     ocr_language: list[str] = ['ch_sim', 'en']
     ocr_min_confidence: float = 1e-2
+    # Skip OCR on the images that CLIP doesn't see any text in, see TextPresenceClassifier
+    skip_textless_images: bool = False
+    text_presence_threshold: float = 0.1
+
+
+class SearchSettings(BaseModel):
+    combined_candidate_factor: float = 3
+    combined_min_candidates: int = 30
+    combined_max_candidates: int = 500
+
+
+class InferenceSettings(BaseModel):
+    max_batch_size: int = 32
+    max_wait_ms: float = 5
+    workers: int = 1
+    max_queue_size: int = 256
+    preload_models: bool = True
+    # "torch", "onnx", or "remote" to call the inference server
+    backend: str = 'torch'
+    # CLIP towers to load: "full", "text" or "vision", see TransformersService
+    model_role: str = 'full'
+
+
+class OnnxSettings(BaseModel):
+    cache_path: str = './data/onnx'
+    quantize: bool = False
+    # 0 lets ONNX Runtime choose
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+
+
+class InferenceServerSettings(BaseModel):
+    socket_path: str = './data/inference.sock'
+    # Backend the inference server runs the models with, "torch" or "onnx"
+    backend: str = 'torch'
+    # Seconds to wait for a reply, and for the server to come up when connecting
+    timeout: float = 60
+    connect_timeout: float = 120
+
+
+class EmbeddingCacheSettings(BaseModel):
+    enable: bool = True
+    max_memory_mb: float = 64
+    ttl_seconds: float | None = None
+    disk_path: str | None = None
+
+
+class ResultCacheSettings(BaseModel):
+    enable: bool = True
+    max_memory_mb: float = 16
+    ttl_seconds: float | None = 600
+    prefetch_count: int = 200
+
+
+class IndexingSettings(BaseModel):
+    decode_workers: int = 4
+    clip_batch_size: int = 16
+    ocr_batch_size: int = 8
+    upload_batch_size: int = 64
+    queue_size: int = 64
+    manifest_path: str = './data/index_manifest.sqlite3'
+    skip_near_duplicates: bool = False
+    near_duplicate_threshold: int = 4
+
+
+class IngestionSettings(BaseModel):
+    enable: bool = False
+    spool_path: str = './data/ingestion'
+    batch_size: int = 16
+    max_concurrent_jobs: int = 2
+    max_file_size_mb: float = 50
+    max_upload_size_mb: float = 500
+    download_timeout: float = 30
+
+
+class ThumbnailSettings(BaseModel):
+    size: int = 256
+    format: str = 'webp'
+    quality: int = 80
+    min_file_size_kb: float = 500
+    workers: int = 4
+    update_batch_size: int = 64
+
+
+class ImageServingSettings(BaseModel):
+    cache_path: str = './data/image_cache'
+    max_cache_mb: float = 1024
+    max_width: int = 2048
+    cache_max_age: int = 7 * 24 * 3600
 
 
 class StaticFileSettings(BaseModel):
@@ -28,11 +120,44 @@ class StaticFileSettings(BaseModel):
     enable: bool = True
 
 
+class S3StorageSettings(BaseModel):
+    bucket: str = 'nekoimg'
+    # Leave empty for AWS, or the URL of any S3-compatible server such as MinIO
+    endpoint_url: str | None = None
+    region: str | None = None
+    access_key_id: str | None = None
+    secret_access_key: str | None = None
+    path_prefix: str = ''
+    # Base URL of a public bucket or CDN. Files are linked there instead of through presigned URLs when set.
+    public_url: str | None = None
+    presign_expire_seconds: int = 3600
+    multipart_threshold_mb: float = 8
+    multipart_chunk_mb: float = 8
+
+
+class StorageSettings(BaseModel):
+    # "local" stores files under static_file.path, "s3" in an S3-compatible bucket
+    method: str = 'local'
+    max_concurrent_transfers: int = 8
+    s3: S3StorageSettings = S3StorageSettings()
+
+
 class Config(BaseSettings):
     qdrant: QdrantSettings = QdrantSettings()
     clip: ClipSettings = ClipSettings()
     ocr_search: OCRSearchSettings = OCRSearchSettings()
     static_file: StaticFileSettings = StaticFileSettings()
+    storage: StorageSettings = StorageSettings()
+    search: SearchSettings = SearchSettings()
+    inference: InferenceSettings = InferenceSettings()
+    onnx: OnnxSettings = OnnxSettings()
+    inference_server: InferenceServerSettings = InferenceServerSettings()
+    embedding_cache: EmbeddingCacheSettings = EmbeddingCacheSettings()
+    result_cache: ResultCacheSettings = ResultCacheSettings()
+    indexing: IndexingSettings = IndexingSettings()
+    ingestion: IngestionSettings = IngestionSettings()
+    thumbnail: ThumbnailSettings = ThumbnailSettings()
+    image_serving: ImageServingSettings = ImageServingSettings()
 
     device: str = 'auto'
     cors_origins: set[str] = {'*'}
@@ -49,6 +174,7 @@ class Config(BaseSettings):
 
 class Environment(BaseModel):
     local_indexing: bool = False
+    inference_server: bool = False
 
 
 config = Config()
@@ -0,0 +1,73 @@
+from typing import Callable, Generic, TypeVar
+
+V = TypeVar('V')
+
+
+class BKTree(Generic[V]):
+    """
+    Burkhard-Keller tree over integer keys under a metric distance, such as the hamming distance of perceptual hashes.
+    Finding every key within a small distance of a query only visits a fraction of the tree.
+    """
+
+    def __init__(self, distance: Callable[[int, int], int]):
+        self._distance = distance
+        # Each node is (key, values, children keyed by their distance to this node)
+        self._root: tuple[int, list[V], dict[int, tuple]] | None = None
+        self._size = 0
+
+    def add(self, key: int, value: V):
+        self._size += 1
+        if self._root is None:
+            self._root = (key, [value], {})
+            return
+        node = self._root
+        while True:
+            distance = self._distance(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (key, [value], {})
+                return
+            node = child
+
+    def remove(self, key: int, value: V) -> bool:
+        """
+        Remove one entry. The node of the key stays in the tree, as its children are placed by their distance to it.
+        :return: Whether the entry was found.
+        """
+        node = self._root
+        while node is not None:
+            distance = self._distance(key, node[0])
+            if distance == 0:
+                if value not in node[1]:
+                    return False
+                node[1].remove(value)
+                self._size -= 1
+                return True
+            node = node[2].get(distance)
+        return False
+
+    def search(self, key: int, max_distance: int) -> list[tuple[int, int, V]]:
+        """
+        Find every entry within max_distance of key.
+        :return: A list of (distance, key, value).
+        """
+        if self._root is None:
+            return []
+        result = []
+        stack = [self._root]
+        while stack:
+            node_key, values, children = stack.pop()
+            distance = self._distance(key, node_key)
+            if distance <= max_distance:
+                result.extend((distance, node_key, value) for value in values)
+            # By the triangle inequality, matches can only be in children within this range
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return result
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,53 @@
+import numpy as np
+from PIL import Image
+from numpy import ndarray
+
+
+class ClipImagePreprocessor:
+    """
+    Same preprocessing as the CLIP image processor of transformers: resize the shortest side, center crop, rescale and
+    normalize, with the parameters read from it. The resize and crop run in Pillow's C code on each image, and the
+    normalization in a single NumPy operation on the whole batch, instead of the per-image float copies of the
+    transformers implementation.
+    """
+
+    def __init__(self, image_processor):
+        size = image_processor.size
+        self.shortest_edge = size["shortest_edge"] if "shortest_edge" in size else None
+        self.size = (size["width"], size["height"]) if self.shortest_edge is None else None
+        crop_size = image_processor.crop_size
+        self.crop_size = (crop_size["width"], crop_size["height"]) if image_processor.do_center_crop else None
+        self.resample = Image.Resampling(image_processor.resample)
+        scale = image_processor.rescale_factor if image_processor.do_rescale else 1.0
+        mean = np.array(image_processor.image_mean if image_processor.do_normalize else [0.0] * 3, dtype=np.float32)
+        std = np.array(image_processor.image_std if image_processor.do_normalize else [1.0] * 3, dtype=np.float32)
+        # (x * scale - mean) / std, folded into a single multiply-add
+        self._multiplier = (scale / std).astype(np.float32)
+        self._offset = (-mean / std).astype(np.float32)
+
+    def output_size(self, width: int, height: int) -> tuple[int, int]:
+        if self.shortest_edge is None:
+            return self.size
+        if width <= height:
+            return self.shortest_edge, int(self.shortest_edge * height / width)
+        return int(self.shortest_edge * width / height), self.shortest_edge
+
+    def resize_and_crop(self, image: Image.Image) -> Image.Image:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        size = self.output_size(*image.size)
+        if size != image.size:
+            image = image.resize(size, self.resample)
+        if self.crop_size is not None and self.crop_size != image.size:
+            left = (image.width - self.crop_size[0]) // 2
+            top = (image.height - self.crop_size[1]) // 2
+            image = image.crop((left, top, left + self.crop_size[0], top + self.crop_size[1]))
+        return image
+
+    def __call__(self, images: list[Image.Image]) -> ndarray:
+        """
+        :return: Float32 pixel values of the images, in NCHW layout.
+        """
+        pixels = np.stack([np.asarray(self.resize_and_crop(t)) for t in images])
+        pixel_values = pixels.astype(np.float32) * self._multiplier + self._offset
+        return np.ascontiguousarray(pixel_values.transpose(0, 3, 1, 2))
@@ -0,0 +1,9 @@
+def resolve_device(device: str) -> str:
+    """
+    Resolve the "auto" device setting. Torch is imported here rather than at module level, as it is slow to import.
+    """
+    if device != "auto":
+        return device
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
@@ -0,0 +1,111 @@
+import os
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from time import monotonic, time
+
+from loguru import logger
+
+
+class DiskLRUCache:
+    """
+    A directory of files bounded by their total size, evicting the least recently used ones.
+    The access times of the files record their use, so the index can be rebuilt from the directory: on startup, so
+    the cache survives restarts, and every `rescan_interval` seconds when adding files, so several processes (like
+    the server workers) share the directory and its size limit. In between, the files added by the other processes
+    may push the directory a little over its limit.
+    """
+
+    def __init__(self, directory: str, max_size: int, rescan_interval: float = 10):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.rescan_interval = rescan_interval
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        self._last_scan = 0.0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._lock:
+            self._rescan()
+            self._evict()
+
+    def _rescan(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((max(stat.st_atime, stat.st_mtime), entry.name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self._size = sum(self._entries.values())
+        self._last_scan = monotonic()
+
+    def get(self, name: str) -> Path | None:
+        path = self.directory / name
+        try:
+            # Records the use for the other processes and the next startup
+            os.utime(path, (time(), path.stat().st_mtime))
+            found = True
+        except FileNotFoundError:
+            found = False
+        with self._lock:
+            if not found:
+                # Never added, or evicted by another process
+                if name in self._entries:
+                    self._size -= self._entries.pop(name)
+                self.misses += 1
+                return None
+            if name not in self._entries:
+                # Added by another process
+                self._entries[name] = path.stat().st_size
+                self._size += self._entries[name]
+            self._entries.move_to_end(name)
+            self.hits += 1
+        return path
+
+    def temporary_path(self, name: str) -> Path:
+        """
+        A path to write a new entry to, before adding it with put(). Hidden files are ignored by the cache.
+        """
+        return self.directory / f".{name}.{os.getpid()}.tmp"
+
+    def put(self, name: str, temporary_path: Path) -> Path:
+        path = self.directory / name
+        size = temporary_path.stat().st_size
+        os.replace(temporary_path, path)
+        with self._lock:
+            if monotonic() - self._last_scan > self.rescan_interval:
+                self._rescan()
+            if name in self._entries:
+                self._size -= self._entries.pop(name)
+            self._entries[name] = size
+            self._size += size
+            self._evict()
+        return path
+
+    def _evict(self):
+        # Never evict the entry just added, even if it is larger than the whole cache
+        while self._size > self.max_size and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                (self.directory / name).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning("Failed to remove cached file {}: {}", name, e)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_size_bytes": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
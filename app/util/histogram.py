@@ -0,0 +1,32 @@
+from bisect import bisect_left
+from threading import Lock
+
+
+class Histogram:
+    """
+    A thread-safe, non-cumulative histogram with fixed buckets. Each observation is counted in the first bucket whose
+    upper bound is greater than or equal to the value, values larger than every bound go to the `+Inf` bucket.
+    """
+
+    def __init__(self, bounds: list[float]):
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect_left(self.bounds, value)] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            buckets = {f"<={bound:g}": count for bound, count in zip(self.bounds, self._counts)}
+            buckets["+Inf"] = self._counts[-1]
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "buckets": buckets,
+            }
@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from hashlib import sha256
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image
+
+from app.util.perceptual_hash import phash
+
+# OCR works on images no larger than this, and CLIP only needs 224px, so there is no need to keep more pixels.
+INDEXING_MAX_SIZE = 1024
+# CLIP resizes the shortest side to 224px, decoding at twice that keeps the downscaling quality of a full decode
+CLIP_DECODE_MIN_SIZE = 448
+
+
+@dataclass
+class DecodedImage:
+    path: Path
+    image: Image.Image
+    width: int
+    height: int
+    content_hash: str
+    file_size: int
+    mtime: float
+    phash: int
+    format: str
+
+
+def decode_image_for_indexing(path: Path) -> DecodedImage:
+    """
+    Decode an image file into a RGB image no larger than INDEXING_MAX_SIZE on each side.
+    The returned width and height are the size of the original image, and content_hash is the SHA-256 of the file.
+    The perceptual hash is computed here as well, while the image is at hand.
+    This function is meant to run in a worker process, so it must stay free of heavy imports.
+    """
+    stat = path.stat()
+    content = path.read_bytes()
+    with Image.open(BytesIO(content)) as img:
+        width, height = img.size
+        image_format = img.format
+        img.draft('RGB', (INDEXING_MAX_SIZE, INDEXING_MAX_SIZE))
+        img = img.convert('RGB')
+    img.thumbnail((INDEXING_MAX_SIZE, INDEXING_MAX_SIZE), Image.Resampling.LANCZOS)
+    return DecodedImage(path=path, image=img, width=width, height=height, content_hash=sha256(content).hexdigest(),
+                        file_size=stat.st_size, mtime=stat.st_mtime, phash=phash(img),
+                        format=image_format)
+
+
+def decode_image_for_clip(file: BinaryIO, min_size: int = CLIP_DECODE_MIN_SIZE) -> Image.Image:
+    """
+    Decode an image for CLIP only, reduced to the smallest size whose shortest side is still at least `min_size`.
+    JPEG images are decoded at a reduced scale directly (draft mode), which skips most of the decoding work of large
+    photos, other formats are downscaled by an integer factor right after decoding.
+    """
+    with Image.open(file) as img:
+        img.draft('RGB', (min_size, min_size))
+        img = img.convert('RGB')
+    factor = min(img.size) // min_size
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
@@ -0,0 +1,41 @@
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+_DCT_SIZE = HASH_SIZE * 4
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    # Orthonormal DCT-II matrix, so that the 2D DCT of x is M @ x @ M.T
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def phash(image: Image.Image) -> int:
+    """
+    Compute the 64-bit perceptual hash of an image: the signs of its lowest DCT frequencies compared to their median.
+    Re-encoded or resized copies of an image have hashes within a small hamming distance of each other.
+    """
+    pixels = np.asarray(image.convert('L').resize((_DCT_SIZE, _DCT_SIZE), Image.Resampling.LANCZOS),
+                        dtype=np.float64)
+    low_freq = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    bits = (low_freq > np.median(low_freq)).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def phash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def phash_from_hex(value: str) -> int:
+    return int(value, 16)
@@ -0,0 +1,40 @@
+import base64
+import json
+from dataclasses import dataclass
+from uuid import UUID
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class SearchCursor:
+    """
+    Position in the results of a search. Clients only see it as an opaque string.
+    """
+    offset: int
+    # The cached results the cursor points into, if any
+    query_id: UUID | None = None
+    # Seed of the random vector, so a random pick can be scrolled through
+    seed: int | None = None
+
+    def encode(self) -> str:
+        data = {"o": self.offset}
+        if self.query_id is not None:
+            data["q"] = self.query_id.hex
+        if self.seed is not None:
+            data["s"] = self.seed
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, cursor: str) -> 'SearchCursor':
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            offset = data["o"]
+            seed = data.get("s")
+            if not isinstance(offset, int) or offset < 0 or not (seed is None or isinstance(seed, int)):
+                raise InvalidCursorError("Malformed cursor.")
+            return cls(offset=offset, query_id=UUID(hex=data["q"]) if "q" in data else None, seed=seed)
+        except (ValueError, TypeError, KeyError) as e:
+            raise InvalidCursorError("Malformed cursor.") from e
@@ -0,0 +1,95 @@
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO
+from uuid import UUID
+
+from PIL import Image, features
+
+from app.config import config
+
+# Thumbnail format setting -> (Pillow format, file suffix, Pillow feature needed)
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", ".webp", "webp"),
+    "avif": ("AVIF", ".avif", "avif"),
+    "jpeg": ("JPEG", ".jpg", None),
+}
+
+
+def check_thumbnail_format(fmt: str):
+    if fmt not in THUMBNAIL_FORMATS:
+        raise ValueError(f"Unknown thumbnail format {fmt}, expected one of {', '.join(THUMBNAIL_FORMATS)}.")
+    feature = THUMBNAIL_FORMATS[fmt][2]
+    if feature is not None and not features.check(feature):
+        raise ValueError(f"This Pillow build can't encode {fmt} images.")
+
+
+def thumbnail_file_name(image_id: UUID | str) -> str:
+    return f"{image_id}{THUMBNAIL_FORMATS[config.thumbnail.format][1]}"
+
+
+def thumbnail_key(image_id: UUID | str) -> str:
+    """
+    Storage key of the thumbnail of an image.
+    """
+    return f"thumbnails/{thumbnail_file_name(image_id)}"
+
+
+def thumbnail_url(image_id: UUID | str) -> str:
+    return f"/static/{thumbnail_key(image_id)}"
+
+
+def needs_thumbnail(file_size: int) -> bool:
+    # Small images are served as they are
+    return file_size >= config.thumbnail.min_file_size_kb * 1024
+
+
+def save_thumbnail(image: Image.Image, target: Path | BinaryIO, size: int | tuple[int, int], fmt: str, quality: int):
+    """
+    Save a thumbnail of an already decoded image, fitting in size * size (or in the given (width, height)).
+    """
+    box = (size, size) if isinstance(size, int) else size
+    image = image.copy() if image.width > box[0] or image.height > box[1] else image
+    # reducing_gap lets Pillow use the fast integer reduce() before the final resampling
+    image.thumbnail(box, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(target, THUMBNAIL_FORMATS[fmt][0], quality=quality)
+
+
+def create_thumbnail_file(source: Path, target: Path, size: int, fmt: str, quality: int):
+    """
+    Create the thumbnail of an image file. JPEG files are decoded straight at a reduced scale with draft().
+    This function is meant to run in a worker process, so it must stay free of heavy imports.
+    """
+    with Image.open(source) as img:
+        img.draft('RGB', (size, size))
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        save_thumbnail(img, target, size, fmt, quality)
+
+
+def create_indexed_thumbnail(image: Image.Image, file_size: int) -> bytes | None:
+    """
+    Encode the thumbnail of an image being indexed, from its already decoded pixels.
+    :return: The encoded thumbnail, or None if the image is too small to need one.
+    """
+    if not needs_thumbnail(file_size):
+        return None
+    buffer = BytesIO()
+    save_thumbnail(image, buffer, config.thumbnail.size, config.thumbnail.format, config.thumbnail.quality)
+    return buffer.getvalue()
+
+
+def create_resized_file(source: Path, target: Path, width: int | None, fmt: str, quality: int):
+    """
+    Convert an image file to the given format, scaled down to `width` if it is wider. Aspect ratio is preserved.
+    """
+    with Image.open(source) as img:
+        if width is not None and img.width > width:
+            height = max(round(img.height * width / img.width), 1)
+            img.draft('RGB', (width, height))
+        else:
+            width, height = img.width, img.height
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        save_thumbnail(img, target, (width, height), fmt, quality)
@@ -1,21 +1,55 @@
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Annotated
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.params import Depends
 from fastapi.staticfiles import StaticFiles
+from loguru import logger
 
 from app.Controllers.admin import admin_router
+from app.Controllers.images import images_router, static_redirect_router
 from app.Controllers.search import searchRouter
+from app.Services import inference_scheduler, ingestion_service, storage_service, load_models, models_loaded, \
+    transformers_service
 from app.Services.authentication import permissive_access_token_verify, permissive_admin_token_verify
+from app.Services.inference_scheduler import InferenceQueueFullError
+from app.Services.storage.local_storage import LocalStorage
+from app.Services.transformers_service import ModelUnavailableError
 from app.config import config
 from .Models.api_response.base import WelcomeApiResponse, WelcomeApiAuthenticationResponse, \
-    WelcomeApiAdminPortalAuthenticationResponse
+    WelcomeApiAdminPortalAuthenticationResponse, ReadinessApiResponse
 from .util import directories
 from .util.fastapi_log_handler import init_logging
 
-app = FastAPI()
+
+async def _preload_models():
+    try:
+        await load_models()
+    except Exception:  # pylint: disable=broad-exception-caught
+        # Requests will try loading them again
+        logger.exception("Failed to load the models")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Loaded in the background, so the server accepts connections (and answers liveness checks) right away
+    loading = asyncio.create_task(_preload_models()) if config.inference.preload_models else None
+    yield
+    if loading is not None:
+        # Loading runs in threads, which can't be interrupted
+        await loading
+    if ingestion_service is not None:
+        await ingestion_service.close()
+    await inference_scheduler.close()
+    transformers_service.close()
+    await storage_service.close()
+
+
+app = FastAPI(lifespan=lifespan)
 init_logging()
 
 app.add_middleware(
@@ -26,12 +60,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(ModelUnavailableError)
+async def model_unavailable_handler(_: Request, exc: ModelUnavailableError):
+    return JSONResponse(status_code=501, content={"detail": str(exc)})
+
+
+@app.exception_handler(InferenceQueueFullError)
+async def inference_queue_full_handler(_: Request, exc: InferenceQueueFullError):
+    logger.warning("Rejecting request: {}", exc)
+    return JSONResponse(status_code=503,
+                        content={"detail": "The server is too busy to process this request now, please retry later."},
+                        headers={"Retry-After": "1"})
+
+
 app.include_router(searchRouter, prefix="/search")
 if config.admin_api_enable:
     app.include_router(admin_router, prefix="/admin")
 
 if config.static_file.enable:
-    app.mount("/static", StaticFiles(directory=directories.static_dir), name="static")
+    app.include_router(images_router, prefix="/images")
+    if isinstance(storage_service, LocalStorage):
+        app.mount("/static", StaticFiles(directory=directories.static_dir), name="static")
+    else:
+        app.include_router(static_redirect_router, prefix="/static")
 
 
 @app.get("/", description="Default portal. Test for server availability.")
@@ -53,3 +105,14 @@ def welcome(request: Request,
         authorization=WelcomeApiAuthenticationResponse(required=config.access_protected, passed=token_passed),
         available_basis=["vision", "ocr"] if config.ocr_search.enable else ["vision"]
     )
+
+
+@app.get("/ready", description="Readiness probe. Returns 503 until the models are loaded, unless they are configured "
+                               "to load on first use. Use / as the liveness probe.",
+         response_model=ReadinessApiResponse, responses={503: {"model": ReadinessApiResponse}})
+def readiness() -> JSONResponse:
+    loaded = models_loaded()
+    ready = loaded or not config.inference.preload_models
+    response = ReadinessApiResponse(message="Ready." if ready else "Loading models...", ready=ready,
+                                    models_loaded=loaded)
+    return JSONResponse(response.model_dump(), status_code=200 if ready else 503)
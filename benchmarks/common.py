@@ -0,0 +1,56 @@
+import json
+import sys
+from time import perf_counter
+from typing import Callable, Awaitable
+
+import numpy as np
+
+
+def summarize_latencies(samples: list[float], total_time: float | None = None) -> dict:
+    """
+    Summarize latency samples (in seconds) into milliseconds percentiles and the throughput in operations per second.
+    """
+    latencies = np.array(samples) * 1000
+    total_time = total_time if total_time is not None else float(np.sum(samples))
+    return {
+        "count": len(samples),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput_per_s": len(samples) / total_time if total_time > 0 else 0.0,
+    }
+
+
+async def measure_async(func: Callable[[], Awaitable], iterations: int, warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        await func()
+    samples = []
+    start_time = perf_counter()
+    for _ in range(iterations):
+        sample_start = perf_counter()
+        await func()
+        samples.append(perf_counter() - sample_start)
+    return summarize_latencies(samples, perf_counter() - start_time)
+
+
+def measure(func: Callable[[], object], iterations: int, warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        func()
+    samples = []
+    start_time = perf_counter()
+    for _ in range(iterations):
+        sample_start = perf_counter()
+        func()
+        samples.append(perf_counter() - sample_start)
+    return summarize_latencies(samples, perf_counter() - start_time)
+
+
+def emit_results(results: dict, output: str | None):
+    text = json.dumps(results, indent=2)
+    if output is None:
+        print(text)
+    else:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"Results written to {output}", file=sys.stderr)
@@ -0,0 +1,58 @@
+"""
+Compare two benchmark result files, and exit with status 1 if any p50 or p95 latency regressed beyond the threshold.
+
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+METRICS = ["p50_ms", "p95_ms"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('baseline', type=str, help="Results of the reference revision")
+    parser.add_argument('current', type=str, help="Results of the revision under test")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Relative latency increase reported as a regression, default is 0.1 (10%%)")
+    return parser.parse_args()
+
+
+def _cases(results: dict):
+    for suite, cases in results["results"].items():
+        for case, stats in cases.items():
+            yield f"{suite}.{case}", stats
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    baseline_cases = dict(_cases(baseline))
+    regressions = []
+    for name, stats in _cases(current):
+        if name not in baseline_cases:
+            print(f"{name:<32} new")
+            continue
+        changes = []
+        for metric in METRICS:
+            before, after = baseline_cases[name][metric], stats[metric]
+            change = (after - before) / before if before > 0 else 0.0
+            changes.append(f"{metric} {before:9.3f} -> {after:9.3f} ({change:+7.1%})")
+            if change > threshold:
+                regressions.append(f"{name} {metric}")
+        print(f"{name:<32} " + "  ".join(changes))
+    return regressions
+
+
+def main(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    print(f"Baseline {baseline.get('revision')}, current {current.get('revision')}")
+    if regressions := compare(baseline, current, args.threshold):
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(parse_args())
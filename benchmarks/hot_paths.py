@@ -0,0 +1,233 @@
+"""
+Benchmark the search and indexing hot paths against Qdrant's local mode, with synthetic vectors.
+Models are replaced by stubs unless --real-models is given (point APP_CLIP__MODEL to a small model in that case).
+
+    python -m benchmarks.hot_paths --output results.json
+    python -m benchmarks.compare baseline.json results.json
+"""
+import argparse
+import asyncio
+import io
+import subprocess
+import sys
+import tempfile
+import uuid
+from argparse import Namespace
+from datetime import datetime
+from itertools import count
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from loguru import logger
+
+from benchmarks import stub_models
+from benchmarks.common import measure, measure_async, summarize_latencies, emit_results
+
+SUITES = ["search", "insert", "payload", "indexing"]
+INSERT_BATCH_SIZES = [1, 16, 64, 256]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the search and indexing hot paths")
+    parser.add_argument('--suites', type=str, default=",".join(SUITES),
+                        help=f"Comma-separated suites to run, from {', '.join(SUITES)}")
+    parser.add_argument('--points', type=int, default=10000, help="Number of points in the searched collection")
+    parser.add_argument('--iterations', type=int, default=100, help="Number of measured iterations per case")
+    parser.add_argument('--indexing-images', type=int, default=200, help="Number of images for the indexing suite")
+    parser.add_argument('--qdrant-path', type=str, default=":memory:",
+                        help="Location of the local Qdrant database, in memory by default")
+    parser.add_argument('--real-models', action='store_true', help="Use the configured models instead of stubs")
+    parser.add_argument('--output', type=str, default=None, help="Write the JSON results to this file")
+    return parser.parse_args()
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _synthetic_items(rng: np.random.Generator, n: int) -> list:
+    from app.Models.img_data import ImageData
+
+    widths = rng.integers(256, 4096, n)
+    heights = rng.integers(256, 4096, n)
+    image_vectors = rng.standard_normal((n, stub_models.VECTOR_SIZE), dtype=np.float32)
+    text_vectors = rng.standard_normal((n, stub_models.VECTOR_SIZE), dtype=np.float32)
+    items = []
+    for i in range(n):
+        has_text = i % 2 == 0
+        image_id = uuid.uuid4()
+        items.append(ImageData(id=image_id, url=f'/static/{image_id}.jpg', thumbnail_url=None,
+                               ocr_text="synthetic text" if has_text else None,
+                               image_vector=image_vectors[i], text_contain_vector=text_vectors[i] if has_text else None,
+                               index_date=datetime.now(), width=int(widths[i]), height=int(heights[i]),
+                               aspect_ratio=float(widths[i]) / float(heights[i]), starred=bool(i % 20 == 0)))
+    return items
+
+
+async def _create_collection(client, name: str):
+    from qdrant_client import models
+    from scripts.qdrant_create_collection import VECTOR_NAMES, VECTOR_SIZE
+
+    await client.create_collection(name, vectors_config={
+        t: models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE) for t in VECTOR_NAMES})
+
+
+async def _populate(db_context, collection: str, points: int, rng: np.random.Generator) -> list:
+    await _create_collection(db_context.client, collection)
+    db_context.collection_name = collection
+    items = []
+    for start in range(0, points, 1000):
+        batch = _synthetic_items(rng, min(1000, points - start))
+        await db_context.insertItems(batch)
+        items.extend(batch)
+    return items
+
+
+def _jpeg_bytes(rng: np.random.Generator, width=640, height=480) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def bench_search(args: Namespace, rng: np.random.Generator) -> dict:
+    from fastapi.testclient import TestClient
+    from app.Services import db_context
+    from app.webapp import app
+
+    def request(method: str, url: str, **kwargs):
+        response = client.request(method, url, **kwargs)
+        assert response.status_code == 200, (url, response.status_code, response.text)
+
+    counter = count()
+    results = {}
+    with TestClient(app) as client:
+        items = client.portal.call(_populate, db_context, "bench_search", args.points, rng)
+        image = _jpeg_bytes(rng)
+        # Distinct prompts on every call, so the embedding cache doesn't hide the inference path
+        cases = {
+            "text": lambda: request('GET', f'/search/text/prompt {next(counter)}'),
+            "text_ocr": lambda: request('GET', f'/search/text/prompt {next(counter)}', params={'basis': 'ocr'}),
+            "text_filtered": lambda: request('GET', f'/search/text/prompt {next(counter)}',
+                                             params={'min_width': 1920, 'starred': True}),
+            "image": lambda: request('POST', '/search/image',
+                                     files={'image': ('image.jpg', image, 'image/jpeg')}),
+            "similar": lambda: request('GET', f'/search/similar/{items[next(counter) % len(items)].id}'),
+            "advanced": lambda: request('POST', '/search/advanced',
+                                        json={'criteria': [f'prompt {next(counter)}', 'cat'],
+                                              'negative_criteria': ['dog']}),
+            "combined": lambda: request('POST', '/search/combined',
+                                        json={'criteria': [f'prompt {next(counter)}'], 'extra_prompt': 'text'}),
+            "combined_ocr": lambda: request('POST', '/search/combined', params={'basis': 'ocr'},
+                                            json={'criteria': [f'prompt {next(counter)}'], 'extra_prompt': 'text'}),
+            "random": lambda: request('GET', '/search/random'),
+        }
+        for name, case in cases.items():
+            logger.info("Benchmarking search case {}", name)
+            results[name] = measure(case, args.iterations)
+    return results
+
+
+async def bench_insert(args: Namespace, rng: np.random.Generator) -> dict:
+    from app.Services import db_context
+
+    await _create_collection(db_context.client, "bench_insert")
+    db_context.collection_name = "bench_insert"
+    results = {}
+    for batch_size in INSERT_BATCH_SIZES:
+        logger.info("Benchmarking insertItems with batch size {}", batch_size)
+        iterations = max(3, min(args.iterations, 20000 // batch_size))
+        batches = iter([_synthetic_items(rng, batch_size) for _ in range(iterations + 3)])
+        stats = await measure_async(lambda batches=batches: db_context.insertItems(next(batches)), iterations)
+        stats["items_per_s"] = stats["throughput_per_s"] * batch_size
+        results[f"batch_{batch_size}"] = stats
+    return results
+
+
+def bench_payload(args: Namespace, rng: np.random.Generator) -> dict:
+    from app.Models.img_data import ImageData
+
+    payloads = [(str(t.id), t.payload) for t in _synthetic_items(rng, 1000)]
+    iterations = args.iterations * 100
+
+    def deserialize(index=count()):
+        point_id, payload = payloads[next(index) % len(payloads)]
+        ImageData.from_payload(point_id, payload)
+
+    logger.info("Benchmarking ImageData.from_payload")
+    return {"from_payload": measure(deserialize, iterations)}
+
+
+def bench_indexing(args: Namespace, rng: np.random.Generator) -> dict:
+    from app.Services import db_context
+    from app.Services.storage.local_storage import LocalStorage
+    from app.config import config
+    from scripts import local_indexing
+
+    if not args.real_models:
+        local_indexing.ocr_service = stub_models.StubOCRService()
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        source = workdir / "source"
+        source.mkdir()
+        for i in range(args.indexing_images):
+            (source / f"{i}.jpg").write_bytes(_jpeg_bytes(rng, 640 + i % 2, 480))
+        local_indexing.storage_service = LocalStorage(str(workdir / "static"),
+                                                      config.storage.max_concurrent_transfers)
+        config.indexing.manifest_path = str(workdir / "manifest.sqlite3")
+
+        async def run():
+            await _create_collection(db_context.client, "bench_indexing")
+            db_context.collection_name = "bench_indexing"
+            config.qdrant.coll = "bench_indexing"
+            start_time = asyncio.get_running_loop().time()
+            await local_indexing.main(Namespace(local_index_target_dir=str(source)))
+            elapsed = asyncio.get_running_loop().time() - start_time
+            indexed = (await db_context.client.count("bench_indexing")).count
+            assert indexed == args.indexing_images, f"Only {indexed} of {args.indexing_images} images were indexed"
+            return elapsed
+
+        logger.info("Benchmarking the indexing pipeline with {} images", args.indexing_images)
+        elapsed = asyncio.run(run())
+    # The pipeline overlaps its stages, so only the average time per image is meaningful here
+    return {"pipeline": summarize_latencies([elapsed / args.indexing_images] * args.indexing_images, elapsed)}
+
+
+def main(args: Namespace):
+    suites = args.suites.split(",")
+    if unknown := set(suites) - set(SUITES):
+        raise SystemExit(f"Unknown suites: {', '.join(unknown)}")
+    if not args.real_models:
+        stub_models.install()
+    from qdrant_client import AsyncQdrantClient
+    from app.Services import db_context
+
+    db_context.client = AsyncQdrantClient(location=args.qdrant_path)
+    # Importing the app replaces the log handlers, so silence the per-request logs afterwards
+    import app.webapp  # pylint: disable=unused-import,import-outside-toplevel
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    logger.add(sys.stderr, level="INFO", filter=__name__)
+
+    rng = np.random.default_rng(0)
+    results = {}
+    for suite in suites:
+        match suite:
+            case "search":
+                results[suite] = bench_search(args, rng)
+            case "insert":
+                results[suite] = asyncio.run(bench_insert(args, rng))
+            case "payload":
+                results[suite] = bench_payload(args, rng)
+            case "indexing":
+                results[suite] = bench_indexing(args, rng)
+    emit_results({"revision": _git_revision(), "date": datetime.now().isoformat(), "stub_models": not args.real_models,
+                  "points": args.points, "iterations": args.iterations, "results": results}, args.output)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,104 @@
+"""
+Compare the decoding and CLIP preprocessing of large uploaded images: the full-resolution decode followed by the
+transformers image processor, against the reduced-scale decode and the vectorized preprocessing used by image search.
+Needs the processor files of the configured CLIP model, and the model itself with --vectors.
+
+    python -m benchmarks.image_decoding --output decoding.json
+"""
+import argparse
+from argparse import Namespace
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+from loguru import logger
+
+from benchmarks.common import measure, emit_results
+
+# Name, format and size of the synthetic uploads
+CASES = [
+    ("jpeg_12mp", "JPEG", (4000, 3000)),
+    ("jpeg_40mp", "JPEG", (7744, 5164)),
+    ("png_12mp", "PNG", (4000, 3000)),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the image search decode path on large images")
+    parser.add_argument('--iterations', type=int, default=10, help="Number of measured iterations per case")
+    parser.add_argument('--vectors', action='store_true',
+                        help="Also compare the CLIP vectors of both paths, which loads the CLIP model")
+    parser.add_argument('--output', type=str, default=None, help="Write the JSON results to this file")
+    return parser.parse_args()
+
+
+def _synthetic_photo(size: tuple[int, int]) -> Image.Image:
+    """
+    Smooth gradients with some noise, which compress like a photo rather than like pure noise.
+    """
+    width, height = size
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    channels = [x * y, np.broadcast_to(np.sin(x * 12) * 0.5 + 0.5, (height, width)),
+                np.broadcast_to(np.cos(y * 9) * 0.5 + 0.5, (height, width))]
+    pixels = np.stack(channels, axis=-1) * 230 + rng.normal(0, 6, (height, width, 1)).astype(np.float32)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def main(args: Namespace):
+    from transformers import CLIPProcessor
+
+    from app.config import config
+    from app.util.clip_preprocessing import ClipImagePreprocessor
+    from app.util.image_decoding import decode_image_for_clip
+
+    image_processor = CLIPProcessor.from_pretrained(config.clip.model).image_processor  # pylint: disable=no-member
+    preprocessor = ClipImagePreprocessor(image_processor)
+
+    def baseline(data: bytes) -> np.ndarray:
+        with Image.open(BytesIO(data)) as image:
+            return image_processor(images=[image.convert("RGB")], return_tensors="np")["pixel_values"]
+
+    def fast_path(data: bytes) -> np.ndarray:
+        return preprocessor([decode_image_for_clip(BytesIO(data))])
+
+    service = None
+    if args.vectors:
+        from app.Services.transformers_service import TransformersService
+
+        service = TransformersService(model_role="vision")
+        service.load()
+
+    results = {}
+    for name, fmt, size in CASES:
+        logger.info("Encoding the {} upload", name)
+        data = _encode(_synthetic_photo(size), fmt)
+        logger.info("Benchmarking {} ({:.1f} MB)", name, len(data) / 1024 / 1024)
+        results[name] = {
+            "file_size_mb": len(data) / 1024 / 1024,
+            "baseline": measure(lambda data=data: baseline(data), args.iterations, warmup=1),
+            "fast_path": measure(lambda data=data: fast_path(data), args.iterations, warmup=1),
+        }
+        results[name]["speedup_p50"] = results[name]["baseline"]["p50_ms"] / results[name]["fast_path"]["p50_ms"]
+        expected, actual = baseline(data), fast_path(data)
+        results[name]["mean_abs_pixel_difference"] = float(np.mean(np.abs(expected - actual)))
+        if service is not None:
+            import torch
+
+            with torch.no_grad():
+                vectors = [service.clip_vision_model(pixel_values=torch.from_numpy(t)).image_embeds[0].numpy()
+                           for t in (expected, actual)]
+            results[name]["vector_cosine_similarity"] = float(
+                np.dot(vectors[0], vectors[1]) / np.linalg.norm(vectors[0]) / np.linalg.norm(vectors[1]))
+    emit_results({"clip_model": config.clip.model, "iterations": args.iterations, "results": results}, args.output)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,92 @@
+"""
+Compare the latency of the inference backends on the configured models, along with how close their vectors are to the
+PyTorch ones. Needs the models, and onnx and onnxruntime for the ONNX backends.
+
+    python -m benchmarks.inference_backends --output backends.json
+"""
+import argparse
+from argparse import Namespace
+
+import numpy as np
+from PIL import Image
+from loguru import logger
+
+from benchmarks.common import measure, emit_results
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+BATCH_SIZES = [1, 16]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the inference backends")
+    parser.add_argument('--backends', type=str, default=",".join(BACKENDS),
+                        help=f"Comma-separated backends to run, from {', '.join(BACKENDS)}")
+    parser.add_argument('--iterations', type=int, default=20, help="Number of measured iterations per case")
+    parser.add_argument('--onnx-cache', type=str, default=None,
+                        help="Directory of the exported ONNX models, APP_ONNX__CACHE_PATH by default")
+    parser.add_argument('--output', type=str, default=None, help="Write the JSON results to this file")
+    return parser.parse_args()
+
+
+def _create_service(backend: str, args: Namespace):
+    from app.config import config
+    from app.Services.transformers_service import TransformersService
+
+    if backend == "torch":
+        return TransformersService()
+    from app.Services.onnx_service import OnnxTransformersService
+
+    settings = config.onnx.model_copy(update={"quantize": backend == "onnx-int8"})
+    if args.onnx_cache is not None:
+        settings.cache_path = args.onnx_cache
+    return OnnxTransformersService(settings)
+
+
+def _min_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    a = a / np.linalg.norm(a, axis=-1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=-1, keepdims=True)
+    return float(np.min(np.sum(a * b, axis=-1)))
+
+
+def main(args: Namespace):
+    from app.config import config
+
+    backends = args.backends.split(",")
+    if unknown := set(backends) - set(BACKENDS):
+        raise SystemExit(f"Unknown backends: {', '.join(unknown)}")
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)) for _ in range(max(BATCH_SIZES))]
+    texts = [f"a photo of a cat number {i}" for i in range(max(BATCH_SIZES))]
+    cases = {f"{name}_batch_{n}": (method, inputs[:n])
+             for n in BATCH_SIZES
+             for name, method, inputs in [("clip_text", "get_text_vectors", texts),
+                                          ("clip_image", "get_image_vectors", images),
+                                          ("bert", "get_bert_vectors", texts)]
+             if name != "bert" or config.ocr_search.enable}
+
+    results = {}
+    reference = {}
+    for backend in backends:
+        service = _create_service(backend, args)
+        logger.info("Loading the models of the {} backend", backend)
+        service.load()
+        results[backend] = {}
+        for case, (method, inputs) in cases.items():
+            logger.info("Benchmarking {} {}", backend, case)
+            run = getattr(service, method)
+            vectors = run(inputs)
+            results[backend][case] = measure(lambda run=run, inputs=inputs: run(inputs), args.iterations)
+            if backend == "torch":
+                reference[case] = vectors
+            elif case in reference:
+                results[backend][case]["min_cosine_similarity"] = _min_similarity(vectors, reference[case])
+    if "torch" in results:
+        for backend in results.keys() - {"torch"}:
+            for case, stats in results[backend].items():
+                stats["speedup_p50"] = results["torch"][case]["p50_ms"] / stats["p50_ms"]
+    emit_results({"clip_model": config.clip.model, "bert_model": config.ocr_search.bert_model,
+                  "iterations": args.iterations, "results": results}, args.output)
+
+
+if __name__ == '__main__':
+    main(parse_args())
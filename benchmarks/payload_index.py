@@ -0,0 +1,91 @@
+"""
+Compare the latency of filtered searches with and without payload indexes.
+Payload indexes have no effect in Qdrant's local mode, so this benchmark needs a Qdrant server:
+
+    python -m benchmarks.payload_index --host localhost --port 6333 --points 200000
+"""
+import argparse
+import asyncio
+import uuid
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, models
+
+from app.Models.query_params import FilterParams
+from app.Services.vector_db_context import VectorDbContext
+from benchmarks.common import measure_async, emit_results
+from scripts.qdrant_create_collection import PAYLOAD_INDEXES, VECTOR_SIZE
+
+FILTERS = {
+    "min_width": FilterParams(min_width=1920),
+    "aspect_ratio": FilterParams(preferred_ratio=16 / 9, ratio_tolerance=0.05),
+    "starred": FilterParams(starred=True),
+    "combined": FilterParams(min_width=1280, min_height=720, starred=True),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark filtered search with and without payload indexes")
+    parser.add_argument('--host', type=str, default="localhost", help="Qdrant host")
+    parser.add_argument('--port', type=int, default=6333, help="Qdrant port")
+    parser.add_argument('--points', type=int, default=100000, help="Number of synthetic points")
+    parser.add_argument('--queries', type=int, default=200, help="Number of queries per filter")
+    parser.add_argument('--output', type=str, default=None, help="Write the JSON results to this file")
+    return parser.parse_args()
+
+
+async def populate(client: AsyncQdrantClient, collection: str, points: int, rng: np.random.Generator):
+    await client.create_collection(collection, vectors_config={
+        VectorDbContext.IMG_VECTOR: models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE)})
+    batch_size = 1000
+    for start in range(0, points, batch_size):
+        count = min(batch_size, points - start)
+        widths = rng.integers(256, 4096, count)
+        heights = rng.integers(256, 4096, count)
+        await client.upsert(collection, wait=True, points=[
+            models.PointStruct(id=str(uuid.uuid4()),
+                               vector={VectorDbContext.IMG_VECTOR: vector.tolist()},
+                               payload={"width": int(w), "height": int(h), "aspect_ratio": float(w) / float(h),
+                                        "starred": bool(rng.random() < 0.05)})
+            for vector, w, h in zip(rng.standard_normal((count, VECTOR_SIZE), dtype=np.float32), widths, heights)])
+
+
+async def wait_for_green(client: AsyncQdrantClient, collection: str):
+    while (await client.get_collection(collection)).status != models.CollectionStatus.GREEN:
+        await asyncio.sleep(1)
+
+
+async def run_queries(client: AsyncQdrantClient, collection: str, queries: int, rng: np.random.Generator) -> dict:
+    results = {}
+    for name, filter_param in FILTERS.items():
+        query_filter = VectorDbContext.getFiltersByFilterParam(filter_param)
+
+        async def query(query_filter=query_filter):
+            await client.search(collection, query_vector=(VectorDbContext.IMG_VECTOR,
+                                                          rng.standard_normal(VECTOR_SIZE).tolist()),
+                                query_filter=query_filter, limit=10)
+
+        results[name] = await measure_async(query, queries)
+    return results
+
+
+async def main(args):
+    client = AsyncQdrantClient(host=args.host, port=args.port)
+    collection = f"bench_payload_index_{uuid.uuid4().hex[:8]}"
+    rng = np.random.default_rng(0)
+    try:
+        await populate(client, collection, args.points, rng)
+        await wait_for_green(client, collection)
+        without_indexes = await run_queries(client, collection, args.queries, rng)
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            await client.create_payload_index(collection, field_name, field_schema=field_schema, wait=True)
+        await wait_for_green(client, collection)
+        with_indexes = await run_queries(client, collection, args.queries, rng)
+    finally:
+        await client.delete_collection(collection)
+    emit_results({"points": args.points, "without_payload_indexes": without_indexes,
+                  "with_payload_indexes": with_indexes}, args.output)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,101 @@
+"""
+Stand-ins for the model services, so benchmarks measure the code around the models rather than the models themselves.
+install() must be called before anything imports app.Services.
+"""
+import sys
+import types
+from hashlib import blake2b
+
+import numpy as np
+from PIL import Image
+from numpy import ndarray
+
+VECTOR_SIZE = 768
+
+
+def _seeded_vector(key: bytes) -> ndarray:
+    # Deterministic vectors, so the same input always finds the same neighbours
+    rng = np.random.default_rng(int.from_bytes(blake2b(key, digest_size=8).digest(), 'little'))
+    vector = rng.standard_normal(VECTOR_SIZE, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class StubModelUnavailableError(Exception):
+    pass
+
+
+class StubTransformersService:
+    loaded = True
+    has_text_tower = True
+    has_vision_tower = True
+
+    def __init__(self, model_role: str = "full"):
+        self.model_role = model_role
+        self.device = "cpu"
+
+    def require_text_tower(self):
+        pass
+
+    def require_vision_tower(self):
+        pass
+
+    def load(self):
+        pass
+
+    def get_image_vector(self, image: Image.Image) -> ndarray:
+        return self.get_image_vectors([image])[0]
+
+    @staticmethod
+    def get_image_vectors(images: list[Image.Image]) -> ndarray:
+        return np.stack([_seeded_vector(t.resize((8, 8)).tobytes()) for t in images])
+
+    def get_text_vector(self, text: str) -> ndarray:
+        return self.get_text_vectors([text])[0]
+
+    @staticmethod
+    def get_text_vectors(texts: list[str]) -> ndarray:
+        return np.stack([_seeded_vector(t.encode()) for t in texts])
+
+    def get_bert_vector(self, text: str) -> ndarray:
+        return self.get_bert_vectors([text])[0]
+
+    @staticmethod
+    def get_bert_vectors(texts: list[str]) -> ndarray:
+        return np.stack([_seeded_vector(b"bert" + t.encode()) for t in texts])
+
+    @staticmethod
+    def get_random_vector(seed: int | None = None) -> ndarray:
+        vec = np.random.default_rng(seed).random(VECTOR_SIZE)
+        vec -= vec.mean()
+        return vec
+
+    def close(self):
+        pass
+
+
+class StubOCRService:
+    loaded = True
+
+    def load(self):
+        pass
+
+    @staticmethod
+    def ocr_interface(img: Image.Image, need_preprocess=True) -> str:
+        return "stub ocr text" if img.width % 2 else ""
+
+    def ocr_batch(self, images: list[Image.Image], need_preprocess=True) -> list[str]:
+        return [self.ocr_interface(t, need_preprocess) for t in images]
+
+    @staticmethod
+    def get_stats() -> dict:
+        return {"images": 0, "batches": 0, "busy_seconds": 0.0}
+
+
+def install():
+    if 'app.Services' in sys.modules:
+        raise RuntimeError("The stub models must be installed before app.Services is imported.")
+    name = 'app.Services.transformers_service'
+    module = types.ModuleType(name)
+    module.TransformersService = StubTransformersService
+    module.ModelUnavailableError = StubModelUnavailableError
+    sys.modules[name] = module
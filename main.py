@@ -13,6 +13,15 @@ def parse_args():
                         help="Initialize qdrant database using connection settings in "
                              "config.py. When this flag is set, will not"
                              "start the server.")
+    parser.add_argument('--update-database', action='store_true',
+                        help="Migrate the existing qdrant collection: create missing payload indexes, and apply the "
+                             "tuning profile set by --db-profile if any. When this flag is set, will not start the "
+                             "server.")
+    parser.add_argument('--db-profile', type=str, default=None,
+                        help="Tuning profile used by --init-database and --update-database, which sets the HNSW "
+                             "parameters, vector quantization and on-disk storage. See PROFILES in "
+                             "scripts/qdrant_create_collection.py for the available profiles. --init-database uses "
+                             "\"default\" if not set.")
     parser.add_argument('--local-index', dest="local_index_target_dir", type=str,
                         help="Index all the images in this directory and copy them to "
                              "static folder set in config.py. When this flag is set, "
@@ -20,6 +29,12 @@ def parse_args():
     parser.add_argument('--local-create-thumbnail', action='store_true',
                         help='Create thumbnail for all local images in static folder set in config.py. When this flag '
                              'is set, will not start the server.')
+    parser.add_argument('--inference-server', action='store_true',
+                        help="Run the inference server, which loads the models once for all the server workers using "
+                             "the \"remote\" inference backend. When this flag is set, will not start the server.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of server worker processes, default is 1. Use the \"remote\" inference backend "
+                             "with the inference server so they share one copy of the models.")
     parser.add_argument('--port', type=int, default=8000, help="Port to listen on, default is 8000")
     parser.add_argument('--host', type=str, default="0.0.0.0", help="Host to bind on, default is 0.0.0.0")
     parser.add_argument('--root-path', type=str, default="",
@@ -32,13 +47,20 @@ def parse_args():
 
 if __name__ == '__main__':
     args = parse_args()
-    if args.init_database:
+    if args.init_database or args.update_database:
         from scripts import qdrant_create_collection
         from app.config import config
 
-        qdrant_create_collection.create_coll(
-            collections.namedtuple('Options', ['host', 'port', 'name'])(config.qdrant.host, config.qdrant.port,
-                                                                        config.qdrant.coll))
+        # Checked here rather than with argparse choices, so starting the server doesn't import the script
+        if args.db_profile is not None and args.db_profile not in qdrant_create_collection.PROFILES:
+            raise SystemExit(f"Unknown --db-profile {args.db_profile}. Available profiles: "
+                             f"{', '.join(qdrant_create_collection.PROFILES)}")
+        options = collections.namedtuple('Options', ['host', 'port', 'name', 'profile'])(
+            config.qdrant.host, config.qdrant.port, config.qdrant.coll, args.db_profile)
+        if args.init_database:
+            qdrant_create_collection.create_coll(options)
+        else:
+            qdrant_create_collection.update_coll(options)
     elif args.local_index_target_dir is not None:
         from app.config import environment
 
@@ -52,5 +74,13 @@ if __name__ == '__main__':
         import asyncio
 
         asyncio.run(local_create_thumbnail.main())
+    elif args.inference_server:
+        from app.config import environment
+
+        environment.inference_server = True
+        from scripts import inference_server
+        import asyncio
+
+        asyncio.run(inference_server.main())
     else:
-        uvicorn.run("app.webapp:app", host=args.host, port=args.port, root_path=args.root_path)
+        uvicorn.run("app.webapp:app", host=args.host, port=args.port, root_path=args.root_path, workers=args.workers)
@@ -0,0 +1,24 @@
+import asyncio
+import signal
+
+from loguru import logger
+
+from app.Services import transformers_service, inference_scheduler
+from app.Services.inference_server import InferenceServer
+from app.config import config
+
+
+async def main():
+    # The workers wait for the socket, so the models are loaded before listening
+    await asyncio.to_thread(transformers_service.load)
+    server = InferenceServer(inference_scheduler, transformers_service, config.inference_server.socket_path)
+    # Shut down cleanly when stopped by a process manager too
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        logger.info("Shutting down the inference server...")
+        await server.close()
+        await inference_scheduler.close()
@@ -1,57 +1,84 @@
-import uuid
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from tempfile import TemporaryDirectory
 
-from PIL import Image
 from loguru import logger
 
-from app.Services import db_context
+from app.Services import db_context, storage_service
+from app.Services.storage import static_key
 from app.config import config
+from app.util.thumbnails import check_thumbnail_format, create_thumbnail_file, needs_thumbnail, thumbnail_file_name, \
+    thumbnail_key, thumbnail_url
+
+
+async def find_missing_thumbnails() -> list[tuple[str, str]]:
+    """
+    Find the stored images without a thumbnail. The database knows which they are, so there is no need to list the
+    storage.
+    :return: The ids and storage keys of the images.
+    """
+    candidates = []
+    async for image_id, payload in db_context.scrollPayloads(['url', 'thumbnail_url']):
+        key = static_key(payload.get('url', ''))
+        if payload.get('thumbnail_url') is None and key is not None:
+            candidates.append((str(image_id), key))
+    infos = await storage_service.run_transfers(storage_service.stat(key) for _, key in candidates)
+    result = []
+    for (image_id, key), info in zip(candidates, infos):
+        if info is None:
+            logger.warning("Image {} is a local image but not found in storage.", image_id)
+        elif needs_thumbnail(info.size):
+            result.append((image_id, key))
+    return result
+
+
+async def create_thumbnail(executor: ProcessPoolExecutor, workdir: Path, image_id: str, key: str):
+    settings = config.thumbnail
+    # Files of the local storage are read and written in place, others go through the working directory
+    source = storage_service.local_path(key)
+    if source is None:
+        source = workdir / Path(key).name
+        await storage_service.download_file(key, source)
+    target = storage_service.local_path(thumbnail_key(image_id))
+    in_place = target is not None
+    if in_place:
+        target.parent.mkdir(parents=True, exist_ok=True)
+    else:
+        target = workdir / thumbnail_file_name(image_id)
+    try:
+        await asyncio.get_running_loop().run_in_executor(executor, create_thumbnail_file, source, target,
+                                                         settings.size, settings.format, settings.quality)
+        if not in_place:
+            await storage_service.upload_file(target, thumbnail_key(image_id), move=True)
+    finally:
+        if source.is_relative_to(workdir):
+            source.unlink(missing_ok=True)
 
 
 async def main():
-    static_path = Path(config.static_file.path)
-    static_thumb_path = static_path / 'thumbnails'
-    if not static_thumb_path.exists():
-        static_thumb_path.mkdir()
+    settings = config.thumbnail
+    check_thumbnail_format(settings.format)
+    pending = await find_missing_thumbnails()
+    logger.info("{} images need a thumbnail", len(pending))
+
     count = 0
-    for item in static_path.glob('*.*'):
-        count += 1
-        logger.info("[{}] Processing {}", str(count), str(item.relative_to(static_path)))
-        size = item.stat().st_size
-        if size < 1024 * 500:
-            logger.warning("File size too small: {}. Skip...", size)
-            continue
-        try:
-            if item.suffix not in ['.jpg', '.png', '.jpeg']:
-                logger.warning("Unsupported file type: {}. Skip...", item.suffix)
-                continue
-            if (static_thumb_path / f'{item.stem}.webp').exists():
-                logger.warning("Thumbnail for {} already exists. Skip...", item.stem)
-                continue
-            image_id = uuid.UUID(item.stem)
-        except ValueError:
-            logger.warning("Invalid file name: {}. Skip...", item.stem)
-            continue
-        try:
-            imgdata = await db_context.retrieve_by_id(str(image_id))
-        except Exception as e:
-            logger.error("Error when retrieving image {}: {}", image_id, e)
-            continue
-        try:
-            img = Image.open(item)
-        except Exception as e:
-            logger.error("Error when opening image {}: {}", item, e)
-            continue
-
-        # generate thumbnail max size 256*256
-        img.thumbnail((256, 256))
-        img.save(static_thumb_path / f'{str(image_id)}.webp', 'WebP')
-        img.close()
-        logger.success("Thumbnail for {} generated!", image_id)
-
-        # update payload
-        imgdata.thumbnail_url = f'/static/thumbnails/{str(image_id)}.webp'
-        await db_context.updatePayload(imgdata)
-        logger.success("Payload for {} updated!", image_id)
+    with ProcessPoolExecutor(max_workers=settings.workers) as executor, TemporaryDirectory() as workdir:
+        for start in range(0, len(pending), settings.update_batch_size):
+            batch = pending[start:start + settings.update_batch_size]
+            results = await storage_service.run_transfers(
+                [create_thumbnail(executor, Path(workdir), image_id, key) for image_id, key in batch],
+                return_exceptions=True)
+            updates = []
+            for (image_id, key), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.error("Error when creating the thumbnail of {}: {}", key, result)
+                    continue
+                updates.append((image_id, {'thumbnail_url': thumbnail_url(image_id)}))
+            if updates:
+                await db_context.updatePayloadFields(updates)
+            count += len(updates)
+            logger.info("[{}/{}] Thumbnails generated", count, len(pending))
 
+    await storage_service.close()
     logger.success("OK. Updated {} items.", count)
@@ -1,16 +1,34 @@
 import argparse
+import asyncio
+import multiprocessing
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
-from shutil import copy2
-from uuid import uuid4
+from time import perf_counter
+from typing import Any
+from uuid import UUID
 
-import PIL
-from PIL import Image
 from loguru import logger
 
 from app.Models.img_data import ImageData
-from app.Services import transformers_service, db_context, ocr_service
+from app.Services import transformers_service, db_context, ocr_service, storage_service, load_models, \
+    text_presence_classifier
+from app.Services.duplicate_detection import PerceptualHashIndex
+from app.Services.index_manifest import IndexManifest, image_id_from_hash
+from app.Services.ocr_services import recognize_texts
+from app.Services.storage import static_url, static_key, store_indexed_images
 from app.config import config
+from app.util.image_decoding import DecodedImage, decode_image_for_indexing
+from app.util.perceptual_hash import phash_to_hex
+from app.util.thumbnails import check_thumbnail_format, thumbnail_key
+
+SUPPORTED_SUFFIXES = ['.jpg', '.png', '.jpeg', '.jfif', '.webp']
+STATS_LOG_INTERVAL = 30
+
+# Marks the end of the stream in the queues between stages
+_END = None
 
 
 def parse_args():
@@ -20,65 +38,351 @@ def parse_args():
     return parser.parse_args()
 
 
-def copy_and_index(file_path: Path) -> ImageData | None:
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.failures = 0
+        self.skipped = 0
+        self.busy_time = 0.0
+
+    def record(self, items: int, busy_time: float):
+        self.items += items
+        self.busy_time += busy_time
+
+    def log(self, elapsed: float):
+        logger.info("[{}] {} items, {} skipped, {} failed, {:.2f} items/s overall, {:.2f} items/s while busy",
+                    self.name, self.items, self.skipped, self.failures, self.items / elapsed if elapsed > 0 else 0,
+                    self.items / self.busy_time if self.busy_time > 0 else 0)
+
+
+class PendingImages:
+    """
+    The images of this run which are not committed yet, with the files skipped as duplicates or near-duplicates of
+    them. Those files are recorded once their image is committed, and indexed again by the next run if it fails.
+    """
+
+    def __init__(self, phash_index: PerceptualHashIndex | None):
+        self._phash_index = phash_index
+        self._images: dict[UUID, tuple[int, list[tuple[Path, int, float, str]]]] = {}
+
+    def __contains__(self, image_id: UUID) -> bool:
+        return image_id in self._images
+
+    def add(self, decoded: DecodedImage):
+        image_id = image_id_from_hash(decoded.content_hash)
+        self._images[image_id] = (decoded.phash, [])
+        # Indexed before the image is committed, so near-duplicates within this run are found too
+        if self._phash_index is not None:
+            self._phash_index.add(image_id, decoded.phash)
+
+    def add_duplicate(self, image_id: UUID, decoded: DecodedImage):
+        self._images[image_id][1].append((decoded.path, decoded.file_size, decoded.mtime, decoded.content_hash))
+
+    def duplicates(self, image_id: UUID) -> list[tuple[Path, int, float, str, UUID]]:
+        """
+        :return: The files skipped as duplicates of the image, to record along with it.
+        """
+        return [(*t, image_id) for t in self._images[image_id][1]]
+
+    def commit(self, image_id: UUID):
+        """
+        Forget an image once it and its duplicates are recorded.
+        """
+        del self._images[image_id]
+
+    def discard(self, image_id: UUID):
+        """
+        Forget an image which failed, so that files like it are indexed rather than skipped against it.
+        """
+        phash, _ = self._images.pop(image_id)
+        if self._phash_index is not None:
+            self._phash_index.remove(image_id, phash)
+
+
+async def _read_batches(queue: asyncio.Queue, batch_size: int):
+    """
+    Yield batches of up to `batch_size` items from `queue`. A batch is yielded early when the upstream stage is
+    slower than this one, so the pipeline never stalls waiting for a full batch.
+    """
+    finished = False
+    while not finished:
+        batch = [await queue.get()]
+        while len(batch) < batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch[-1] is _END:
+            batch.pop()
+            finished = True
+        if batch:
+            yield batch
+
+
+async def _process_with_fallback(batch: list, process: Callable[[list], Awaitable], pending: PendingImages,
+                                 stats: StageStats, get_decoded: Callable[[Any], DecodedImage] = itemgetter(0)) -> list:
+    """
+    Run `process` on the whole batch. If it fails, run it on each image alone, so a bad image only fails itself
+    rather than its whole batch.
+    :param get_decoded: Returns the decoded image of an item of the batch.
+    :return: The items processed successfully.
+    """
     try:
-        img = Image.open(file_path)
-    except PIL.UnidentifiedImageError as e:
-        logger.error("Error when opening image {}: {}", file_path, e)
-        return None
-    image_id = uuid4()
-    img_ext = file_path.suffix
-    image_ocr_result = None
-    text_contain_vector = None
-    [width, height] = img.size
+        await process(batch)
+        return batch
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        if len(batch) > 1:
+            logger.warning("Error when processing a batch of {} images, retrying them one by one: {}", len(batch), e)
+        else:
+            logger.error("Error when processing image {}: {}", get_decoded(batch[0]).path, e)
+            stats.failures += 1
+            pending.discard(image_id_from_hash(get_decoded(batch[0]).content_hash))
+            return []
+    processed = []
+    for item in batch:
+        try:
+            await process([item])
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("Error when processing image {}: {}", get_decoded(item).path, e)
+            stats.failures += 1
+            pending.discard(image_id_from_hash(get_decoded(item).content_hash))
+            continue
+        processed.append(item)
+    return processed
+
+
+async def _delete_replaced_images(image_ids: list[UUID]):
+    """
+    Delete the images of files whose content changed since they were indexed, along with their stored files.
+    """
     try:
-        image_vector = transformers_service.get_image_vector(img)
+        points = await db_context.retrieve_by_ids([str(t) for t in image_ids])
+        await db_context.deleteItems([str(t) for t in image_ids])
+        keys = [static_key(t.url) for t in points] + [thumbnail_key(t.id) for t in points if t.thumbnail_url]
+        await storage_service.run_transfers([storage_service.delete(t) for t in keys if t is not None],
+                                            return_exceptions=True)
+        logger.info("Deleted {} images replaced by a new version of their file", len(image_ids))
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.warning("Error when deleting the replaced images {}: {}", [str(t) for t in image_ids], e)
+
+
+async def _record_files(manifest: IndexManifest, files: list[tuple[Path, int, float, str, UUID]]):
+    if replaced_ids := manifest.record_many(files):
+        await _delete_replaced_images(replaced_ids)
+
+
+async def discover_stage(root: Path, manifest: IndexManifest, output: asyncio.Queue, stats: StageStats):
+    files = root.glob('**/*.*')
+    while True:
+        start_time = perf_counter()
+        item = next(files, None)
+        if item is None:
+            break
+        if item.suffix.lower() not in SUPPORTED_SUFFIXES:
+            logger.warning("Unsupported file type: {}. Skip...", item.suffix)
+            continue
+        item = item.resolve()
+        stat = item.stat()
+        if manifest.is_unchanged(item, stat.st_size, stat.st_mtime):
+            stats.skipped += 1
+            continue
+        stats.record(1, perf_counter() - start_time)
+        await output.put(item)
+    await output.put(_END)
+
+
+async def decode_stage(root: Path, manifest: IndexManifest, phash_index: PerceptualHashIndex | None,
+                       pending: PendingImages, executor: ProcessPoolExecutor, workers: int,
+                       input_queue: asyncio.Queue, output: asyncio.Queue, stats: StageStats):
+    loop = asyncio.get_running_loop()
+    in_flight = set()
+
+    async def decode(path: Path):
+        try:
+            start_time = perf_counter()
+            decoded = await loop.run_in_executor(executor, decode_image_for_indexing, path)
+            stats.record(1, perf_counter() - start_time)
+            relative_path = str(path.relative_to(root.resolve()))
+            if (existing_id := manifest.find_by_hash(decoded.content_hash)) is not None:
+                logger.info("{} is identical to the indexed image {}. Skip...", relative_path, existing_id)
+                stats.skipped += 1
+                await _record_files(manifest,
+                                    [(path, decoded.file_size, decoded.mtime, decoded.content_hash, existing_id)])
+                return
+            if (image_id := image_id_from_hash(decoded.content_hash)) in pending:
+                logger.info("{} is identical to another image in this run. Skip...", relative_path)
+                pending.add_duplicate(image_id, decoded)
+                stats.skipped += 1
+                return
+            if phash_index is not None and (near_duplicates := phash_index.find_near_duplicates(
+                    decoded.phash, config.indexing.near_duplicate_threshold)):
+                distance, duplicate_id = near_duplicates[0]
+                logger.info("{} is a near-duplicate of the image {} (distance {}). Skip...",
+                            relative_path, duplicate_id, distance)
+                stats.skipped += 1
+                if duplicate_id in pending:
+                    pending.add_duplicate(duplicate_id, decoded)
+                else:
+                    await _record_files(manifest,
+                                        [(path, decoded.file_size, decoded.mtime, decoded.content_hash, duplicate_id)])
+                return
+            pending.add(decoded)
+            logger.info("[{}] Decoded {}", stats.items, relative_path)
+            await output.put(decoded)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("Error when decoding image {}: {}", path, e)
+            stats.failures += 1
+
+    while (path := await input_queue.get()) is not _END:
+        if len(in_flight) >= workers:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        in_flight.add(asyncio.create_task(decode(path)))
+    for task in in_flight:
+        await task
+    await output.put(_END)
+
+
+def _encode_images(images: list[DecodedImage]) -> list[ImageData]:
+    vectors = transformers_service.get_image_vectors([t.image for t in images])
+    result = []
+    for decoded, vector in zip(images, vectors):
+        image_id = image_id_from_hash(decoded.content_hash)
+        result.append(ImageData(id=image_id,
+                                url=static_url(f'{image_id}{decoded.path.suffix}'),
+                                image_vector=vector,
+                                index_date=datetime.now(),
+                                width=decoded.width,
+                                height=decoded.height,
+                                aspect_ratio=float(decoded.width) / decoded.height,
+                                phash=phash_to_hex(decoded.phash)))
+    return result
+
+
+async def clip_stage(batch_size: int, pending: PendingImages, input_queue: asyncio.Queue, output: asyncio.Queue,
+                     stats: StageStats):
+    encoded: list[tuple[DecodedImage, ImageData]] = []
+
+    async def encode(items: list[DecodedImage]):
+        encoded.extend(zip(items, await asyncio.to_thread(_encode_images, items)))
+
+    async for batch in _read_batches(input_queue, batch_size):
+        start_time = perf_counter()
+        encoded.clear()
+        batch = await _process_with_fallback(batch, encode, pending, stats, get_decoded=lambda t: t)
+        stats.record(len(batch), perf_counter() - start_time)
+        for item in encoded:
+            await output.put(item)
+    await output.put(_END)
+
+
+def _ocr_and_encode(batch: list[tuple[DecodedImage, ImageData]]) -> int:
+    """
+    :return: Number of images skipped by the text presence classifier.
+    """
+    texts, skipped = recognize_texts(ocr_service, [decoded.image for decoded, _ in batch],
+                                     [imgdata.image_vector for _, imgdata in batch], text_presence_classifier)
+    for (_, imgdata), text in zip(batch, texts):
+        imgdata.ocr_text = text
+    texts = [imgdata.ocr_text for _, imgdata in batch if imgdata.ocr_text is not None]
+    if not texts:
+        return skipped
+    vectors = iter(transformers_service.get_bert_vectors(texts))
+    for _, imgdata in batch:
+        if imgdata.ocr_text is not None:
+            imgdata.text_contain_vector = next(vectors)
+    return skipped
+
+
+async def ocr_stage(batch_size: int, pending: PendingImages, input_queue: asyncio.Queue, output: asyncio.Queue,
+                    stats: StageStats):
+    async def recognize(items: list[tuple[DecodedImage, ImageData]]):
+        stats.skipped += await asyncio.to_thread(_ocr_and_encode, items)
+
+    async for batch in _read_batches(input_queue, batch_size):
         if config.ocr_search.enable:
-            image_ocr_result = ocr_service.ocr_interface(img)  # This will modify img if you use preprocess!
-            if image_ocr_result != "":
-                text_contain_vector = transformers_service.get_bert_vector(image_ocr_result)
-            else:
-                image_ocr_result = None
-    except Exception as e:
-        logger.error("Error when processing image {}: {}", file_path, e)
-        return None
-    imgdata = ImageData(id=image_id,
-                        url=f'/static/{image_id}{img_ext}',
-                        image_vector=image_vector,
-                        text_contain_vector=text_contain_vector,
-                        index_date=datetime.now(),
-                        width=width,
-                        height=height,
-                        aspect_ratio=float(width) / height,
-                        ocr_text=image_ocr_result)
-
-    # copy to static
-    copy2(file_path, Path(config.static_file.path) / f'{image_id}{img_ext}')
-    return imgdata
+            start_time = perf_counter()
+            batch = await _process_with_fallback(batch, recognize, pending, stats)
+            stats.record(len(batch), perf_counter() - start_time)
+        for item in batch:
+            await output.put(item)
+    await output.put(_END)
+
+
+async def upload_stage(batch_size: int, manifest: IndexManifest, pending: PendingImages,
+                       input_queue: asyncio.Queue, stats: StageStats):
+    async def upload(items: list[tuple[DecodedImage, ImageData]]):
+        # The images are already decoded, so creating their thumbnails here is much cheaper than a separate
+        # --local-create-thumbnail pass
+        await store_indexed_images(storage_service, items)
+        logger.info("Upload {} element to database", len(items))
+        await db_context.insertItems([imgdata for _, imgdata in items])
+        # Only record files once they are committed, so they are indexed again if this run gets interrupted
+        files = []
+        for decoded, imgdata in items:
+            files.append((decoded.path, decoded.file_size, decoded.mtime, decoded.content_hash, imgdata.id))
+            files.extend(pending.duplicates(imgdata.id))
+        await _record_files(manifest, files)
+        # Committed last, so the images are still pending when they are retried or discarded after a failure
+        for _, imgdata in items:
+            pending.commit(imgdata.id)
+
+    async for batch in _read_batches(input_queue, batch_size):
+        start_time = perf_counter()
+        batch = await _process_with_fallback(batch, upload, pending, stats)
+        stats.record(len(batch), perf_counter() - start_time)
+
+
+def _log_ocr_stats():
+    if not config.ocr_search.enable:
+        return
+    ocr_stats = ocr_service.get_stats()
+    logger.info("[ocr] {} images recognized in {:.2f}s", ocr_stats["images"], ocr_stats["busy_seconds"])
+    if text_presence_classifier is not None:
+        text_stats = text_presence_classifier.get_stats()
+        logger.info("[ocr] Text presence check: {} images checked in {:.2f}s, {} without text skipped ({:.1%})",
+                    text_stats["checked"], text_stats["busy_seconds"], text_stats["skipped"], text_stats["skip_rate"])
+
+
+async def _report_stats(stats: list[StageStats], start_time: float):
+    while True:
+        await asyncio.sleep(STATS_LOG_INTERVAL)
+        for stage in stats:
+            stage.log(perf_counter() - start_time)
+        _log_ocr_stats()
 
 
 @logger.catch()
 async def main(args):
     root = Path(args.local_index_target_dir)
-    static_path = Path(config.static_file.path)
-    if not static_path.exists():
-        static_path.mkdir()
-    buffer = []
-    counter = 0
-    for item in root.glob('**/*.*'):
-        counter += 1
-        logger.info("[{}] Indexing {}", str(counter), str(item.relative_to(root)))
-        if item.suffix in ['.jpg', '.png', '.jpeg', '.jfif', '.webp']:
-            imgdata = copy_and_index(item)
-            if imgdata is not None:
-                buffer.append(imgdata)
-            if len(buffer) >= 20:
-                logger.info("Upload {} element to database", len(buffer))
-                await db_context.insertItems(buffer)
-                buffer.clear()
-        else:
-            logger.warning("Unsupported file type: {}. Skip...", item.suffix)
-    if len(buffer) > 0:
-        logger.info("Upload {} element to database", len(buffer))
-        await db_context.insertItems(buffer)
-        logger.success("Indexing completed! {} images indexed", counter)
+    check_thumbnail_format(config.thumbnail.format)
+    transformers_service.require_vision_tower()
+    settings = config.indexing
+    manifest = IndexManifest(settings.manifest_path, config.qdrant.coll)
+    phash_index = await PerceptualHashIndex.from_database(db_context) if settings.skip_near_duplicates else None
+    pending = PendingImages(phash_index)
+    # Bounded queues between the stages keep memory usage flat, however large the directory is
+    queues = [asyncio.Queue(maxsize=settings.queue_size) for _ in range(4)]
+    stats = [StageStats(name) for name in ("discover", "decode", "clip", "ocr", "upload")]
+    start_time = perf_counter()
+    reporter = asyncio.create_task(_report_stats(stats, start_time))
+    # The models load while the first images are discovered and decoded. The decode workers are spawned rather
+    # than forked, since forking while the models load in other threads may copy locks held by those threads.
+    model_loading = asyncio.create_task(load_models())
+    with ProcessPoolExecutor(max_workers=settings.decode_workers,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        await asyncio.gather(
+            discover_stage(root, manifest, queues[0], stats[0]),
+            decode_stage(root, manifest, phash_index, pending, executor, settings.decode_workers, queues[0], queues[1],
+                         stats[1]),
+            clip_stage(settings.clip_batch_size, pending, queues[1], queues[2], stats[2]),
+            ocr_stage(settings.ocr_batch_size, pending, queues[2], queues[3], stats[3]),
+            upload_stage(settings.upload_batch_size, manifest, pending, queues[3], stats[4]),
+        )
+    reporter.cancel()
+    await model_loading
+    manifest.close()
+    await storage_service.close()
+    for stage in stats:
+        stage.log(perf_counter() - start_time)
+    _log_ocr_stats()
+    logger.success("Indexing completed! {} images indexed", stats[-1].items)
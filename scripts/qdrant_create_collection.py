@@ -1,29 +1,132 @@
 import argparse
 
+from pydantic import BaseModel
 from qdrant_client import qdrant_client, models
 
+VECTOR_NAMES = ["image_vector", "text_contain_vector"]
+VECTOR_SIZE = 768
+# Payload fields used by search filters, see VectorDbContext.getFiltersByFilterParam
+PAYLOAD_INDEXES = {
+    "width": models.PayloadSchemaType.INTEGER,
+    "height": models.PayloadSchemaType.INTEGER,
+    "aspect_ratio": models.PayloadSchemaType.FLOAT,
+    "starred": models.PayloadSchemaType.BOOL,
+}
+
+
+class CollectionProfile(BaseModel):
+    description: str
+    hnsw_m: int | None = None
+    hnsw_ef_construct: int | None = None
+    # None, "scalar" (int8, 4x smaller) or "product" (16x smaller, lower recall)
+    quantization: str | None = None
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+
+    def hnsw_config(self) -> models.HnswConfigDiff | None:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self) -> models.QuantizationConfig | None:
+        # Quantized vectors are kept in RAM for the search, the original vectors are only read to rescore
+        match self.quantization:
+            case None:
+                return None
+            case "scalar":
+                return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+            case "product":
+                return models.ProductQuantization(product=models.ProductQuantizationConfig(
+                    compression=models.CompressionRatio.X16, always_ram=True))
+            case _:
+                raise ValueError(f"Unknown quantization {self.quantization}")
+
+
+PROFILES = {
+    "default": CollectionProfile(description="Qdrant defaults, everything in RAM."),
+    "balanced": CollectionProfile(description="Scalar quantization with rescoring, about 4x less RAM for vectors.",
+                                  hnsw_m=16, hnsw_ef_construct=128, quantization="scalar"),
+    "high-recall": CollectionProfile(description="Denser HNSW graph for better recall, at the cost of RAM and "
+                                                 "indexing time.",
+                                     hnsw_m=32, hnsw_ef_construct=256),
+    "low-memory": CollectionProfile(description="Original vectors and payload on disk, scalar-quantized vectors in "
+                                                "RAM.",
+                                    hnsw_m=16, hnsw_ef_construct=128, quantization="scalar",
+                                    on_disk_vectors=True, on_disk_payload=True),
+    "minimal-memory": CollectionProfile(description="Original vectors and payload on disk, product-quantized vectors "
+                                                    "in RAM. Rescoring reads from disk.",
+                                        hnsw_m=16, hnsw_ef_construct=128, quantization="product",
+                                        on_disk_vectors=True, on_disk_payload=True),
+}
+
 
 def parsing_args():
     parser = argparse.ArgumentParser(description='Create Qdrant collection')
     parser.add_argument('--host', type=str, required=False, default="127.0.0.1", help="Qdrant host")
     parser.add_argument('--port', type=int, required=False, default=6333, help="Qdrant port")
     parser.add_argument("--name", type=str, required=False, default="NekoImg", help="Collection name")
+    parser.add_argument("--profile", type=str, required=False, default=None, choices=PROFILES.keys(),
+                        help="Tuning profile of the collection")
+    parser.add_argument("--update", action='store_true',
+                        help="Create missing payload indexes in an existing collection instead of creating one, and "
+                             "apply the tuning profile if given")
     return parser.parse_args()
 
 
+def create_payload_indexes(client: qdrant_client.QdrantClient, collection_name: str):
+    existing = client.get_collection(collection_name).payload_schema
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name in existing:
+            continue
+        print(f"Creating {field_schema.value} payload index on {field_name}")
+        client.create_payload_index(collection_name=collection_name, field_name=field_name,
+                                    field_schema=field_schema, wait=True)
+
+
 def create_coll(args):
     client = qdrant_client.QdrantClient(host=args.host, port=args.port)
+    profile_name = args.profile or "default"
+    profile = PROFILES[profile_name]
     # create or update
-    print("Creating collection")
+    print(f"Creating collection with profile {profile_name}: {profile.description}")
     vectors_config = {
-        "image_vector": models.VectorParams(size=768, distance=models.Distance.COSINE),
-        "text_contain_vector": models.VectorParams(size=768, distance=models.Distance.COSINE)
+        name: models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE, on_disk=profile.on_disk_vectors)
+        for name in VECTOR_NAMES
     }
     client.create_collection(collection_name=args.name,
-                             vectors_config=vectors_config)
+                             vectors_config=vectors_config,
+                             hnsw_config=profile.hnsw_config(),
+                             quantization_config=profile.quantization_config(),
+                             on_disk_payload=profile.on_disk_payload)
+    create_payload_indexes(client, args.name)
     print("Collection created")
 
 
+def update_coll(args):
+    client = qdrant_client.QdrantClient(host=args.host, port=args.port)
+    create_payload_indexes(client, args.name)
+    if args.profile is None:
+        print("Collection updated")
+        return
+    profile = PROFILES[args.profile]
+    print(f"Applying profile {args.profile} to collection {args.name}: {profile.description}")
+    vectors_config = {
+        name: models.VectorParamsDiff(on_disk=profile.on_disk_vectors) for name in VECTOR_NAMES
+    }
+    # Qdrant keeps the current quantization when none is given, so it has to be disabled explicitly
+    quantization_config = profile.quantization_config() or models.Disabled.DISABLED
+    client.update_collection(collection_name=args.name,
+                             vectors_config=vectors_config,
+                             hnsw_config=profile.hnsw_config(),
+                             quantization_config=quantization_config,
+                             collection_params=models.CollectionParamsDiff(on_disk_payload=profile.on_disk_payload))
+    print("Collection updated. Qdrant rebuilds the index and quantized vectors in the background.")
+
+
 if __name__ == '__main__':
     args = parsing_args()
-    create_coll(args)
+    if args.update:
+        update_coll(args)
+    else:
+        create_coll(args)
@@ -0,0 +1,49 @@
+from io import BytesIO
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.Controllers.admin import get_ingestion_service
+from app.Services.ingestion import IngestionService
+from app.config import config
+from app.webapp import app
+
+pytestmark = pytest.mark.skipif(not config.admin_api_enable, reason="The admin API is not enabled.")
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.ingestion, "spool_path", str(tmp_path))
+    monkeypatch.setattr(config.ingestion, "max_file_size_mb", 0.01)
+    # The files are rejected before a job is created, so the service doesn't need working models
+    service = IngestionService(None, None, None, None, None, None)
+    app.dependency_overrides[get_ingestion_service] = lambda: service
+    yield tmp_path
+    del app.dependency_overrides[get_ingestion_service]
+
+
+def test_upload_larger_than_limit_is_rejected_up_front(spool_dir, monkeypatch):
+    monkeypatch.setattr(config.ingestion, "max_upload_size_mb", 0.01)
+    response = client.post("/admin/ingest/upload", headers={"X-Admin-Token": config.admin_token},
+                           files={"files": ("a.png", BytesIO(bytes(64 * 1024)), "image/png")})
+    assert response.status_code == 413
+    assert "in total" in response.json()["detail"]
+    assert not list(spool_dir.iterdir())
+
+
+def test_rejected_upload_leaves_no_spooled_file(spool_dir):
+    response = client.post("/admin/ingest/upload", headers={"X-Admin-Token": config.admin_token},
+                           files=[("files", ("small.png", BytesIO(b"small"), "image/png")),
+                                  ("files", ("large.png", BytesIO(bytes(64 * 1024)), "image/png"))])
+    assert response.status_code == 413
+    assert "large.png" in response.json()["detail"]
+    assert not list(spool_dir.iterdir())
+
+
+def test_ingest_urls_rejects_overlong_lines(spool_dir):
+    response = client.post("/admin/ingest/urls", headers={"X-Admin-Token": config.admin_token},
+                           content=b'"https://example.com/' + b"a" * (64 * 1024) + b'"')
+    assert response.status_code == 413
+    assert not list(spool_dir.iterdir())
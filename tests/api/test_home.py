@@ -8,3 +8,12 @@ client = TestClient(app)
 def test_get_home():
     response = client.get("/")
     assert response.status_code == 200
+
+
+def test_ready_once_models_are_loaded():
+    with TestClient(app) as lifespan_client:
+        # The models are loaded in the background, exiting the client waits for them
+        assert lifespan_client.get("/").status_code == 200
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["models_loaded"]
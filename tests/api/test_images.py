@@ -0,0 +1,78 @@
+from io import BytesIO
+from uuid import uuid4
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from app.Controllers import images
+from app.Services.storage.local_storage import LocalStorage
+from app.config import config
+from app.util.disk_lru_cache import DiskLRUCache
+from app.webapp import app
+
+pytestmark = pytest.mark.skipif(not config.static_file.enable, reason="Static files are not enabled.")
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def image_id(tmp_path, monkeypatch):
+    image_id = uuid4()
+    Image.new("RGB", (640, 480), (200, 80, 20)).save(tmp_path / f"{image_id}.png")
+    monkeypatch.setattr(images, "storage_service", LocalStorage(str(tmp_path), 4))
+    monkeypatch.setattr(images, "image_variant_cache", DiskLRUCache(str(tmp_path / "cache"), 1024 * 1024))
+    return image_id
+
+
+def test_resized_variant(image_id):
+    response = client.get(f"/images/{image_id}", params={"width": 320, "format": "webp"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "Accept" not in response.headers.get("vary", "")
+    with Image.open(BytesIO(response.content)) as image:
+        assert (image.format, image.size) == ("WEBP", (320, 240))
+
+
+def test_format_is_negotiated(image_id):
+    webp = client.get(f"/images/{image_id}", headers={"Accept": "image/webp,image/*"})
+    jpeg = client.get(f"/images/{image_id}", headers={"Accept": "image/*"})
+    assert webp.headers["content-type"] == "image/webp"
+    assert jpeg.headers["content-type"] == "image/jpeg"
+    assert "Accept" in webp.headers["vary"] and "Accept" in jpeg.headers["vary"]
+    assert webp.headers["etag"] != jpeg.headers["etag"]
+
+
+def test_conditional_requests(image_id):
+    response = client.get(f"/images/{image_id}", params={"format": "jpeg"})
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+    assert client.get(f"/images/{image_id}", params={"format": "jpeg"},
+                      headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/images/{image_id}", params={"format": "jpeg"},
+                      headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(f"/images/{image_id}", params={"format": "jpeg"},
+                      headers={"If-None-Match": '"other"'}).status_code == 200
+    assert client.get(f"/images/{image_id}", params={"format": "jpeg", "width": 100},
+                      headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_range_request(image_id):
+    full = client.get(f"/images/{image_id}", params={"format": "jpeg"})
+    response = client.get(f"/images/{image_id}", params={"format": "jpeg"}, headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.content == full.content[:100]
+
+
+def test_undecodable_image(image_id, tmp_path):
+    broken_id = uuid4()
+    (tmp_path / f"{broken_id}.png").write_bytes(b"not an image")
+    assert client.get(f"/images/{broken_id}", params={"format": "jpeg"}).status_code == 415
+    # No partial variant is left behind in the cache
+    assert not list((tmp_path / "cache").rglob("*"))
+
+
+def test_invalid_requests(image_id):
+    assert client.get(f"/images/{uuid4()}").status_code == 404
+    assert client.get(f"/images/{image_id}", params={"width": 8}).status_code == 422
+    assert client.get(f"/images/{image_id}",
+                      params={"width": config.image_serving.max_width + 1}).status_code == 422
@@ -0,0 +1,138 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from qdrant_client import AsyncQdrantClient, models
+
+from app.Controllers import search
+from app.Models.img_data import ImageData
+from app.Models.search_result import SearchResult
+from app.Services import db_context, transformers_service
+from app.Services.result_cache import ResultCache
+from app.webapp import app
+
+client = TestClient(app)
+
+IMAGES = [ImageData(id=uuid4(), url=f"/static/{i}.jpg", index_date=datetime.now()) for i in range(300)]
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.searches: list[tuple[int, int]] = []
+
+    async def search(self, *_, top_k: int = 10, skip: int = 0, **__) -> list[SearchResult]:
+        self.searches.append((top_k, skip))
+        return [SearchResult(img=t, score=1 - i / len(IMAGES))
+                for i, t in enumerate(IMAGES[skip:skip + top_k], start=skip)]
+
+    async def retrieve_by_ids(self, image_ids: list[str]) -> list[ImageData]:
+        images = {str(t.id): t for t in IMAGES}
+        return [images[t] for t in image_ids]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(db_context, "querySimilar", database.search)
+    monkeypatch.setattr(db_context, "querySearch", database.search)
+    monkeypatch.setattr(db_context, "retrieve_by_ids", database.retrieve_by_ids)
+    monkeypatch.setattr(search, "result_cache", ResultCache(max_memory_bytes=1024 * 1024))
+    return database
+
+
+def result_ids(response) -> list[str]:
+    return [t["img"]["id"] for t in response.json()["result"]]
+
+
+def test_search_is_served_from_cache(database):
+    url = f"/search/similar/{uuid4()}"
+    first = client.get(url, params={"count": 10})
+    assert first.status_code == 200
+    assert result_ids(first) == [str(t.id) for t in IMAGES[:10]]
+    # A few pages are fetched ahead
+    assert database.searches == [(10 * search.PREFETCH_PAGES, 0)]
+
+    again = client.get(url, params={"count": 10})
+    assert again.json()["query_id"] == first.json()["query_id"]
+    second_page = client.get(url, params={"count": 10, "cursor": first.json()["next_cursor"]})
+    assert result_ids(second_page) == [str(t.id) for t in IMAGES[10:20]]
+    assert len(database.searches) == 1
+
+
+def test_cursor_past_cached_results_continues_search(database):
+    url = f"/search/similar/{uuid4()}"
+    response = client.get(url, params={"count": 20})
+    for _ in range(search.PREFETCH_PAGES):
+        response = client.get(url, params={"count": 20, "cursor": response.json()["next_cursor"]})
+    assert result_ids(response) == [str(t.id) for t in IMAGES[100:120]]
+    assert database.searches == [(100, 0), (100, 100)]
+
+
+def test_cursor_of_another_search_is_rejected(database):
+    response = client.get(f"/search/similar/{uuid4()}", params={"count": 10})
+    other = client.get(f"/search/similar/{uuid4()}", params={"count": 10, "cursor": response.json()["next_cursor"]})
+    assert other.status_code == 400
+    assert len(database.searches) == 1
+
+
+def test_random_pick_is_not_cached(database):
+    response = client.get("/search/random", params={"count": 10})
+    assert database.searches == [(10, 0)]
+    client.get("/search/random", params={"count": 10, "cursor": response.json()["next_cursor"]})
+    assert database.searches == [(10, 0), (10, 10)]
+
+
+@pytest.fixture
+def collection(monkeypatch) -> list[ImageData]:
+    """
+    The images of a collection in an in-memory Qdrant.
+    """
+    monkeypatch.setattr(db_context, "client", AsyncQdrantClient(":memory:"))
+    size = len(transformers_service.get_random_vector())
+    rng = np.random.default_rng(0)
+    images = [ImageData(id=uuid4(), url=f"/static/{i}.jpg", index_date=datetime.now(),
+                        image_vector=rng.standard_normal(size).astype(np.float32)) for i in range(20)]
+
+    async def create():
+        await db_context.client.create_collection(db_context.collection_name, vectors_config={
+            db_context.IMG_VECTOR: models.VectorParams(size=size, distance=models.Distance.COSINE)})
+        await db_context.insertItems(images)
+
+    asyncio.run(create())
+    return images
+
+
+def test_batch_search(collection):
+    response = client.post("/search/batch", json={"queries": [
+        {"key": "cat", "type": "text", "prompt": "a cat", "count": 5},
+        {"key": "similar", "type": "similar", "id": str(collection[0].id), "count": 3},
+        {"key": "random", "type": "random", "count": 8},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert list(results) == ["cat", "similar", "random"]
+    assert [len(t) for t in results.values()] == [5, 3, 8]
+    assert str(collection[0].id) not in [t["img"]["id"] for t in results["similar"]]
+
+
+def test_batch_search_with_unknown_image(collection):
+    unknown_id = uuid4()
+    response = client.post("/search/batch", json={"queries": [
+        {"key": "known", "type": "similar", "id": str(collection[0].id)},
+        {"key": "unknown", "type": "similar", "id": str(unknown_id)},
+    ]})
+    assert response.status_code == 404
+    assert str(unknown_id) in response.json()["detail"]
+
+
+@pytest.mark.parametrize("queries", [
+    [],
+    [{"key": "a", "type": "text"}],
+    [{"key": "a", "type": "similar"}],
+    [{"key": "a", "type": "random"}, {"key": "a", "type": "random"}],
+])
+def test_batch_search_rejects_invalid_queries(queries):
+    assert client.post("/search/batch", json={"queries": queries}).status_code == 422
@@ -0,0 +1,136 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from uuid import UUID
+
+import pytest
+from PIL import Image
+
+from app.Models.img_data import ImageData
+from app.Services.duplicate_detection import PerceptualHashIndex
+from app.Services.index_manifest import IndexManifest, image_id_from_hash
+from app.util.image_decoding import DecodedImage
+from scripts import local_indexing
+from scripts.local_indexing import PendingImages, StageStats, upload_stage, clip_stage, decode_stage
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.inserted: list[ImageData] = []
+
+    async def insertItems(self, items: list[ImageData]):  # pylint: disable=invalid-name
+        self.inserted.extend(items)
+
+
+@pytest.fixture
+def database(monkeypatch) -> FakeDatabase:
+    async def store_indexed_images(*_, **__):
+        pass
+
+    database = FakeDatabase()
+    monkeypatch.setattr(local_indexing, "db_context", database)
+    monkeypatch.setattr(local_indexing, "store_indexed_images", store_indexed_images)
+    return database
+
+
+def _decoded_image(name: str) -> DecodedImage:
+    return DecodedImage(path=Path(f"/images/{name}.jpg"), image=Image.new("RGB", (32, 32)), width=32, height=32,
+                        content_hash=name, file_size=100, mtime=1.0, phash=0, format="JPEG")
+
+
+def _run_upload(manifest: IndexManifest, pending: PendingImages, images: list[DecodedImage]) -> StageStats:
+    async def run():
+        queue = asyncio.Queue()
+        for decoded in images:
+            image_id = image_id_from_hash(decoded.content_hash)
+            await queue.put((decoded, ImageData(id=image_id, url=f"/static/{image_id}.jpg",
+                                                index_date=datetime.now())))
+        await queue.put(local_indexing._END)  # pylint: disable=protected-access
+        await upload_stage(len(images), manifest, pending, queue, stats)
+
+    stats = StageStats("upload")
+    asyncio.run(run())
+    return stats
+
+
+def test_upload_survives_manifest_errors(tmp_path, database, monkeypatch):
+    manifest = IndexManifest(str(tmp_path / "manifest.sqlite3"), "coll")
+    record_many = manifest.record_many
+    calls = []
+
+    def failing_record_many(files):
+        calls.append(files)
+        if len(calls) == 1 or any(t[3] == "b" for t in files):
+            raise sqlite3.OperationalError("database is locked")
+        return record_many(files)
+
+    monkeypatch.setattr(manifest, "record_many", failing_record_many)
+    pending = PendingImages(None)
+    images = [_decoded_image(t) for t in "abc"]
+    for decoded in images:
+        pending.add(decoded)
+    duplicate = _decoded_image("a")
+    duplicate.path = Path("/images/copy-of-a.jpg")
+    pending.add_duplicate(image_id_from_hash("a"), duplicate)
+
+    stats = _run_upload(manifest, pending, images)
+    # The batch is retried image by image, and only the image whose files can't be recorded fails
+    assert (stats.items, stats.failures) == (2, 1)
+    assert {t.id for t in database.inserted} == {image_id_from_hash(t) for t in "abc"}
+    assert not any(image_id_from_hash(t) in pending for t in "abc")
+    assert manifest.is_unchanged(Path("/images/copy-of-a.jpg"), 100, 1.0)
+    assert not manifest.is_unchanged(Path("/images/b.jpg"), 100, 1.0)
+
+
+def test_clip_failure_only_fails_the_bad_image(monkeypatch):
+    def encode_images(images: list[DecodedImage]) -> list[ImageData]:
+        if any(t.content_hash == "b" for t in images):
+            raise ValueError("bad image")
+        return [ImageData(id=image_id_from_hash(t.content_hash), url="/static/image.jpg", index_date=datetime.now())
+                for t in images]
+
+    async def run():
+        input_queue, output = asyncio.Queue(), asyncio.Queue()
+        for decoded in images:
+            pending.add(decoded)
+            await input_queue.put(decoded)
+        await input_queue.put(local_indexing._END)  # pylint: disable=protected-access
+        await clip_stage(len(images), pending, input_queue, output, stats)
+        return [output.get_nowait() for _ in range(output.qsize())]
+
+    monkeypatch.setattr(local_indexing, "_encode_images", encode_images)
+    pending = PendingImages(None)
+    images = [_decoded_image(t) for t in "abc"]
+    stats = StageStats("clip")
+    results = asyncio.run(run())
+    assert [decoded.content_hash for decoded, _ in results[:-1]] == ["a", "c"]
+    assert results[-1] is None
+    assert (stats.items, stats.failures) == (2, 1)
+    assert image_id_from_hash("b") not in pending
+
+
+class FailingHashIndex(PerceptualHashIndex):
+    def find_near_duplicates(self, phash: int, threshold: int) -> list[tuple[int, UUID]]:
+        raise RuntimeError("index error")
+
+
+def test_decode_errors_are_counted(tmp_path):
+    Image.new("RGB", (32, 32), (255, 0, 0)).save(tmp_path / "good.png")
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    manifest = IndexManifest(str(tmp_path / "manifest.sqlite3"), "coll")
+
+    async def run():
+        input_queue, output = asyncio.Queue(), asyncio.Queue()
+        for name in ("good.png", "broken.png"):
+            await input_queue.put(tmp_path / name)
+        await input_queue.put(local_indexing._END)  # pylint: disable=protected-access
+        with ThreadPoolExecutor() as executor:
+            await decode_stage(tmp_path, manifest, FailingHashIndex(), PendingImages(None), executor, 2,
+                               input_queue, output, stats)
+        return output.qsize()
+
+    stats = StageStats("decode")
+    assert asyncio.run(run()) == 1
+    assert stats.failures == 2
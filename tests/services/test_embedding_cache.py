@@ -0,0 +1,27 @@
+import asyncio
+
+import numpy as np
+
+from app.Services.embedding_cache import EmbeddingCache
+
+
+def test_keys_are_normalized():
+    assert EmbeddingCache.make_key("clip", "vision", "  Cat   Girl ") == EmbeddingCache.make_key("clip", "vision",
+                                                                                                 "cat girl")
+    assert EmbeddingCache.make_key("clip", "vision", "cat") != EmbeddingCache.make_key("bert", "ocr", "cat")
+
+
+def test_disk_store_is_shared(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    key = EmbeddingCache.make_key("clip", "vision", "sunset")
+    vector = np.arange(4, dtype=np.float32)
+
+    async def run():
+        writer = EmbeddingCache(max_memory_bytes=1024, disk_path=path)
+        await writer.put(key, vector)
+        reader = EmbeddingCache(max_memory_bytes=1024, disk_path=path)
+        return await reader.get(key), reader.get_stats()
+
+    cached, stats = asyncio.run(run())
+    np.testing.assert_array_equal(cached, vector)
+    assert stats["disk_hits"] == 1
@@ -0,0 +1,46 @@
+from pathlib import Path
+from uuid import UUID
+
+from app.Services.index_manifest import IndexManifest, image_id_from_hash
+
+
+def test_image_id_is_derived_from_hash():
+    assert image_id_from_hash("abc") == image_id_from_hash("abc")
+    assert image_id_from_hash("abc") != image_id_from_hash("abd")
+
+
+def test_manifest_tracks_processed_files(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.sqlite3"), "coll")
+    path = Path("/images/cat.jpg")
+    image_id = image_id_from_hash("abc")
+    assert not manifest.is_unchanged(path, 100, 1.0)
+
+    manifest.record_many([(path, 100, 1.0, "abc", image_id)])
+    assert manifest.is_unchanged(path, 100, 1.0)
+    assert not manifest.is_unchanged(path, 100, 2.0)
+    assert manifest.find_by_hash("abc") == image_id
+
+    other_collection = IndexManifest(str(tmp_path / "manifest.sqlite3"), "other")
+    assert not other_collection.is_unchanged(path, 100, 1.0)
+    assert other_collection.find_by_hash("abc") is None
+
+
+def test_manifest_reports_images_replaced_by_changed_files(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.sqlite3"), "coll")
+    old_id, new_id = image_id_from_hash("old"), image_id_from_hash("new")
+    manifest.record_many([(Path("/images/a.jpg"), 100, 1.0, "old", old_id),
+                          (Path("/images/b.jpg"), 100, 1.0, "old", old_id)])
+
+    # b.jpg still points to the old image
+    assert manifest.record_many([(Path("/images/a.jpg"), 120, 2.0, "new", new_id)]) == []
+    assert manifest.record_many([(Path("/images/b.jpg"), 120, 2.0, "new", new_id)]) == [old_id]
+    assert manifest.find_by_hash("old") is None
+    # Recording a file again with the same content replaces nothing
+    assert manifest.record_many([(Path("/images/b.jpg"), 120, 3.0, "new", new_id)]) == []
+
+
+def test_manifest_never_reports_images_of_near_duplicates(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.sqlite3"), "coll")
+    uploaded_id = UUID("2a8e4b1c-58a5-4b5e-9d0f-3f7c1e6a9b20")
+    manifest.record_many([(Path("/images/a.jpg"), 100, 1.0, "resized", uploaded_id)])
+    assert manifest.record_many([(Path("/images/a.jpg"), 120, 2.0, "new", image_id_from_hash("new"))]) == []
@@ -0,0 +1,95 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.Services.inference_scheduler import BatchingQueue, InferenceQueueFullError, InferenceScheduler
+
+
+def test_concurrent_submissions_are_batched():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return np.array([[t * 2] for t in items])
+
+    async def run():
+        queue = BatchingQueue("test", batch_fn, max_batch_size=8, max_wait=0.05)
+        results = await asyncio.gather(*(queue.submit(i) for i in range(5)))
+        await queue.close()
+        return results, queue.get_stats()
+
+    results, stats = asyncio.run(run())
+    assert [t[0] for t in results] == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert stats["batches"] == 1
+    assert stats["batch_size"]["buckets"]["<=8"] == 1
+
+
+def test_batch_size_is_capped():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(len(items))
+        return items
+
+    async def run():
+        queue = BatchingQueue("test", batch_fn, max_batch_size=4, max_wait=0.05)
+        results = await queue.submit_many(list(range(10)))
+        await queue.close()
+        return results
+
+    assert asyncio.run(run()) == list(range(10))
+    assert calls == [4, 4, 2]
+
+
+def test_batch_failure_is_propagated():
+    def batch_fn(_):
+        raise RuntimeError("model exploded")
+
+    async def run():
+        queue = BatchingQueue("test", batch_fn, max_batch_size=4, max_wait=0)
+        try:
+            await queue.submit(1)
+        finally:
+            await queue.close()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+def test_full_queue_rejects_submissions():
+    def batch_fn(items):
+        return items
+
+    async def run():
+        queue = BatchingQueue("test", batch_fn, max_batch_size=4, max_wait=0.05, max_queue_size=3)
+        try:
+            await queue.submit_many([1, 2, 3, 4])
+        finally:
+            await queue.close()
+
+    with pytest.raises(InferenceQueueFullError):
+        asyncio.run(run())
+
+
+def test_scheduler_serves_again_after_close():
+    class DoublingService:
+        @staticmethod
+        def get_text_vectors(texts):
+            return np.array([[len(t) * 2.0] for t in texts])
+
+        get_image_vectors = get_bert_vectors = get_text_vectors
+
+    async def run():
+        scheduler = InferenceScheduler(DoublingService())
+        first = await scheduler.get_text_vector("cat")
+        executor = scheduler._executor  # pylint: disable=protected-access
+        await scheduler.close()
+        assert executor._shutdown  # pylint: disable=protected-access
+        second = await scheduler.get_text_vector("cats")
+        await scheduler.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first[0] == 6 and second[0] == 8
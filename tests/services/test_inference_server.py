@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.Services import transformers_service
+from app.Services.inference_scheduler import InferenceScheduler
+from app.Services.inference_server import InferenceServer
+from app.Services.remote_transformers_service import RemoteTransformersService
+from app.Services.transformers_service import TransformersService, ModelUnavailableError
+from app.config import InferenceServerSettings, config
+
+PROMPTS = ["cat", "a girl standing under the cherry blossoms at sunset"]
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers = []
+    clients = []
+
+    def start(service: TransformersService) -> RemoteTransformersService:
+        """
+        Serve `service` and return a client of the server.
+        """
+        socket_path = str(tmp_path / f"inference-{len(servers)}.sock")
+        scheduler = InferenceScheduler(service)
+        server = InferenceServer(scheduler, service, socket_path)
+        asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+        servers.append((server, scheduler))
+        clients.append(RemoteTransformersService(
+            InferenceServerSettings(socket_path=socket_path, timeout=30, connect_timeout=1)))
+        return clients[-1]
+
+    yield start
+    for client in clients:
+        client.close()
+    for server, scheduler in servers:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        asyncio.run_coroutine_threadsafe(scheduler.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_remote_vectors_match_local(start_server):
+    remote = start_server(transformers_service)
+    image = Image.new("RGBA", (64, 48), (10, 120, 200, 255))
+    np.testing.assert_allclose(remote.get_text_vectors(PROMPTS), transformers_service.get_text_vectors(PROMPTS),
+                               atol=1e-5)
+    np.testing.assert_allclose(remote.get_image_vector(image), transformers_service.get_image_vector(image),
+                               atol=1e-5)
+    if config.ocr_search.enable:
+        np.testing.assert_allclose(remote.get_bert_vectors(PROMPTS), transformers_service.get_bert_vectors(PROMPTS),
+                                   atol=1e-5)
+
+
+def test_remote_takes_the_model_role_of_the_server(start_server):
+    remote = start_server(TransformersService(model_role="text"))
+    remote.load()
+    assert remote.model_role == "text"
+    with pytest.raises(ModelUnavailableError):
+        remote.get_image_vector(Image.new("RGB", (32, 32)))
@@ -0,0 +1,155 @@
+import asyncio
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+from qdrant_client import AsyncQdrantClient, models
+
+from app.Services import transformers_service
+from app.Services.inference_scheduler import InferenceScheduler
+from app.Services.ingestion import IngestionService, IngestionError
+from app.Services.ocr_services import OCRService, DisabledOCRService
+from app.Services.storage.local_storage import LocalStorage
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config
+
+
+def _encode_image(seed: int, size: tuple[int, int] = (64, 48)) -> bytes:
+    pixels = (np.random.default_rng(seed).random((size[1], size[0], 3)) * 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.ingestion, "spool_path", str(tmp_path / "spool"))
+    monkeypatch.setattr(config.ocr_search, "enable", False)
+    return tmp_path / "spool"
+
+
+class FlakyOCRService(OCRService):
+    """
+    Fails on any batch of several images, and on the 32x32 images.
+    """
+    pad_images = False
+
+    def _process(self, img: Image.Image) -> str:
+        if img.size == (32, 32):
+            raise ValueError("unreadable image")
+        return f"{img.width}x{img.height}"
+
+    def _process_batch(self, images: list[Image.Image]) -> list[str]:
+        if len(images) > 1:
+            raise RuntimeError("batch failed")
+        return super()._process_batch(images)
+
+
+def _create_service(tmp_path, db_context: VectorDbContext, scheduler: InferenceScheduler,
+                    ocr_service: OCRService | None = None) -> IngestionService:
+    return IngestionService(scheduler, db_context, LocalStorage(str(tmp_path / "static"), 4),
+                            ocr_service or DisabledOCRService(), None, None)
+
+
+def _create_collection(db_context: VectorDbContext):
+    size = len(transformers_service.get_random_vector())
+    return db_context.client.create_collection(db_context.collection_name, vectors_config={
+        db_context.IMG_VECTOR: models.VectorParams(size=size, distance=models.Distance.COSINE),
+        db_context.TEXT_VECTOR: models.VectorParams(size=size, distance=models.Distance.COSINE)})
+
+
+def test_job_ingests_spooled_files(tmp_path, spool_dir):
+    db_context = VectorDbContext()
+    db_context.client = AsyncQdrantClient(":memory:")
+
+    async def run():
+        await _create_collection(db_context)
+        scheduler = InferenceScheduler(transformers_service)
+        service = _create_service(tmp_path, db_context, scheduler)
+        items = [await service.spool_upload(f"{i}.png", BytesIO(_encode_image(seed)))
+                 for i, seed in enumerate([0, 1, 0])]
+        items.append(await service.spool_upload("broken.png", BytesIO(b"not an image")))
+        job = service.submit(items)
+        while not job.finished:
+            await asyncio.sleep(0.05)
+        await scheduler.close()
+        return job, await db_context.client.count(db_context.collection_name)
+
+    job, count = asyncio.run(run())
+    assert job.state == "completed"
+    assert (job.succeeded, job.skipped, job.failed) == (2, 1, 1)
+    assert job.errors[0][0] == "broken.png"
+    assert count.count == 2
+    # The spooled files are moved to the storage or removed
+    assert not list(spool_dir.iterdir())
+    assert len(list((tmp_path / "static").glob("*.png"))) == 2
+
+
+def test_failed_batch_ocr_is_retried_per_image(tmp_path, spool_dir, monkeypatch):
+    monkeypatch.setattr(config.ocr_search, "enable", True)
+    db_context = VectorDbContext()
+    db_context.client = AsyncQdrantClient(":memory:")
+
+    async def run():
+        await _create_collection(db_context)
+        scheduler = InferenceScheduler(transformers_service)
+
+        async def get_bert_vectors(texts: list[str]) -> np.ndarray:
+            # The BERT model is not loaded when the OCR search was disabled at the first inference
+            return np.stack([transformers_service.get_random_vector() for _ in texts])
+
+        monkeypatch.setattr(scheduler, "get_bert_vectors", get_bert_vectors)
+        service = _create_service(tmp_path, db_context, scheduler, FlakyOCRService())
+        items = [await service.spool_upload(f"{i}.png", BytesIO(_encode_image(i, size)))
+                 for i, size in enumerate([(64, 48), (32, 32), (48, 40)])]
+        job = service.submit(items)
+        while not job.finished:
+            await asyncio.sleep(0.05)
+        await scheduler.close()
+        points, _ = await db_context.client.scroll(db_context.collection_name, with_payload=True)
+        return job, points
+
+    job, points = asyncio.run(run())
+    assert (job.succeeded, job.failed) == (2, 1)
+    assert job.errors[0][0] == "1.png"
+    assert sorted(t.payload["ocr_text"] for t in points) == ["48x40", "64x48"]
+
+
+def test_identical_file_is_retried_after_a_failure(tmp_path, spool_dir, monkeypatch):
+    monkeypatch.setattr(config.ingestion, "batch_size", 1)
+    db_context = VectorDbContext()
+    db_context.client = AsyncQdrantClient(":memory:")
+
+    async def run():
+        await _create_collection(db_context)
+        scheduler = InferenceScheduler(transformers_service)
+        get_image_vector = scheduler.get_image_vector
+        calls = []
+
+        async def failing_get_image_vector(image):
+            calls.append(image)
+            if len(calls) == 1:
+                raise RuntimeError("inference failed")
+            return await get_image_vector(image)
+
+        monkeypatch.setattr(scheduler, "get_image_vector", failing_get_image_vector)
+        service = _create_service(tmp_path, db_context, scheduler)
+        items = [await service.spool_upload(f"{i}.png", BytesIO(_encode_image(0))) for i in range(2)]
+        job = service.submit(items)
+        while not job.finished:
+            await asyncio.sleep(0.05)
+        await scheduler.close()
+        return job, await db_context.client.count(db_context.collection_name)
+
+    job, count = asyncio.run(run())
+    assert (job.succeeded, job.skipped, job.failed) == (1, 0, 1)
+    assert count.count == 1
+
+
+def test_oversized_upload_is_not_spooled(tmp_path, spool_dir, monkeypatch):
+    monkeypatch.setattr(config.ingestion, "max_file_size_mb", 0.01)
+    service = _create_service(tmp_path, VectorDbContext(), InferenceScheduler(transformers_service))
+    with pytest.raises(IngestionError):
+        asyncio.run(service.spool_upload("large.bin", BytesIO(bytes(64 * 1024))))
+    assert not list(spool_dir.iterdir())
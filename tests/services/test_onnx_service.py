@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.Services.transformers_service import TransformersService
+from app.config import config, OnnxSettings
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+# pylint: disable=wrong-import-position
+from app.Services.onnx_service import OnnxTransformersService
+
+PROMPTS = ["cat", "a girl standing under the cherry blossoms at sunset", "猫"]
+# Minimum cosine similarity with the PyTorch vectors
+MIN_SIMILARITY = {False: 0.999, True: 0.95}
+
+
+# The PyTorch service, whatever the configured backend
+torch_service = TransformersService()
+
+
+def _images() -> list[Image.Image]:
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 256, (300, 200 + 50 * i, 3), dtype=np.uint8)) for i in range(3)]
+
+
+def _min_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    a = a / np.linalg.norm(a, axis=-1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=-1, keepdims=True)
+    return float(np.min(np.sum(a * b, axis=-1)))
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["fp32", "int8"])
+def onnx_service(request, tmp_path_factory) -> tuple[OnnxTransformersService, float]:
+    service = OnnxTransformersService(OnnxSettings(cache_path=str(tmp_path_factory.getbasetemp() / "onnx"),
+                                                   quantize=request.param))
+    return service, MIN_SIMILARITY[request.param]
+
+
+def test_clip_vectors_match_pytorch(onnx_service):
+    service, threshold = onnx_service
+    assert _min_similarity(service.get_text_vectors(PROMPTS),
+                           torch_service.get_text_vectors(PROMPTS)) > threshold
+    images = _images()
+    assert _min_similarity(service.get_image_vectors(images),
+                           torch_service.get_image_vectors(images)) > threshold
+
+
+@pytest.mark.skipif(not config.ocr_search.enable, reason="OCR search is disabled.")
+def test_bert_vectors_match_pytorch(onnx_service):
+    service, threshold = onnx_service
+    assert _min_similarity(service.get_bert_vectors(PROMPTS),
+                           torch_service.get_bert_vectors(PROMPTS)) > threshold
@@ -0,0 +1,30 @@
+from datetime import datetime
+from uuid import uuid4
+
+import numpy as np
+
+from app.Models.img_data import ImageData
+from app.Models.search_result import SearchResult
+from app.Services.reranker import ProductReranker, stack_vectors
+
+
+def test_product_reranker_matches_per_item_cosine():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = rng.standard_normal(16).astype(np.float32)
+    results = [SearchResult(img=ImageData(id=uuid4(), url="", index_date=datetime.now()), score=float(s))
+               for s in rng.random(50)]
+    expected = {t.img.id: t.score * float(np.dot(v, query) / np.linalg.norm(query)) for t, v in zip(results, vectors)}
+
+    reranked = ProductReranker().rerank(results, vectors, query)
+
+    assert [t.img.id for t in reranked] == sorted(expected, key=expected.get, reverse=True)
+    for t in reranked:
+        assert abs(t.score - expected[t.img.id]) < 1e-5
+
+
+def test_missing_vectors_are_zero_rows():
+    matrix = stack_vectors([np.ones(4), None], 4)
+    assert matrix.dtype == np.float32
+    np.testing.assert_array_equal(matrix[1], np.zeros(4))
@@ -0,0 +1,42 @@
+from datetime import datetime
+from uuid import uuid4
+
+from app.Models.img_data import ImageData
+from app.Models.search_result import SearchResult
+from app.Services.result_cache import ResultCache
+
+
+def make_results(n: int) -> list[SearchResult]:
+    return [SearchResult(img=ImageData(id=uuid4(), url="", index_date=datetime.now()), score=1 - i / n)
+            for i in range(n)]
+
+
+def test_identical_searches_share_query_id():
+    cache = ResultCache(max_memory_bytes=1024 * 1024)
+    results = make_results(20)
+    query_id = cache.put(results, 100, ("text", "cat"))
+    found_id, query = cache.find(("text", "cat"))
+    assert found_id == query_id
+    assert query.ids == tuple(str(t.img.id) for t in results)
+    assert cache.get(query_id) is query
+    assert cache.find(("text", "dog")) is None
+
+
+def test_evicted_query_invalidates_signature():
+    cache = ResultCache(max_memory_bytes=4096)
+    cache.put(make_results(10), 10, ("text", "first"))
+    for i in range(10):
+        cache.put(make_results(10), 10, ("text", str(i)))
+    assert cache.find(("text", "first")) is None
+
+
+def test_extend_skips_known_results():
+    cache = ResultCache(max_memory_bytes=1024 * 1024)
+    first, second = make_results(10), make_results(10)
+    query_id = cache.put(first, 10)
+    query = cache.get(query_id)
+    assert not query.complete
+    extended = cache.extend(query_id, query, first[-2:] + second[:5], 10)
+    assert extended.ids == query.ids + tuple(str(t.img.id) for t in second[:5])
+    assert extended.complete
+    assert cache.get(query_id) is extended
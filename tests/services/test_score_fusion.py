@@ -0,0 +1,24 @@
+from datetime import datetime
+from uuid import uuid4
+
+from app.Models.img_data import ImageData
+from app.Models.search_result import SearchResult
+from app.Services.score_fusion import reciprocal_rank_fusion, weighted_score_fusion
+
+IDS = [uuid4() for _ in range(4)]
+
+
+def results(*scored: tuple[int, float]) -> list[SearchResult]:
+    return [SearchResult(img=ImageData(id=IDS[i], url="", index_date=datetime.now()), score=score)
+            for i, score in scored]
+
+
+def test_rrf_favors_results_found_by_both():
+    fused = reciprocal_rank_fusion([results((0, 0.3), (1, 0.2)), results((2, 0.9), (1, 0.8))], [0.5, 0.5])
+    assert [t.img.id for t in fused] == [IDS[1], IDS[0], IDS[2]]
+
+
+def test_weighted_fusion_normalizes_scores():
+    # The OCR scores are much higher, but only the position within each list matters after normalization
+    fused = weighted_score_fusion([results((0, 0.30), (1, 0.20)), results((2, 0.95), (3, 0.90))], [0.8, 0.2])
+    assert [t.img.id for t in fused] == [IDS[0], IDS[2], IDS[1], IDS[3]]
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from app.Services.storage.local_storage import LocalStorage
+
+
+async def _round_trip(storage, tmp_path):
+    source = tmp_path / "source.jpg"
+    source.write_bytes(b"image")
+    key = f"test/{uuid.uuid4()}.jpg"
+    await storage.upload_file(source, key)
+    assert source.exists()
+    assert (await storage.stat(key)).size == 5
+    await storage.upload_bytes(b"thumbnail", f"{key}.webp")
+    await storage.move(key, f"{key}.moved")
+    assert not await storage.exists(key)
+    await storage.download_file(f"{key}.moved", tmp_path / "downloaded")
+    assert (tmp_path / "downloaded").read_bytes() == b"image"
+    results = await storage.run_transfers([storage.delete(f"{key}.moved"), storage.delete(f"{key}.webp")])
+    assert len(results) == 2
+    assert await storage.stat(f"{key}.webp") is None
+
+
+def test_local_storage(tmp_path):
+    storage = LocalStorage(str(tmp_path / "static"), max_concurrent_transfers=2)
+    asyncio.run(_round_trip(storage, tmp_path))
+    assert storage.local_path("a/b.jpg") == (tmp_path / "static" / "a" / "b.jpg").resolve()
+    assert asyncio.run(storage.presign_url("a/b.jpg")) is None
+
+
+def test_local_storage_rejects_keys_outside_root(tmp_path):
+    storage = LocalStorage(str(tmp_path / "static"), max_concurrent_transfers=2)
+    with pytest.raises(ValueError):
+        asyncio.run(storage.stat("../secret"))
+
+
+@pytest.mark.skipif("TEST_S3_ENDPOINT_URL" not in os.environ,
+                    reason="Set TEST_S3_ENDPOINT_URL (and the TEST_S3_* credentials) to test against MinIO")
+def test_s3_storage(tmp_path):
+    pytest.importorskip("aioboto3")
+    from app.Services.storage.s3_storage import S3Storage
+    from app.config import S3StorageSettings
+
+    settings = S3StorageSettings(endpoint_url=os.environ["TEST_S3_ENDPOINT_URL"],
+                                 bucket=os.environ.get("TEST_S3_BUCKET", "nekoimg-test"),
+                                 access_key_id=os.environ.get("TEST_S3_ACCESS_KEY_ID"),
+                                 secret_access_key=os.environ.get("TEST_S3_SECRET_ACCESS_KEY"),
+                                 path_prefix="pytest")
+
+    async def run():
+        storage = S3Storage(settings, max_concurrent_transfers=2)
+        try:
+            await _round_trip(storage, tmp_path)
+            assert (await storage.presign_url("a.jpg")).startswith(settings.endpoint_url)
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
@@ -0,0 +1,50 @@
+import numpy as np
+from PIL import Image
+
+from app.Services.ocr_services import OCRService, recognize_texts
+from app.Services.text_presence import TextPresenceClassifier, TEXT_PROMPTS
+
+
+class PromptVectorsService:
+    """
+    Puts the text prompts on the first axis and the others on the second one.
+    """
+
+    @staticmethod
+    def get_text_vectors(texts: list[str]) -> np.ndarray:
+        return np.array([[1.0, 0.0] if t in TEXT_PROMPTS else [0.0, 1.0] for t in texts], dtype=np.float32)
+
+
+class SizeOCRService(OCRService):
+    def __init__(self, pad_images: bool):
+        super().__init__()
+        self.pad_images = pad_images
+
+    def _process(self, img: Image.Image) -> str:
+        return f"{img.width}x{img.height}"
+
+
+def test_images_without_text_are_skipped():
+    classifier = TextPresenceClassifier(PromptVectorsService(), threshold=0.5)
+    mask = classifier.has_text(np.array([[1.0, 0.0], [0.0, 1.0], [0.8, 0.6]], dtype=np.float32))
+    assert mask.tolist() == [True, False, True]
+    stats = classifier.get_stats()
+    assert stats["checked"] == 3 and stats["skipped"] == 1
+
+
+def test_ocr_batch_only_pads_when_the_backend_needs_it():
+    images = [Image.new("RGB", (2048, 1024)), Image.new("L", (300, 200))]
+    assert SizeOCRService(pad_images=True).ocr_batch(images) == ["1024x1024", "1024x1024"]
+    service = SizeOCRService(pad_images=False)
+    assert service.ocr_batch(images) == ["1024x512", "300x200"]
+    assert service.get_stats()["images"] == 2
+
+
+def test_recognize_texts_skips_images_without_text():
+    classifier = TextPresenceClassifier(PromptVectorsService(), threshold=0.5)
+    service = SizeOCRService(pad_images=False)
+    images = [Image.new("RGB", (64, 32)), Image.new("RGB", (48, 32))]
+    texts, skipped = recognize_texts(service, images, [np.array([0.0, 1.0]), np.array([1.0, 0.0])], classifier)
+    assert texts == [None, "48x32"]
+    assert skipped == 1
+    assert service.get_stats()["images"] == 1
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.Services import transformers_service
+from app.Services.transformers_service import TransformersService, ModelUnavailableError
+from app.config import config
+
+PROMPTS = ["cat", "a girl standing under the cherry blossoms at sunset", "猫"]
+
+
+def test_batched_text_vectors_match_single_calls():
+    batched = transformers_service.get_text_vectors(PROMPTS)
+    for prompt, vector in zip(PROMPTS, batched):
+        np.testing.assert_allclose(vector, transformers_service.get_text_vector(prompt), atol=1e-5)
+
+
+@pytest.mark.skipif(not config.ocr_search.enable, reason="OCR search is disabled.")
+def test_batched_bert_vectors_match_single_calls():
+    batched = transformers_service.get_bert_vectors(PROMPTS)
+    for prompt, vector in zip(PROMPTS, batched):
+        np.testing.assert_allclose(vector, transformers_service.get_bert_vector(prompt), atol=1e-5)
+
+
+def test_models_are_loaded_on_first_use():
+    service = TransformersService()
+    assert not service.loaded
+    vector = service.get_text_vector("cat")
+    assert service.loaded
+    np.testing.assert_allclose(vector, transformers_service.get_text_vector("cat"), atol=1e-5)
+
+
+@pytest.mark.parametrize("role", ["text", "vision"])
+def test_single_tower_roles_match_full_model(role):
+    service = TransformersService(model_role=role)
+    image = Image.new("RGB", (64, 48), (10, 120, 200))
+    if role == "text":
+        np.testing.assert_allclose(service.get_text_vectors(PROMPTS), transformers_service.get_text_vectors(PROMPTS),
+                                   atol=1e-5)
+        with pytest.raises(ModelUnavailableError):
+            service.get_image_vector(image)
+        assert service.clip_vision_model is None and service.clip_model is None
+    else:
+        np.testing.assert_allclose(service.get_image_vector(image), transformers_service.get_image_vector(image),
+                                   atol=1e-5)
+        with pytest.raises(ModelUnavailableError):
+            service.get_text_vector("cat")
+        assert service.clip_text_model is None and service.clip_model is None
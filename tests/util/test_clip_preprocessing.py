@@ -0,0 +1,35 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+from app.util.clip_preprocessing import ClipImagePreprocessor
+from app.util.image_decoding import decode_image_for_clip
+
+
+def _random_image(width: int, height: int, mode: str = "RGB") -> Image.Image:
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return Image.fromarray(pixels).convert(mode)
+
+
+def test_preprocessing_matches_transformers():
+    image_processor = CLIPImageProcessor()
+    images = [_random_image(640, 480), _random_image(300, 500, "RGBA"), _random_image(224, 224, "L")]
+    expected = image_processor(images=[t.convert("RGB") for t in images], return_tensors="np")["pixel_values"]
+    pixel_values = ClipImagePreprocessor(image_processor)(images)
+    assert pixel_values.shape == expected.shape == (3, 3, 224, 224)
+    assert pixel_values.dtype == np.float32
+    np.testing.assert_allclose(pixel_values, expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+def test_decode_for_clip_keeps_the_shortest_side_above_the_minimum(fmt):
+    file = BytesIO()
+    _random_image(4000, 3000).save(file, fmt)
+    file.seek(0)
+    image = decode_image_for_clip(file, min_size=448)
+    assert image.mode == "RGB"
+    assert 448 <= min(image.size) < 448 * 2
+    assert abs(image.width / image.height - 4 / 3) < 0.01
@@ -0,0 +1,43 @@
+from app.util.disk_lru_cache import DiskLRUCache
+
+
+def _put(cache: DiskLRUCache, name: str, size: int):
+    temporary_path = cache.temporary_path(name)
+    temporary_path.write_bytes(b"x" * size)
+    return cache.put(name, temporary_path)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 250)
+    _put(cache, "a", 100)
+    _put(cache, "b", 100)
+    assert cache.get("a") is not None
+    _put(cache, "c", 100)
+    assert cache.get("b") is None
+    assert not (tmp_path / "b").exists()
+    assert cache.get("a").read_bytes() == b"x" * 100
+    assert cache.get_stats()["size_bytes"] == 200
+
+
+def test_index_is_rebuilt_on_startup(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 1000)
+    _put(cache, "a", 100)
+    cache.temporary_path("b").write_bytes(b"partial")
+    reopened = DiskLRUCache(str(tmp_path), 1000)
+    assert reopened.get("a") is not None
+    assert reopened.get("b") is None
+    assert reopened.get_stats()["size_bytes"] == 100
+
+
+def test_processes_share_the_directory(tmp_path):
+    first = DiskLRUCache(str(tmp_path), 250, rescan_interval=0)
+    second = DiskLRUCache(str(tmp_path), 250, rescan_interval=0)
+    _put(first, "a", 100)
+    _put(second, "b", 100)
+    assert second.get("a") is not None
+    # The files of the other process count toward the limit, and its uses toward their recency
+    _put(first, "c", 100)
+    assert first.get("b") is None
+    assert second.get("b") is None
+    assert second.get("a").read_bytes() == b"x" * 100
+    assert first.get_stats()["size_bytes"] == 200
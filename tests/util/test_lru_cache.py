@@ -0,0 +1,33 @@
+from app.util.lru_cache import LRUCache
+
+
+def test_evicts_least_recently_used_entry_by_size():
+    cache = LRUCache(max_size=3, sizeof=lambda k, v: len(v))
+    cache.put("a", "x")
+    cache.put("b", "y")
+    cache.put("c", "z")
+    assert cache.get("a") == "x"
+    cache.put("d", "w")
+    assert cache.get("b") is None
+    assert cache.get("a") == "x"
+    assert cache.size == 3
+    assert cache.evictions == 1
+
+
+def test_entries_larger_than_the_cache_are_not_stored():
+    cache = LRUCache(max_size=3, sizeof=lambda k, v: len(v))
+    cache.put("a", "xxxx")
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_expired_entries_are_missing():
+    now = [0.0]
+    cache = LRUCache(max_size=10, sizeof=lambda k, v: 1, ttl=5, clock=lambda: now[0])
+    cache.put("a", 1)
+    now[0] = 4
+    assert cache.get("a") == 1
+    now[0] = 6
+    assert cache.get("a") is None
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
@@ -0,0 +1,49 @@
+import random
+
+import numpy as np
+from PIL import Image
+
+from app.util.bk_tree import BKTree
+from app.util.perceptual_hash import phash, hamming_distance, phash_to_hex, phash_from_hex
+
+
+def _sample_image(seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    small = (rng.random((8, 8, 3)) * 255).astype(np.uint8)
+    return Image.fromarray(small).resize((400, 300), Image.Resampling.BICUBIC)
+
+
+def test_resized_copy_is_a_near_duplicate():
+    original = _sample_image(0)
+    resized = original.resize((200, 150))
+    assert hamming_distance(phash(original), phash(resized)) <= 4
+    assert hamming_distance(phash(original), phash(_sample_image(1))) > 10
+
+
+def test_hex_round_trip():
+    value = phash(_sample_image(0))
+    assert phash_from_hex(phash_to_hex(value)) == value
+    assert len(phash_to_hex(value)) == 16
+
+
+def test_bk_tree_search_matches_brute_force():
+    rng = random.Random(0)
+    keys = [rng.getrandbits(16) for _ in range(500)]
+    tree = BKTree(hamming_distance)
+    for i, key in enumerate(keys):
+        tree.add(key, i)
+    query = rng.getrandbits(16)
+    expected = sorted(i for i, key in enumerate(keys) if hamming_distance(key, query) <= 3)
+    assert sorted(value for _, _, value in tree.search(query, 3)) == expected
+    assert len(tree) == 500
+
+
+def test_bk_tree_remove():
+    tree = BKTree(hamming_distance)
+    for i, key in enumerate([0b0000, 0b0001, 0b0011, 0b0001]):
+        tree.add(key, i)
+    assert tree.remove(0b0001, 1)
+    assert not tree.remove(0b0001, 1)
+    assert not tree.remove(0b1111, 0)
+    assert sorted(value for _, _, value in tree.search(0b0001, 1)) == [0, 2, 3]
+    assert len(tree) == 3
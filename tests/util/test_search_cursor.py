@@ -0,0 +1,17 @@
+from uuid import uuid4
+
+import pytest
+
+from app.util.search_cursor import SearchCursor, InvalidCursorError
+
+
+def test_round_trip():
+    cursor = SearchCursor(offset=40, query_id=uuid4(), seed=12345)
+    assert SearchCursor.decode(cursor.encode()) == cursor
+    assert SearchCursor.decode(SearchCursor(offset=0).encode()) == SearchCursor(offset=0)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "eyJvIjotMX0", "W10"])
+def test_malformed_cursor(cursor):
+    with pytest.raises(InvalidCursorError):
+        SearchCursor.decode(cursor)
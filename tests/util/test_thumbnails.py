@@ -0,0 +1,20 @@
+import pytest
+from PIL import Image
+
+from app.util.thumbnails import create_thumbnail_file, check_thumbnail_format
+
+
+@pytest.mark.parametrize("fmt, pil_format", [("webp", "WEBP"), ("jpeg", "JPEG")])
+def test_thumbnail_fits_in_size(tmp_path, fmt, pil_format):
+    source = tmp_path / "source.jpg"
+    Image.new("RGB", (2000, 1000), (200, 100, 50)).save(source, "JPEG")
+    target = tmp_path / "thumbnail"
+    create_thumbnail_file(source, target, 256, fmt, 80)
+    with Image.open(target) as thumbnail:
+        assert thumbnail.format == pil_format
+        assert thumbnail.size == (256, 128)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        check_thumbnail_format("bmp")